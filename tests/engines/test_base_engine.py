@@ -139,6 +139,29 @@ class BaseEngineTestCase(TestCase):
         mime = self.engine.get_mimetype(buffer)
         expect(mime).to_equal('image/tiff')
 
+    def test_can_get_dimensions_from_headers(self):
+        expected = {
+            'image.jpg': (300, 400),
+            'image.webp': (300, 400),
+            '940x2.png': (940, 2),
+            'animated.gif': (100, 100),
+        }
+        for name, dimensions in expected.items():
+            with open(join(STORAGE_PATH, name), 'rb') as im:
+                buffer = im.read()
+            expect(tuple(self.engine.get_dimensions(buffer))).to_equal(dimensions)
+
+    def test_can_get_jpeg_dimensions_from_partial_buffer(self):
+        with open(join(STORAGE_PATH, 'image.jpg'), 'rb') as im:
+            buffer = im.read()
+        expect(self.engine.get_dimensions(buffer[:1024])).to_equal((300, 400))
+        expect(self.engine.get_dimensions(buffer[:16])).to_be_null()
+
+    def test_cant_get_dimensions_of_unknown_format(self):
+        with open(join(STORAGE_PATH, 'gradient_8bit.tif'), 'rb') as im:
+            buffer = im.read()
+        expect(self.engine.get_dimensions(buffer)).to_be_null()
+
     def test_can_identify_svg_with_xml_namespace_other_than_w3(self):
         buffer = """<svg width="10px" height="20px" viewBox="0 0 10 20"
                     xmlns="http://ns.foo.com/FooSVGViewerExtensions/3.0/">
@@ -18,8 +18,9 @@ from PIL import Image
 from preggy import expect
 
 from thumbor.config import Config
-from thumbor.context import Context
+from thumbor.context import Context, RequestParameters
 from thumbor.engines.pil import Engine
+from thumbor.point import FocalPoint
 
 try:
     from pyexiv2 import ImageMetadata  # noqa
@@ -196,3 +197,127 @@ class PilEngineTestCase(TestCase):
 
         # Image has total of 200x150=30000 pixels. Most of them should be transparent
         expect(transparent_pixels_count).to_be_greater_than(19000)
+
+    def get_draft_engine(self, **request_params):
+        self.context.config.PILLOW_JPEG_DRAFT_MODE = True
+        engine = Engine(self.context)
+        self.context.request = RequestParameters(**request_params)
+        self.context.request.engine = engine
+        return engine
+
+    def test_should_draft_jpeg_when_target_size_is_known(self):
+        engine = self.get_draft_engine(width=75, height=100)
+
+        with open(join(STORAGE_PATH, 'image.jpg'), 'r') as im:
+            engine.load(im.read(), '.jpg')
+
+        expect(engine.size).to_equal((75, 100))
+        expect(engine.source_width).to_equal(75)
+        expect(engine.source_height).to_equal(100)
+
+    def test_should_draft_jpeg_and_translate_crop_and_focal_points(self):
+        engine = self.get_draft_engine(width=50, height=50, crop_left=0, crop_top=0, crop_right=200, crop_bottom=200)
+        self.context.request.focal_points.append(FocalPoint(100, 80, width=40, height=20))
+
+        with open(join(STORAGE_PATH, 'image.jpg'), 'r') as im:
+            engine.load(im.read(), '.jpg')
+
+        expect(engine.size).to_equal((75, 100))
+        expect(self.context.request.crop).to_equal({'left': 0, 'top': 0, 'right': 50, 'bottom': 50})
+
+        point = self.context.request.focal_points[0]
+        expect((point.x, point.y, point.width, point.height)).to_equal((25, 20, 10, 5))
+
+    def test_should_not_draft_jpeg_smaller_than_target(self):
+        engine = self.get_draft_engine(width=200, height=300)
+
+        with open(join(STORAGE_PATH, 'image.jpg'), 'r') as im:
+            engine.load(im.read(), '.jpg')
+
+        expect(engine.size).to_equal((300, 400))
+
+    def test_should_not_draft_other_engines(self):
+        self.get_draft_engine(width=75, height=100)
+        engine = Engine(self.context)
+
+        with open(join(STORAGE_PATH, 'image.jpg'), 'r') as im:
+            engine.load(im.read(), '.jpg')
+
+        expect(engine.size).to_equal((300, 400))
+
+    def get_lazy_engine(self):
+        engine = Engine(self.context)
+        image = Image.new('RGB', (40, 30))
+        image.putdata([(x * 6, y * 8, (x + y) % 256) for y in range(30) for x in range(40)])
+        engine.image = image
+        return engine, image
+
+    def test_should_defer_geometric_operations(self):
+        engine, image = self.get_lazy_engine()
+
+        engine.crop(5, 5, 35, 25)
+        engine.rotate(90)
+        engine.flip_horizontally()
+
+        expect(engine.has_pending_operations()).to_be_true()
+        expect(engine.size).to_equal((20, 30))
+
+        expected = image.crop((5, 5, 35, 25)).transpose(Image.ROTATE_90).transpose(Image.FLIP_LEFT_RIGHT)
+        expect(list(engine.image.getdata())).to_equal(list(expected.getdata()))
+        expect(engine.has_pending_operations()).to_be_false()
+
+    def test_should_translate_crop_after_flips_and_rotations(self):
+        engine, image = self.get_lazy_engine()
+
+        engine.flip_vertically()
+        engine.rotate(270)
+        engine.crop(2, 3, 12, 23)
+
+        expected = image.transpose(Image.FLIP_TOP_BOTTOM).transpose(Image.ROTATE_270).crop((2, 3, 12, 23))
+        expect(engine.size).to_equal(expected.size)
+        expect(list(engine.image.getdata())).to_equal(list(expected.getdata()))
+
+    def test_should_fuse_crop_and_resize(self):
+        engine, image = self.get_lazy_engine()
+
+        engine.resize(20, 15)
+        engine.crop(5, 0, 15, 15)
+        engine.flip_horizontally()
+
+        expect(engine.size).to_equal((10, 15))
+        expect(engine._box).to_equal((10.0, 0.0, 30.0, 30.0))
+
+        expected = image.resize((10, 15), engine.get_resize_filter(), box=(10, 0, 30, 30))
+        expected = expected.transpose(Image.FLIP_LEFT_RIGHT)
+        expect(list(engine.image.getdata())).to_equal(list(expected.getdata()))
+
+    def test_should_reduce_before_resampling_large_downscales(self):
+        self.context.config.PILLOW_RESIZE_REDUCING_GAP = 3.0
+        engine, image = self.get_lazy_engine()
+
+        reduced, box = engine._reduce_image(image, (4, 4), (4.5, 3, 36, 27))
+
+        expect(reduced.size).to_equal((16, 12))
+        expect(box).to_equal((0.25, 0.0, 16.0, 12.0))
+
+    def test_should_not_reduce_within_reducing_gap(self):
+        self.context.config.PILLOW_RESIZE_REDUCING_GAP = 3.0
+        engine, image = self.get_lazy_engine()
+
+        reduced, box = engine._reduce_image(image, (20, 15))
+        expect(reduced).to_equal(image)
+        expect(box).to_be_null()
+
+    def test_should_not_reduce_by_default(self):
+        engine, image = self.get_lazy_engine()
+
+        reduced, box = engine._reduce_image(image, (2, 2))
+        expect(reduced).to_equal(image)
+        expect(box).to_be_null()
+
+    def test_should_resize_with_reducing_gap(self):
+        self.context.config.PILLOW_RESIZE_REDUCING_GAP = 3.0
+        engine, image = self.get_lazy_engine()
+
+        engine.resize(4, 3)
+        expect(engine.image.size).to_equal((4, 3))
@@ -138,6 +138,16 @@ class PreLoadFilter(BaseFilter):
         return value
 
 
+class InitializedFilter(BaseFilter):
+    def __init__(self, params, context=None, **kwargs):
+        super(InitializedFilter, self).__init__(params, context, **kwargs)
+        self.initialized = True
+
+    @filter_method(BaseFilter.String)
+    def my_initialized_filter(self, value):
+        return value
+
+
 class BaseFilterTestCase(PythonTestCase):
     def setUp(self, *args, **kwargs):
         super(BaseFilterTestCase, self).setUp(*args, **kwargs)
@@ -194,6 +204,33 @@ class RunnerWithParametersFilterTestCase(BaseFilterTestCase):
         expect(len(post_instances)).to_equal(0)
         expect(len(pre_instances)).to_equal(0)
 
+    def test_plan_can_be_reused(self):
+        plan = self.factory.compile('my_string_filter(aaaa):unknown(1):my_pre_load_filter(ccc)')
+        expect(plan).to_equal([
+            (StringFilter, 'my_string_filter(aaaa)', ['aaaa']),
+            (PreLoadFilter, 'my_pre_load_filter(ccc)', ['ccc']),
+        ])
+
+        runner = self.factory.create_instances_from_plan(self.context, plan)
+        other_runner = self.factory.create_instances_from_plan(self.context, plan)
+        post_instances = runner.filter_instances[thumbor.filters.PHASE_POST_TRANSFORM]
+        other_post_instances = other_runner.filter_instances[thumbor.filters.PHASE_POST_TRANSFORM]
+        expect(post_instances[0].params).to_equal(['aaaa'])
+        expect(post_instances[0].context).to_equal(self.context)
+        expect(post_instances[0]).not_to_equal(other_post_instances[0])
+
+    def test_plan_reuses_parsed_params(self):
+        factory = FiltersFactory([InitializedFilter])
+        plan = factory.compile('my_initialized_filter(aaaa)')
+
+        with mock.patch.object(InitializedFilter, 'parse_params') as parse_params:
+            runner = factory.create_instances_from_plan(self.context, plan)
+
+        expect(parse_params.called).to_be_false()
+        instance = runner.filter_instances[thumbor.filters.PHASE_POST_TRANSFORM][0]
+        expect(instance.params).to_equal(['aaaa'])
+        expect(instance.initialized).to_be_true()
+
     def test_invalid_filter(self):
         InvalidFilter.pre_compile()
         expect(hasattr(InvalidFilter, 'runnable_method')).to_be_false()
@@ -0,0 +1,16 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from thumbor.detectors import BaseDetector
+
+
+class Detector(BaseDetector):
+    def detect(self, callback):
+        callback([{'x': 10, 'y': 10, 'height': 1, 'width': 1, 'z': 1, 'origin': 'Detection'}])
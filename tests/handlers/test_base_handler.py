@@ -10,15 +10,18 @@
 
 import tempfile
 import shutil
-from os.path import abspath, join, dirname
+from os.path import abspath, join, dirname, exists
 import os
 from datetime import datetime, timedelta
 import pytz
 import subprocess
+import threading
+import time
 from json import loads
 
 import tornado.web
-from tornado.concurrent import return_future
+from tornado.concurrent import Future, return_future
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
 from preggy import expect
 from mock import Mock, patch
 from six.moves.urllib.parse import quote
@@ -319,6 +322,511 @@ class ImagingOperationsTestCase(BaseImagingTestCase):
         expect(response.body).to_be_png()
 
 
+class ImageOperationsWithEngineThreadPoolTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.ENGINE_THREADPOOL_SIZE = 2
+        cfg.MAX_WIDTH = 300
+        cfg.MAX_HEIGHT = 300
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def test_can_get_image_loaded_in_thread_pool(self):
+        response = self.fetch('/unsafe/image.jpg')
+        expect(response.code).to_equal(200)
+        expect(response.body).to_be_jpeg()
+
+        engine = Engine(self.context)
+        engine.load(response.body, '.jpg')
+        expect(engine.size[0]).to_be_lesser_or_equal_to(300)
+        expect(engine.size[1]).to_be_lesser_or_equal_to(300)
+
+    def test_getting_invalid_image_in_thread_pool_returns_bad_request(self):
+        response = self.fetch('/unsafe/image_invalid.jpg')
+        expect(response.code).to_equal(400)
+
+
+class ImageOperationsWithBoundedEngineQueueTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.ENGINE_THREADPOOL_SIZE = 1
+        cfg.ENGINE_QUEUE_MAX_SIZE = 1
+        cfg.ENGINE_QUEUE_RETRY_AFTER = 5
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def test_rejects_request_when_engine_queue_is_full(self):
+        release = threading.Event()
+        thread_pool = self.context.thread_pool
+        thread_pool.queue(release.wait, lambda future: None)
+        thread_pool.queue(release.wait, lambda future: None)
+
+        try:
+            response = self.fetch('/unsafe/200x200/image.jpg')
+        finally:
+            release.set()
+
+        expect(response.code).to_equal(503)
+        expect(response.headers['Retry-After']).to_equal('5')
+
+    def test_admits_request_when_engine_queue_is_not_full(self):
+        response = self.fetch('/unsafe/200x200/image.jpg')
+        expect(response.code).to_equal(200)
+
+    def test_estimates_cost_from_image_headers_and_request(self):
+        with open(join(self.loader_path, 'image.jpg'), 'rb') as im:
+            buffer = im.read()
+
+        handler = BaseHandler.__new__(BaseHandler)
+        handler.context = self.context
+        self.context.request = RequestParameters(width=150, height=0, filters='blur(2):quality(80)')
+        handler.filters_runner = self.context.filters_factory.create_instances(self.context, 'blur(2):quality(80)')
+
+        # 300x400 source, 150x200 target through two filters
+        expect(handler.estimate_cost(buffer)).to_equal(0.18)
+
+        handler.filters_runner = self.context.filters_factory.create_instances(self.context, '')
+        self.context.request = RequestParameters()
+        expect(handler.estimate_cost(buffer)).to_equal(0.12)
+
+
+class ImageOperationsWithRevalidationTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.file_storage"
+        cfg.FILE_STORAGE_ROOT_PATH = join(self.root_path, 'revalidation')
+        cfg.STORAGE_EXPIRATION_SECONDS = 60
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def store_expired_image(self, url):
+        storage = FileStorage(self.context)
+        with open(join(self.loader_path, 'image.jpg'), 'rb') as im:
+            storage.put(url, im.read())
+        storage.put_validators(url, {'ETag': '"image"'})
+
+        expired = time.time() - 120
+        os.utime(storage.path_on_filesystem(url), (expired, expired))
+        return storage
+
+    @patch('thumbor.metrics.logger_metrics.Metrics.incr')
+    @patch('thumbor.loaders.file_loader.load')
+    def test_reuses_expired_image_not_modified_upstream(self, load_mock, incr_mock):
+        storage = self.store_expired_image('image.jpg')
+        validators = []
+
+        def load(context, url):
+            validators.append(context.request.source_validators)
+            future = Future()
+            future.set_result(LoaderResult(metadata={'NotModified': True}))
+            return future
+        load_mock.side_effect = load
+
+        response = self.fetch('/unsafe/200x200/image.jpg')
+
+        expect(response.code).to_equal(200)
+        expect(validators).to_equal([{'ETag': '"image"'}])
+        expect(time.time() - os.path.getmtime(storage.path_on_filesystem('image.jpg'))).to_be_lesser_than(60)
+        incr_mock.assert_any_call('storage.revalidated')
+
+    @patch('thumbor.loaders.file_loader.load')
+    def test_loads_image_again_when_stored_copy_went_away(self, load_mock):
+        storage = self.store_expired_image('gone.jpg')
+
+        def load(context, url):
+            future = Future()
+            if context.request.source_validators:
+                # The stored copy is deleted while the origin is asked
+                os.remove(storage.path_on_filesystem('gone.jpg'))
+                future.set_result(LoaderResult(metadata={'NotModified': True}))
+            else:
+                with open(join(self.loader_path, 'image.jpg'), 'rb') as im:
+                    future.set_result(LoaderResult(buffer=im.read()))
+            return future
+        load_mock.side_effect = load
+
+        response = self.fetch('/unsafe/200x200/gone.jpg')
+
+        expect(response.code).to_equal(200)
+        expect(load_mock.call_count).to_equal(2)
+
+    def test_stores_validators_of_loaded_image(self):
+        def load(context, url, callback):
+            callback(LoaderResult(buffer=open(join(self.loader_path, '20x20.jpg'), 'rb').read(), metadata={'ETag': '"new"'}))
+
+        with patch('thumbor.loaders.file_loader.load', return_future(load)):
+            response = self.fetch('/unsafe/10x10/20x20.jpg')
+
+        expect(response.code).to_equal(200)
+        storage = FileStorage(self.context)
+        expect(storage.get_validators('20x20.jpg').result()).to_equal({'ETag': '"new"'})
+
+
+class ImageOperationsWithNegativeCacheTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.NEGATIVE_CACHE_NOT_FOUND_SECONDS = 60
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def tearDown(self):
+        self.context.negative_cache.clear()
+        super(ImageOperationsWithNegativeCacheTestCase, self).tearDown()
+
+    @patch('thumbor.metrics.logger_metrics.Metrics.incr')
+    @patch('thumbor.loaders.file_loader.load')
+    def test_does_not_load_image_not_found_again(self, load_mock, incr_mock):
+        def load(context, url):
+            future = Future()
+            future.set_result(LoaderResult(successful=False, error=LoaderResult.ERROR_NOT_FOUND))
+            return future
+        load_mock.side_effect = load
+
+        response = self.fetch('/unsafe/200x200/missing.jpg')
+        expect(response.code).to_equal(404)
+        incr_mock.assert_any_call('loader.negative_cache.miss')
+
+        response = self.fetch('/unsafe/100x100/missing.jpg')
+        expect(response.code).to_equal(404)
+        expect(load_mock.call_count).to_equal(1)
+        incr_mock.assert_any_call('loader.negative_cache.hit')
+
+    @patch('thumbor.loaders.file_loader.load')
+    def test_does_not_cache_other_errors(self, load_mock):
+        def load(context, url):
+            future = Future()
+            future.set_result(LoaderResult(successful=False, error=LoaderResult.ERROR_UPSTREAM))
+            return future
+        load_mock.side_effect = load
+
+        self.fetch('/unsafe/200x200/broken.jpg')
+        self.fetch('/unsafe/200x200/broken.jpg')
+        expect(load_mock.call_count).to_equal(2)
+
+    @patch.object(NoStorage, 'get_loader_error')
+    @patch('thumbor.loaders.file_loader.load')
+    def test_keeps_errors_found_in_storage_in_memory(self, load_mock, get_loader_error_mock):
+        self.context.config.NEGATIVE_CACHE_USE_STORAGE = True
+
+        def get_loader_error(url):
+            future = Future()
+            future.set_result((LoaderResult.ERROR_NOT_FOUND, time.time() + 30))
+            return future
+        get_loader_error_mock.side_effect = get_loader_error
+
+        response = self.fetch('/unsafe/200x200/missing.jpg')
+        expect(response.code).to_equal(404)
+        expect(self.context.negative_cache).to_length(1)
+
+        response = self.fetch('/unsafe/100x100/missing.jpg')
+        expect(response.code).to_equal(404)
+        expect(get_loader_error_mock.call_count).to_equal(1)
+        expect(load_mock.called).to_be_false()
+
+    @patch('thumbor.loaders.file_loader.load')
+    def test_answers_busy_loader_with_service_unavailable(self, load_mock):
+        self.context.config.NEGATIVE_CACHE_TIMEOUT_SECONDS = 60
+
+        def load(context, url):
+            future = Future()
+            future.set_result(LoaderResult(successful=False, error=LoaderResult.ERROR_BUSY, metadata={'RetryAfter': 12}))
+            return future
+        load_mock.side_effect = load
+
+        response = self.fetch('/unsafe/200x200/busy.jpg')
+        expect(response.code).to_equal(503)
+        expect(response.headers['Retry-After']).to_equal('12')
+
+        self.fetch('/unsafe/200x200/busy.jpg')
+        expect(load_mock.call_count).to_equal(2)
+
+
+class ImageOperationsWithParsedUrlCacheTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.PARSED_URL_CACHE_SIZE = 10
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def tearDown(self):
+        self.context.url_cache.clear()
+        super(ImageOperationsWithParsedUrlCacheTestCase, self).tearDown()
+
+    @patch('thumbor.metrics.logger_metrics.Metrics.incr')
+    def test_does_not_check_signed_url_again(self, incr_mock):
+        signature = self.context.modules.url_signer.signature
+        with patch.object(self.context.modules.url_signer, 'signature', autospec=True) as signature_mock:
+            signature_mock.side_effect = signature
+            response = self.fetch('/_wIUeSaeHw8dricKG2MGhqu5thk=/smart/image.jpg')
+            expect(response.code).to_equal(200)
+
+            response = self.fetch('/_wIUeSaeHw8dricKG2MGhqu5thk=/smart/image.jpg')
+            expect(response.code).to_equal(200)
+            expect(response.body).to_be_similar_to(default_image())
+
+        expect(signature_mock.call_count).to_equal(1)
+        incr_mock.assert_any_call('url_cache.miss')
+        incr_mock.assert_any_call('url_cache.hit')
+
+    def test_checks_urls_again_when_security_key_changes(self):
+        response = self.fetch('/_wIUeSaeHw8dricKG2MGhqu5thk=/smart/image.jpg')
+        expect(response.code).to_equal(200)
+
+        self.context.server.security_key = 'OTHER-SEC'
+        try:
+            response = self.fetch('/_wIUeSaeHw8dricKG2MGhqu5thk=/smart/image.jpg')
+            expect(response.code).to_equal(400)
+        finally:
+            self.context.server.security_key = 'ACME-SEC'
+
+    def test_does_not_cache_invalid_urls(self):
+        response = self.fetch('/invalid-hash-invalid-hash-xxx=/smart/image.jpg')
+        expect(response.code).to_equal(400)
+        expect(self.context.url_cache).to_length(0)
+
+
+class ImageOperationsWithDeadlineTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.ENGINE_THREADPOOL_SIZE = 1
+        cfg.REQUEST_DEADLINE = 10
+        cfg.REQUEST_DEADLINE_HEADER = 'X-Request-Timeout'
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    @patch('thumbor.metrics.logger_metrics.Metrics.incr')
+    def test_stops_request_when_deadline_passes(self, incr_mock):
+        self.context.thread_pool.queue(lambda: time.sleep(0.2), lambda future: None)
+
+        response = self.fetch('/unsafe/200x200/image.jpg', headers={'X-Request-Timeout': '0.05'})
+
+        expect(response.code).to_equal(504)
+        incr_mock.assert_any_call('request.cancelled.load')
+
+    def test_finishes_request_within_deadline(self):
+        response = self.fetch('/unsafe/200x200/image.jpg', headers={'X-Request-Timeout': '5'})
+        expect(response.code).to_equal(200)
+
+    def test_deadline_is_the_lowest_of_config_and_header(self):
+        handler = BaseHandler.__new__(BaseHandler)
+        handler.context = self.context
+
+        handler.request = HTTPServerRequest(method='GET', uri='/', headers=HTTPHeaders({'X-Request-Timeout': '2'}))
+        expect(handler.get_deadline() - time.time()).to_be_lesser_or_equal_to(2)
+
+        handler.request = HTTPServerRequest(method='GET', uri='/', headers=HTTPHeaders({'X-Request-Timeout': '60'}))
+        expect(handler.get_deadline() - time.time()).to_be_greater_than(9)
+        expect(handler.get_deadline() - time.time()).to_be_lesser_or_equal_to(10)
+
+        handler.request = HTTPServerRequest(method='GET', uri='/', headers=HTTPHeaders({'X-Request-Timeout': 'soon'}))
+        expect(handler.get_deadline() - time.time()).to_be_greater_than(9)
+
+    def test_connection_close_cancels_request(self):
+        handler = BaseHandler.__new__(BaseHandler)
+        handler.context = self.context
+        handler.request = HTTPServerRequest(method='GET', uri='/')
+        self.context.request = RequestParameters()
+
+        expect(self.context.request.is_cancelled()).to_be_false()
+        handler.on_connection_close()
+        expect(self.context.request.is_cancelled()).to_be_true()
+
+
+class ImageOperationsWithResultCoalescingTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.ENGINE_THREADPOOL_SIZE = 2
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def fetch_concurrently(self, url, count):
+        responses = []
+
+        def on_response(response):
+            responses.append(response)
+            if len(responses) == count:
+                self.stop()
+
+        for i in range(count):
+            self.http_client.fetch(self.get_url(url), on_response)
+        self.wait()
+
+        return responses
+
+    @patch('thumbor.metrics.logger_metrics.Metrics.incr')
+    def test_identical_requests_share_generated_image(self, incr_mock):
+        responses = self.fetch_concurrently('/unsafe/200x200/filters:max_age(10)/image.jpg', 3)
+
+        for response in responses:
+            expect(response.code).to_equal(200)
+            expect(response.body).to_equal(responses[0].body)
+            expect(response.headers['Cache-Control']).to_equal('max-age=10,public')
+            expect(response.headers['Content-Type']).to_equal('image/jpeg')
+
+        coalesced = [call for call in incr_mock.call_args_list if call[0][0] == 'result.coalesced']
+        expect(coalesced).to_length(2)
+        expect(BaseHandler.result_flights).to_be_empty()
+
+    def test_identical_requests_share_errors(self):
+        responses = self.fetch_concurrently('/unsafe/image_invalid.jpg', 2)
+
+        for response in responses:
+            expect(response.code).to_equal(400)
+        expect(BaseHandler.result_flights).to_be_empty()
+
+    @patch('thumbor.loaders.file_loader.load')
+    def test_identical_requests_share_retry_after(self, load_mock):
+        def load(context, url):
+            # Answers once the other request joined the flight
+            future = Future()
+            result = LoaderResult(successful=False, error=LoaderResult.ERROR_BUSY, metadata={'RetryAfter': 7})
+            self.io_loop.call_later(0.1, future.set_result, result)
+            return future
+        load_mock.side_effect = load
+
+        responses = self.fetch_concurrently('/unsafe/busy.jpg', 2)
+
+        for response in responses:
+            expect(response.code).to_equal(503)
+            expect(response.headers['Retry-After']).to_equal('7')
+        expect(load_mock.call_count).to_equal(1)
+
+
+class ImageOperationsWithEngineProcessPoolTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+        cfg.ENGINE_EXECUTOR = 'process'
+        cfg.ENGINE_PROCESSPOOL_SIZE = 1
+        cfg.MAX_WIDTH = 300
+        cfg.MAX_HEIGHT = 300
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def tearDown(self):
+        self.context.process_pool.cleanup()
+        super(ImageOperationsWithEngineProcessPoolTestCase, self).tearDown()
+
+    def test_can_get_image_processed_in_process_pool(self):
+        response = self.fetch('/unsafe/fit-in/200x200/filters:max_age(10)/image.jpg')
+        expect(response.code).to_equal(200)
+        expect(response.body).to_be_jpeg()
+        expect(response.headers['Cache-Control']).to_equal('max-age=10,public')
+
+        engine = Engine(self.context)
+        engine.load(response.body, '.jpg')
+        expect(engine.size[0]).to_be_lesser_or_equal_to(200)
+        expect(engine.size[1]).to_be_lesser_or_equal_to(200)
+
+    def test_can_get_image_metadata_in_process_pool(self):
+        response = self.fetch('/unsafe/meta/100x100/image.jpg')
+        expect(response.code).to_equal(200)
+        expect(loads(response.body)['thumbor']['target']).to_equal({'width': 100, 'height': 100})
+
+    def test_getting_invalid_image_in_process_pool_returns_bad_request(self):
+        response = self.fetch('/unsafe/image_invalid.jpg')
+        expect(response.code).to_equal(400)
+
+
+class ImageOperationsWithEngineProcessPoolAndFileIOThreadPoolTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.file_storage"
+        cfg.FILE_STORAGE_ROOT_PATH = self.root_path
+        cfg.ENGINE_EXECUTOR = 'process'
+        cfg.ENGINE_PROCESSPOOL_SIZE = 1
+        cfg.FILE_IO_THREADPOOL_SIZE = 2
+        cfg.DETECTORS = ['tests.fixtures.focal_point_detector']
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return Context(server, cfg, importer)
+
+    def tearDown(self):
+        self.context.process_pool.cleanup()
+        super(ImageOperationsWithEngineProcessPoolAndFileIOThreadPoolTestCase, self).tearDown()
+
+    def test_can_get_several_images_processed_in_process_pool(self):
+        # Detector data is read from and written to the storage in the worker
+        for image in ('image.jpg', 'cmyk.jpg', 'grayscale.jpg'):
+            response = self.fetch('/unsafe/100x100/smart/%s' % image)
+            expect(response.code).to_equal(200)
+
+    def test_stores_only_sources_loaded_by_worker(self):
+        storage = self.context.modules.storage
+
+        response = self.fetch('/unsafe/100x100/image_invalid.jpg')
+        expect(response.code).to_equal(400)
+        expect(exists(storage.path_on_filesystem('image_invalid.jpg'))).to_be_false()
+
+        response = self.fetch('/unsafe/100x100/20x20.jpg')
+        expect(response.code).to_equal(200)
+        # The source is written in the I/O thread pool
+        for i in range(100):
+            if exists(storage.path_on_filesystem('20x20.jpg')):
+                break
+            time.sleep(0.01)
+        expect(exists(storage.path_on_filesystem('20x20.jpg'))).to_be_true()
+
+
 class ImageOperationsWithoutUnsafeTestCase(BaseImagingTestCase):
     def get_context(self):
         cfg = Config(SECURITY_KEY='ACME-SEC')
@@ -393,6 +901,27 @@ class ImageOperationsWithStoredKeysTestCase(BaseImagingTestCase):
         expect(response.code).to_equal(200)
         expect(response.body).to_be_similar_to(default_image())
 
+    def test_stored_security_key_is_got_with_image(self):
+        storage = self.context.modules.storage
+        self.context.server.security_key = 'MYKEY'
+        storage.put_crypto('image.jpg')
+        self.context.server.security_key = 'MYKEY2'
+
+        paths = []
+        get_all = FileStorage.get_all
+
+        def get_all_spy(storage, path):
+            paths.append(path)
+            return get_all(storage, path)
+
+        try:
+            with patch.object(FileStorage, 'get_all', get_all_spy):
+                response = self.fetch('/nty7gpBIRJ3GWtYDLLw6q1PgqTo=/smart/image.jpg')
+            expect(response.code).to_equal(200)
+            expect(paths).to_equal(['image.jpg'])
+        finally:
+            self.context.server.security_key = 'MYKEY'
+
 
 class ImageOperationsWithAutoWebPTestCase(BaseImagingTestCase):
     def get_context(self):
@@ -733,6 +1262,49 @@ class ImageOperationsWithResultStorageTestCase(BaseImagingTestCase):
         expect(response.body).to_be_similar_to(animated_image())
 
 
+class ImageOperationsWithResultCacheTestCase(BaseImagingTestCase):
+    def get_context(self):
+        cfg = Config(SECURITY_KEY='ACME-SEC')
+        cfg.LOADER = "thumbor.loaders.file_loader"
+        cfg.FILE_LOADER_ROOT_PATH = self.loader_path
+        cfg.STORAGE = "thumbor.storages.no_storage"
+
+        cfg.RESULT_STORAGE = 'thumbor.result_storages.file_storage'
+        cfg.RESULT_STORAGE_FILE_STORAGE_ROOT_PATH = self.root_path
+        cfg.RESULT_STORAGE_STORES_UNSAFE = True
+        cfg.RESULT_STORAGE_MEMORY_CACHE_SIZE = 1024 * 1024
+
+        importer = Importer(cfg)
+        importer.import_modules()
+        server = ServerParameters(8889, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        ctx = Context(server, cfg, importer)
+        ctx.result_cache.clear()
+        return ctx
+
+    @patch('thumbor.metrics.logger_metrics.Metrics.incr')
+    def test_serves_generated_images_from_memory(self, incr_mock):
+        response = self.fetch('/unsafe/200x200/image.jpg')
+        expect(response.code).to_equal(200)
+        incr_mock.assert_any_call('result_cache.miss')
+
+        with patch.object(FileResultStorage, 'get') as get_mock:
+            cached_response = self.fetch('/unsafe/200x200/image.jpg')
+
+        expect(get_mock.called).to_be_false()
+        expect(cached_response.code).to_equal(200)
+        expect(cached_response.body).to_equal(response.body)
+        incr_mock.assert_any_call('result_cache.hit')
+
+    def test_caches_images_read_from_result_storage(self):
+        response = self.fetch('/unsafe/200x200/image.jpg')
+        expect(response.code).to_equal(200)
+
+        self.context.result_cache.clear()
+        expect(self.fetch('/unsafe/200x200/image.jpg').body).to_equal(response.body)
+        expect(self.context.result_cache).to_length(1)
+
+
 class ImageOperationsResultStorageOnlyTestCase(BaseImagingTestCase):
     def get_context(self):
         cfg = Config(SECURITY_KEY='ACME-SEC')
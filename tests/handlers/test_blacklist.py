@@ -13,6 +13,7 @@ from shutil import rmtree
 
 from preggy import expect
 
+from thumbor.blacklist import Blacklist
 from thumbor.config import Config
 from thumbor.context import Context
 from thumbor.importer import Importer
@@ -24,6 +25,7 @@ class BlacklistHandlerTestCase(TestCase):
         file_storage_root_path = '/tmp/thumbor/storage'
         if exists(file_storage_root_path):
             rmtree(file_storage_root_path)
+        Blacklist._instances.clear()
 
         cfg = Config()
         cfg.USE_BLACKLIST = True
@@ -57,3 +59,8 @@ class BlacklistHandlerTestCase(TestCase):
         self.fetch('/blacklist?image.jpg', method='PUT', body='')
         response = self.fetch('/unsafe/image.jpg')
         expect(response.code).to_equal(400)
+
+    def test_can_get_image_whose_url_is_part_of_a_blacklisted_one(self):
+        self.fetch('/blacklist?image.jpg.bak', method='PUT', body='')
+        response = self.fetch('/unsafe/image.jpg')
+        expect(response.code).to_equal(200)
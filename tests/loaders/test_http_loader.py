@@ -14,13 +14,15 @@ from preggy import expect
 import mock
 # from tornado.concurrent import Future
 import tornado.web
+import tornado.gen
+import tornado.httpclient
 from tests.base import PythonTestCase, TestCase
 from tornado.concurrent import Future
 import re
 from six.moves.urllib.parse import quote
 
 import thumbor.loaders.http_loader as loader
-from thumbor.context import Context
+from thumbor.context import Context, RequestParameters
 from thumbor.config import Config
 from thumbor.loaders import LoaderResult
 
@@ -237,6 +239,427 @@ class HttpLoaderTestCase(TestCase):
         future = loader.load(ctx, url)
         expect(isinstance(future, Future)).to_be_true()
 
+    def test_reuses_http_client(self):
+        config = Config()
+        client = loader.get_http_client(config)
+
+        expect(loader.get_http_client(config)).to_equal(client)
+        expect(client).to_be_instance_of(loader.SimpleAsyncHTTPClient)
+
+        config.HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT = True
+        expect(loader.get_http_client(config)).to_be_instance_of(loader.PooledCurlAsyncHTTPClient)
+
+    def test_reuses_connections_with_curl(self):
+        url = self.get_url('/')
+        config = Config()
+        config.HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT = True
+        config.HTTP_LOADER_MAX_CONNECTIONS_PER_HOST = 2
+        config.HTTP_LOADER_CONNECTION_IDLE_TIMEOUT = 30
+        ctx = Context(None, config, None)
+        ctx.metrics = mock.Mock()
+
+        for i in range(2):
+            loader.load(ctx, url, self.stop)
+            result = self.wait()
+            expect(result.successful).to_be_true()
+
+        connections = [
+            call[0][0] for call in ctx.metrics.incr.call_args_list
+            if call[0][0].startswith('original_image.connection.')
+        ]
+        expect(connections).to_equal(['original_image.connection.new', 'original_image.connection.reused'])
+
+    def test_closes_idle_connections_with_curl(self):
+        url = self.get_url('/')
+        config = Config()
+        config.HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT = True
+        config.HTTP_LOADER_CONNECTION_IDLE_TIMEOUT = 1
+        ctx = Context(None, config, None)
+        ctx.metrics = mock.Mock()
+
+        for i in range(2):
+            loader.load(ctx, url, self.stop)
+            result = self.wait()
+            expect(result.successful).to_be_true()
+            time.sleep(2)
+
+        connections = [
+            call[0][0] for call in ctx.metrics.incr.call_args_list
+            if call[0][0].startswith('original_image.connection.')
+        ]
+        expect(connections).to_equal(['original_image.connection.new', 'original_image.connection.new'])
+
+
+class ETagHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('ETag', '"hello"')
+        self.set_header('Last-Modified', 'Wed, 21 Oct 2015 07:28:00 GMT')
+        if self.request.headers.get('If-None-Match') == '"hello"':
+            self.set_status(304)
+            return
+        self.write('Hello')
+
+
+class BigBodyHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write('a' * 4096)
+
+
+class ChunkedBodyHandler(tornado.web.RequestHandler):
+    def get(self):
+        for i in range(4):
+            self.write('a' * 1024)
+            self.flush()
+
+
+class BigImageHandler(tornado.web.RequestHandler):
+    def get(self):
+        with open(IMAGE_FIXTURES['big'], 'rb') as image:
+            self.write(image.read())
+
+
+IMAGE_FIXTURES = {
+    'big': abspath(join(dirname(__file__), '..', 'fixtures', 'images', '9643x10328.jpg')),
+}
+
+
+class HttpLoaderWithMaxBodySizeTestCase(TestCase):
+
+    def get_app(self):
+        application = tornado.web.Application([
+            (r"/", MainHandler),
+            (r"/big", BigBodyHandler),
+            (r"/chunked", ChunkedBodyHandler),
+            (r"/image.jpg", BigImageHandler),
+        ])
+
+        return application
+
+    def load(self, path, curl=False):
+        config = Config()
+        config.HTTP_LOADER_MAX_BODY_SIZE = 2048
+        config.HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT = curl
+        ctx = Context(None, config, None)
+
+        loader.load(ctx, self.get_url(path), self.stop)
+        return self.wait()
+
+    def test_load_within_max_body_size(self):
+        for curl in (False, True):
+            result = self.load('/', curl)
+            expect(result.successful).to_be_true()
+            expect(result.buffer).to_equal('Hello')
+
+    def test_rejects_body_over_content_length(self):
+        for curl in (False, True):
+            result = self.load('/big', curl)
+            expect(result.successful).to_be_false()
+            expect(result.error).to_equal(LoaderResult.ERROR_TOO_LARGE)
+
+    def test_rejects_body_over_max_body_size_without_content_length(self):
+        for curl in (False, True):
+            result = self.load('/chunked', curl)
+            expect(result.successful).to_be_false()
+            expect(result.error).to_equal(LoaderResult.ERROR_TOO_LARGE)
+
+    def test_rejects_image_over_max_pixels(self):
+        config = Config()
+        config.HTTP_LOADER_MAX_BODY_SIZE = 10 * 1024 * 1024
+        ctx = Context(None, config, None)
+
+        loader.load(ctx, self.get_url('/image.jpg'), self.stop)
+        result = self.wait()
+
+        expect(result.successful).to_be_false()
+        expect(result.error).to_equal(LoaderResult.ERROR_TOO_LARGE)
+
+
+class HttpLoaderRevalidationTestCase(TestCase):
+
+    def get_app(self):
+        application = tornado.web.Application([
+            (r"/", ETagHandler),
+        ])
+
+        return application
+
+    def get_context(self, validators=None):
+        ctx = Context(None, Config(), None)
+        ctx.request = RequestParameters()
+        ctx.request.source_validators = validators
+        return ctx
+
+    def test_returns_validators_of_image(self):
+        loader.load(self.get_context(), self.get_url('/'), self.stop)
+        result = self.wait()
+
+        expect(result.successful).to_be_true()
+        expect(result.buffer).to_equal('Hello')
+        expect(result.metadata).to_equal({'ETag': '"hello"', 'LastModified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+    def test_revalidates_image_with_validators(self):
+        loader.load(self.get_context({'ETag': '"hello"'}), self.get_url('/'), self.stop)
+        result = self.wait()
+
+        expect(result.successful).to_be_true()
+        expect(result.buffer).to_be_null()
+        expect(result.metadata['NotModified']).to_be_true()
+
+    def test_loads_changed_image(self):
+        loader.load(self.get_context({'ETag': '"bye"'}), self.get_url('/'), self.stop)
+        result = self.wait()
+
+        expect(result.successful).to_be_true()
+        expect(result.buffer).to_equal('Hello')
+
+
+class StreamedBodyTestCase(PythonTestCase):
+
+    def test_aborts_as_soon_as_image_is_over_max_pixels(self):
+        with open(IMAGE_FIXTURES['big'], 'rb') as image:
+            buffer = image.read()
+
+        body = loader.StreamedBody(len(buffer), max_pixels=75e6)
+        with expect.error_to_happen(loader.SourceTooLargeError):
+            for i in range(0, len(buffer), 4096):
+                body.append(buffer[i:i + 4096])
+
+        expect(body.dimensions).to_equal((9643, 10328))
+        expect(body.size).to_be_lesser_than(64 * 1024)
+
+    def test_collects_body(self):
+        body = loader.StreamedBody(10)
+        body.on_header('Content-Length: 10\r\n')
+        body.append('abc')
+        expect(body.write('def')).to_be_null()
+        expect(body.buffer).to_equal('abcdef')
+        expect(body.error).to_be_null()
+
+    def test_aborts_curl_transfer_over_max_size(self):
+        body = loader.StreamedBody(4)
+        expect(body.write('abc')).to_be_null()
+        expect(body.write('def')).to_equal(0)
+        expect(body.error).not_to_be_null()
+
+    def test_rejects_content_length_over_max_size(self):
+        body = loader.StreamedBody(4)
+        with expect.error_to_happen(loader.SourceTooLargeError):
+            body.on_header('Content-Length: 5\r\n')
+
+
+class ErrorHandler(tornado.web.RequestHandler):
+    requests = 0
+
+    def get(self):
+        ErrorHandler.requests += 1
+        self.set_status(500)
+
+
+class HttpLoaderWithCircuitBreakerTestCase(TestCase):
+
+    def get_app(self):
+        application = tornado.web.Application([
+            (r"/", MainHandler),
+            (r"/error", ErrorHandler),
+        ])
+
+        return application
+
+    def get_context(self):
+        config = Config()
+        config.HTTP_LOADER_CIRCUIT_BREAKER_ERRORS = 2
+        config.HTTP_LOADER_CIRCUIT_BREAKER_RESET_TIMEOUT = 30
+        ctx = Context(None, config, None)
+        ctx.metrics = mock.Mock()
+        return ctx
+
+    def test_fails_fast_after_consecutive_errors(self):
+        url = self.get_url('/error')
+        ctx = self.get_context()
+        ErrorHandler.requests = 0
+
+        results = []
+        for i in range(3):
+            loader.load(ctx, url, self.stop)
+            results.append(self.wait())
+
+        expect([result.successful for result in results]).to_equal([False, False, False])
+        expect(results[2].error).to_equal(LoaderResult.ERROR_BUSY)
+        expect(results[2].metadata['RetryAfter']).to_equal(30)
+        expect(ErrorHandler.requests).to_equal(2)
+        host = loader.urlparse(url).netloc
+        ctx.metrics.incr.assert_any_call('original_image.circuit.open.' + host)
+        ctx.metrics.incr.assert_any_call('original_image.circuit.rejected.' + host)
+
+        with mock.patch('time.time', return_value=time.time() + 31):
+            loader.load(ctx, self.get_url('/'), self.stop)
+            result = self.wait()
+
+        expect(result.successful).to_be_true()
+        ctx.metrics.incr.assert_any_call('original_image.circuit.half_open.' + host)
+        ctx.metrics.incr.assert_any_call('original_image.circuit.closed.' + host)
+
+
+class FlakyHandler(tornado.web.RequestHandler):
+    requests = 0
+
+    def get(self):
+        FlakyHandler.requests += 1
+        if FlakyHandler.requests == 1:
+            self.set_status(503)
+            return
+        self.write('Hello')
+
+
+class SlowOnceHandler(tornado.web.RequestHandler):
+    requests = 0
+
+    @tornado.gen.coroutine
+    def get(self):
+        SlowOnceHandler.requests += 1
+        if SlowOnceHandler.requests == 1:
+            yield tornado.gen.sleep(1)
+            self.write('Slow')
+            return
+        self.write('Fast')
+
+
+class HttpLoaderWithRetriesTestCase(TestCase):
+
+    def get_app(self):
+        application = tornado.web.Application([
+            (r"/flaky", FlakyHandler),
+            (r"/slow", SlowOnceHandler),
+        ])
+
+        return application
+
+    def test_retries_after_server_error(self):
+        FlakyHandler.requests = 0
+        config = Config()
+        config.HTTP_LOADER_MAX_RETRIES = 1
+        config.HTTP_LOADER_RETRY_BACKOFF = 0.01
+        ctx = Context(None, config, None)
+        ctx.metrics = mock.Mock()
+
+        loader.load(ctx, self.get_url('/flaky'), self.stop)
+        result = self.wait()
+
+        expect(result.successful).to_be_true()
+        expect(result.buffer).to_equal('Hello')
+        expect(FlakyHandler.requests).to_equal(2)
+        ctx.metrics.incr.assert_any_call('original_image.retried.' + loader.urlparse(self.get_url('/')).netloc)
+
+    def test_does_not_retry_without_max_retries(self):
+        FlakyHandler.requests = 0
+        ctx = Context(None, Config(), None)
+
+        loader.load(ctx, self.get_url('/flaky'), self.stop)
+        result = self.wait()
+
+        expect(result.successful).to_be_false()
+        expect(FlakyHandler.requests).to_equal(1)
+
+    def test_hedges_slow_requests(self):
+        SlowOnceHandler.requests = 0
+        config = Config()
+        config.HTTP_LOADER_HEDGE_PERCENTILE = 90
+        config.HTTP_LOADER_HEDGE_MIN_DELAY = 0.05
+        ctx = Context(None, config, None)
+        ctx.metrics = mock.Mock()
+
+        host = loader.urlparse(self.get_url('/')).netloc
+        for i in range(loader.HEDGE_MIN_SAMPLES):
+            loader.record_latency(host, 0.01)
+
+        loader.load(ctx, self.get_url('/slow'), self.stop)
+        result = self.wait()
+
+        expect(result.buffer).to_equal('Fast')
+        expect(SlowOnceHandler.requests).to_equal(2)
+        ctx.metrics.incr.assert_any_call('original_image.hedged.' + host)
+
+
+class HedgeDelayTestCase(PythonTestCase):
+
+    def test_uses_percentile_of_latencies(self):
+        config = Config(HTTP_LOADER_HEDGE_PERCENTILE=90, HTTP_LOADER_HEDGE_MIN_DELAY=0.01)
+        expect(loader.get_hedge_delay(config, 'hedge.host')).to_be_null()
+
+        for i in range(1, 21):
+            loader.record_latency('hedge.host', i / 10.0)
+
+        expect(loader.get_hedge_delay(config, 'hedge.host')).to_equal(1.9)
+        expect(loader.get_hedge_delay(Config(), 'hedge.host')).to_be_null()
+
+    def test_does_not_retry_timeouts(self):
+        timeout = ResponseMock(error=tornado.httpclient.HTTPError(599, 'Timeout'), code=599)
+        reset = ResponseMock(error=IOError('Connection reset by peer'), code=599)
+
+        expect(loader.is_retryable(timeout)).to_be_false()
+        expect(loader.is_retryable(reset)).to_be_true()
+        expect(loader.is_retryable(ResponseMock(code=502))).to_be_true()
+        expect(loader.is_retryable(ResponseMock(code=404))).to_be_false()
+
+
+class OriginTestCase(PythonTestCase):
+
+    def setUp(self):
+        self.metrics = mock.Mock()
+
+    def test_queues_fetches_over_max_fetches(self):
+        origin = loader.Origin('some.host', max_fetches=1)
+        fetches = []
+
+        origin.run(lambda: fetches.append(1), None)
+        origin.run(lambda: fetches.append(2), None)
+        expect(fetches).to_equal([1])
+
+        origin.release()
+        expect(fetches).to_equal([1, 2])
+        expect(origin.active).to_equal(1)
+
+        origin.release()
+        expect(origin.idle).to_be_true()
+
+    def test_fails_queued_fetches_when_circuit_opens(self):
+        origin = loader.Origin('some.host', max_fetches=1, max_errors=1, reset_timeout=30)
+        fetches = []
+        rejected = []
+
+        origin.run(lambda: fetches.append(1), None)
+        origin.run(lambda: fetches.append(2), None, on_rejected=lambda: rejected.append(2))
+        origin.run(lambda: fetches.append(3), None, on_rejected=lambda: rejected.append(3))
+
+        origin.record(LoaderResult.ERROR_TIMEOUT, self.metrics)
+        origin.release()
+
+        expect(fetches).to_equal([1])
+        expect(rejected).to_equal([2, 3])
+        expect(origin.active).to_equal(0)
+        expect(origin.queue).to_be_empty()
+
+    def test_opens_circuit_again_when_probe_fails(self):
+        origin = loader.Origin('some.host', max_errors=1, reset_timeout=30)
+        origin.record(LoaderResult.ERROR_TIMEOUT, self.metrics)
+        expect(origin.state).to_equal(loader.Origin.OPEN)
+        expect(origin.allow(self.metrics)).to_be_false()
+
+        with mock.patch('time.time', return_value=time.time() + 31):
+            expect(origin.allow(self.metrics)).to_be_true()
+            expect(origin.allow(self.metrics)).to_be_false()
+            origin.record(LoaderResult.ERROR_TIMEOUT, self.metrics)
+
+        expect(origin.state).to_equal(loader.Origin.OPEN)
+        expect(origin.last_error).to_equal(LoaderResult.ERROR_TIMEOUT)
+
+    def test_counts_consecutive_errors_only(self):
+        origin = loader.Origin('some.host', max_errors=2)
+        origin.record(LoaderResult.ERROR_UPSTREAM, self.metrics)
+        origin.record(None, self.metrics)
+        origin.record(LoaderResult.ERROR_UPSTREAM, self.metrics)
+        expect(origin.state).to_equal(loader.Origin.CLOSED)
+
 
 class HttpLoaderWithHeadersForwardingTestCase(TestCase):
 
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import tornado.testing
+from preggy import expect
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+
+from thumbor.config import Config
+from thumbor.context import Context, RequestParameters
+from thumbor.result_storages import ResultStorageResult
+from thumbor.result_storages.redis_storage import RedisClient, RedisError, Storage as RedisStorage
+
+from tests.base import TestCase
+
+
+class FakeRedis(TCPServer):
+    '''
+    Speaks the few commands of the redis protocol used by the result storage.
+    '''
+
+    def __init__(self, password=None):
+        super(FakeRedis, self).__init__()
+        self.password = password
+        self.hashes = {}
+        self.ttls = {}
+        self.commands = []
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        authenticated = self.password is None
+        queued = None
+        try:
+            while True:
+                line = yield stream.read_until(b'\r\n')
+                args = []
+                for i in range(int(line[1:])):
+                    size = yield stream.read_until(b'\r\n')
+                    data = yield stream.read_bytes(int(size[1:]) + 2)
+                    args.append(data[:-2])
+                self.commands.append(args[0])
+
+                if args[0] == b'AUTH':
+                    authenticated = args[1] == self.password
+                    reply = b'+OK\r\n' if authenticated else b'-ERR invalid password\r\n'
+                elif not authenticated:
+                    reply = b'-NOAUTH Authentication required.\r\n'
+                elif args[0] == b'MULTI':
+                    queued = []
+                    reply = b'+OK\r\n'
+                elif args[0] == b'EXEC':
+                    replies, queued = [self.run(command) for command in queued], None
+                    reply = b'*%d\r\n' % len(replies) + b''.join(replies)
+                elif queued is not None:
+                    queued.append(args)
+                    reply = b'+QUEUED\r\n'
+                else:
+                    reply = self.run(args)
+                yield stream.write(reply)
+        except StreamClosedError:
+            pass
+
+    def run(self, args):
+        command, key = args[0], args[1]
+        if command == b'DEL':
+            self.ttls.pop(key, None)
+            return b':%d\r\n' % (self.hashes.pop(key, None) is not None)
+        if command == b'HMSET':
+            self.hashes.setdefault(key, {}).update(zip(args[2::2], args[3::2]))
+            return b'+OK\r\n'
+        if command == b'EXPIRE':
+            self.ttls[key] = int(args[2])
+            return b':1\r\n'
+        if command == b'HGETALL':
+            fields = [value for item in self.hashes.get(key, {}).items() for value in item]
+            return b'*%d\r\n' % len(fields) + b''.join(b'$%d\r\n%s\r\n' % (len(value), value) for value in fields)
+        if command == b'TTL':
+            if key not in self.hashes:
+                return b':-2\r\n'
+            return b':%d\r\n' % self.ttls.get(key, -1)
+        return b'-ERR unknown command\r\n'
+
+
+class RedisStorageTestCase(TestCase):
+    def get_config(self):
+        self.redis = FakeRedis(password='hey_you')
+        sock, port = tornado.testing.bind_unused_port()
+        self.redis.add_sockets([sock])
+
+        return Config(
+            REDIS_RESULT_STORAGE_SERVER_HOST='127.0.0.1',
+            REDIS_RESULT_STORAGE_SERVER_PORT=port,
+            REDIS_RESULT_STORAGE_SERVER_PASSWORD='hey_you',
+            RESULT_STORAGE_EXPIRATION_SECONDS=60,
+        )
+
+    def get_context(self):
+        context = Context(None, self.get_config(), None)
+        context.request = RequestParameters(url='/unsafe/image.jpg')
+        return context
+
+    def tearDown(self):
+        self.redis.stop()
+        super(RedisStorageTestCase, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_can_store_and_get_image(self):
+        storage = RedisStorage(self.context)
+        yield storage.put(b'\xff\xd8abc')
+
+        self.redis.commands = []
+        result = yield storage.get()
+
+        expect(result).to_be_instance_of(ResultStorageResult)
+        expect(result.buffer).to_equal(b'\xff\xd8abc')
+        expect(result.mime).to_equal('image/jpeg')
+        expect(len(result)).to_equal(5)
+        expect(result.last_modified).not_to_be_null()
+        expect(self.redis.commands).to_equal([b'HGETALL', b'TTL'])
+
+    @tornado.testing.gen_test
+    def test_sets_expiration(self):
+        storage = RedisStorage(self.context)
+        yield storage.put(b'abc')
+
+        expect(self.redis.ttls).to_equal({b'thumbor-result:/unsafe/image.jpg': 60})
+
+    @tornado.testing.gen_test
+    def test_returns_none_for_missing_image(self):
+        storage = RedisStorage(self.context)
+        result = yield storage.get()
+        expect(result).to_be_null()
+
+        last_updated = yield storage.last_updated()
+        expect(last_updated).to_be_true()
+
+    @tornado.testing.gen_test
+    def test_returns_none_when_redis_is_down(self):
+        self.redis.stop()
+        self.context.config.REDIS_RESULT_STORAGE_SERVER_PORT = tornado.testing.get_unused_port()
+
+        storage = RedisStorage(self.context)
+        yield storage.put(b'abc')
+        result = yield storage.get()
+        expect(result).to_be_null()
+
+    @tornado.testing.gen_test
+    def test_webp_images_are_stored_apart(self):
+        self.context.config.AUTO_WEBP = True
+        self.context.request.accepts_webp = True
+
+        storage = RedisStorage(self.context)
+        yield storage.put(b'abc')
+
+        expect(self.redis.hashes.keys()).to_equal([b'thumbor-result:webp:/unsafe/image.jpg'])
+
+
+class RedisClientTestCase(TestCase):
+    def get_config(self):
+        self.redis = FakeRedis(password='hey_you')
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.redis.add_sockets([sock])
+        return Config()
+
+    def tearDown(self):
+        self.redis.stop()
+        super(RedisClientTestCase, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_pipelines_commands(self):
+        client = RedisClient('127.0.0.1:%d' % self.port, password='hey_you')
+        replies = yield client.execute(('HMSET', 'key', 'a', 1), ('HGETALL', 'key'), ('TTL', 'key'))
+        expect(replies).to_equal([b'OK', [b'a', b'1'], -1])
+
+    @tornado.testing.gen_test
+    def test_raises_error_replies(self):
+        client = RedisClient('127.0.0.1:%d' % self.port, password='wrong')
+        with expect.error_to_happen(RedisError):
+            yield client.execute(('TTL', 'key'))
@@ -8,8 +8,10 @@
 # http://www.opensource.org/licenses/mit-license
 # Copyright (c) 2011 globo.com thumbor@googlegroups.com
 
+import os
 from os.path import exists, dirname, join
 import random
+import time
 import shutil
 import tornado
 
@@ -136,6 +138,91 @@ class ExpiredFileStorageTestCase(BaseFileStorageTestCase):
         expect(got).not_to_be_an_error()
 
 
+class RevalidatedFileStorageTestCase(BaseFileStorageTestCase):
+    def get_config(self):
+        return Config(
+            FILE_STORAGE_ROOT_PATH="/tmp/thumbor/file_storage/%s" % random.randint(1, 10000000),
+            STORAGE_EXPIRATION_SECONDS=60
+        )
+
+    @tornado.testing.gen_test
+    def test_can_store_validators(self):
+        iurl = self.get_image_url('image_11.jpg')
+        storage = FileStorage(self.context)
+        storage.put(iurl, self.get_image_bytes('image.jpg'))
+        storage.put_validators(iurl, {'ETag': '"abc"', 'LastModified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+        got = yield storage.get_validators(iurl)
+        expect(got).to_equal({'ETag': '"abc"', 'LastModified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+    @tornado.testing.gen_test
+    def test_returns_none_if_no_validators(self):
+        storage = FileStorage(self.context)
+        got = yield storage.get_validators(self.get_image_url('image_10001.jpg'))
+        expect(got).to_be_null()
+
+    @tornado.testing.gen_test
+    def test_can_refresh_expired_image(self):
+        iurl = self.get_image_url('image_12.jpg')
+        storage = FileStorage(self.context)
+        storage.put(iurl, self.get_image_bytes('image.jpg'))
+        storage.put_validators(iurl, {'ETag': '"abc"'})
+
+        expired = time.time() - 120
+        os.utime(storage.path_on_filesystem(iurl), (expired, expired))
+        got = yield storage.get(iurl)
+        expect(got).to_be_null()
+
+        validators = yield storage.get_validators(iurl)
+        expect(validators).to_equal({'ETag': '"abc"'})
+
+        storage.refresh(iurl)
+        got = yield storage.get(iurl)
+        expect(got).to_equal(self.get_image_bytes('image.jpg'))
+
+    @tornado.testing.gen_test
+    def test_can_store_loader_error(self):
+        iurl = self.get_image_url('image_13.jpg')
+        storage = FileStorage(self.context)
+        storage.put_loader_error(iurl, 'not_found', 60)
+
+        got = yield storage.get_loader_error(iurl)
+        expect(got[0]).to_equal('not_found')
+        expect(got[1]).to_be_greater_than(time.time() + 59)
+
+        storage.put_loader_error(iurl, 'not_found', -1)
+        got = yield storage.get_loader_error(iurl)
+        expect(got).to_be_null()
+
+
+class ThreadedFileStorageTestCase(BaseFileStorageTestCase):
+    def get_config(self):
+        return Config(
+            FILE_STORAGE_ROOT_PATH="/tmp/thumbor/file_storage/%s" % random.randint(1, 10000000),
+            FILE_IO_THREADPOOL_SIZE=2
+        )
+
+    @tornado.testing.gen_test
+    def test_can_store_and_get_image_in_io_threads(self):
+        iurl = self.get_image_url('image_14.jpg')
+        storage = FileStorage(self.context)
+        yield storage.put(iurl, self.get_image_bytes('image.jpg'))
+        yield storage.put_detector_data(iurl, [{'x': 1}])
+
+        exists = yield storage.exists(iurl)
+        expect(exists).to_be_true()
+
+        got = yield storage.get(iurl)
+        expect(got).to_equal(self.get_image_bytes('image.jpg'))
+
+        detector_data = yield storage.get_detector_data(iurl)
+        expect(detector_data).to_equal([{'x': 1}])
+
+        yield storage.remove(iurl)
+        got = yield storage.get(iurl)
+        expect(got).to_be_null()
+
+
 class ExpirationNoneFileStorageTestCase(BaseFileStorageTestCase):
     def get_config(self):
         return Config(
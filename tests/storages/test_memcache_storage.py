@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import tornado.testing
+from preggy import expect
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+
+from thumbor.config import Config
+from thumbor.context import ServerParameters
+from thumbor.storages.memcache_storage import MemcacheClient, Storage as MemcacheStorage
+
+from tests.base import TestCase
+
+
+class FakeMemcached(TCPServer):
+    '''
+    Speaks the get, set and delete commands of the memcached text protocol.
+    '''
+
+    def __init__(self):
+        super(FakeMemcached, self).__init__()
+        self.items = {}
+        self.commands = []
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        try:
+            while True:
+                line = yield stream.read_until(b'\r\n')
+                args = line.split()
+                self.commands.append(args[0])
+
+                if args[0] == b'get':
+                    for key in args[1:]:
+                        if key in self.items:
+                            flags, value = self.items[key]
+                            yield stream.write(b'VALUE %s %d %d\r\n%s\r\n' % (key, flags, len(value), value))
+                    yield stream.write(b'END\r\n')
+                elif args[0] == b'set':
+                    data = yield stream.read_bytes(int(args[4]) + 2)
+                    self.items[args[1]] = (int(args[2]), data[:-2])
+                    yield stream.write(b'STORED\r\n')
+                elif args[0] == b'delete':
+                    found = self.items.pop(args[1], None) is not None
+                    yield stream.write(b'DELETED\r\n' if found else b'NOT_FOUND\r\n')
+        except StreamClosedError:
+            pass
+
+
+class MemcacheStorageTestCase(TestCase):
+    def get_config(self):
+        self.memcached = FakeMemcached()
+        sock, port = tornado.testing.bind_unused_port()
+        self.memcached.add_sockets([sock])
+
+        return Config(
+            MEMCACHE_STORAGE_SERVERS=['127.0.0.1:%d' % port],
+            MEMCACHE_STORAGE_ITEM_SIZE=100,
+            STORES_CRYPTO_KEY_FOR_EACH_IMAGE=True,
+        )
+
+    def get_server(self):
+        server = ServerParameters(8888, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return server
+
+    def tearDown(self):
+        self.memcached.stop()
+        super(MemcacheStorageTestCase, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_can_store_and_get_image(self):
+        storage = MemcacheStorage(self.context)
+        yield storage.put('image.jpg', b'abc')
+
+        got = yield storage.get('image.jpg')
+        expect(got).to_equal(b'abc')
+
+        exists = yield storage.exists('image.jpg')
+        expect(exists).to_be_true()
+
+    @tornado.testing.gen_test
+    def test_splits_big_images_in_chunks(self):
+        image = b''.join(chr(i % 256) for i in range(250))
+        storage = MemcacheStorage(self.context)
+        yield storage.put('big.jpg', image)
+
+        expect(self.memcached.items).to_length(4)
+        got = yield storage.get('big.jpg')
+        expect(got).to_equal(image)
+
+    @tornado.testing.gen_test
+    def test_gets_crypto_and_detector_data_with_image(self):
+        storage = MemcacheStorage(self.context)
+        yield storage.put('image.jpg', b'abc')
+        yield storage.put_crypto('image.jpg')
+        yield storage.put_detector_data('image.jpg', [{'x': 1}])
+
+        storage = MemcacheStorage(self.context)
+        self.memcached.commands = []
+        yield storage.get('image.jpg')
+        crypto = yield storage.get_crypto('image.jpg')
+        detector_data = yield storage.get_detector_data('image.jpg')
+
+        expect(crypto).to_equal('ACME-SEC')
+        expect(detector_data).to_equal([{'x': 1}])
+        expect(self.memcached.commands).to_equal([b'get'])
+
+    @tornado.testing.gen_test
+    def test_gets_all_in_one_request(self):
+        storage = MemcacheStorage(self.context)
+        yield storage.put('image.jpg', b'abc')
+        yield storage.put_crypto('image.jpg')
+
+        self.memcached.commands = []
+        stored = yield MemcacheStorage(self.context).get_all('image.jpg')
+
+        expect(stored).to_equal({'image': b'abc', 'crypto': 'ACME-SEC', 'detector': None})
+        expect(self.memcached.commands).to_equal([b'get'])
+
+    @tornado.testing.gen_test
+    def test_returns_none_for_missing_image(self):
+        storage = MemcacheStorage(self.context)
+        got = yield storage.get('missing.jpg')
+        expect(got).to_be_null()
+
+        crypto = yield storage.get_crypto('missing.jpg')
+        expect(crypto).to_be_null()
+
+    @tornado.testing.gen_test
+    def test_can_remove_image(self):
+        storage = MemcacheStorage(self.context)
+        yield storage.put('image.jpg', b'abc')
+        yield storage.remove('image.jpg')
+
+        exists = yield storage.exists('image.jpg')
+        expect(exists).to_be_false()
+
+    @tornado.testing.gen_test
+    def test_considers_unreachable_servers_empty(self):
+        self.memcached.stop()
+        self.config.MEMCACHE_STORAGE_SERVERS = ['127.0.0.1:1']
+        storage = MemcacheStorage(self.context)
+
+        yield storage.put('image.jpg', b'abc')
+        got = yield storage.get('image.jpg')
+        expect(got).to_be_null()
+
+
+class MemcacheClientTestCase(TestCase):
+    def test_spreads_keys_consistently(self):
+        client = MemcacheClient(['a:11211', 'b:11211', 'c:11211'])
+        keys = ['key-%d' % i for i in range(300)]
+        servers = [client.server_for(key) for key in keys]
+        expect(set(servers)).to_equal(set(['a:11211', 'b:11211', 'c:11211']))
+
+        client = MemcacheClient(['a:11211', 'b:11211', 'c:11211', 'd:11211'])
+        moved = [key for key, server in zip(keys, servers) if client.server_for(key) != server]
+        expect(all(client.server_for(key) == 'd:11211' for key in moved)).to_be_true()
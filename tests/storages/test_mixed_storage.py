@@ -94,6 +94,11 @@ class MixedStorageTestCase(BaseMidexStorageTestCase):
         contents = yield self.storage.get_detector_data('path1')
         expect(contents).to_equal('detector')
 
+    @tornado.testing.gen_test
+    def test_mixed_storage_get_all(self):
+        stored = yield self.storage.get_all('path1')
+        expect(stored).to_equal({'image': 'contents', 'crypto': 'security-key', 'detector': 'detector'})
+
 
 class MixedStorageFromConfTestCase(BaseMidexStorageTestCase):
     def get_context(self, *args, **kwargs):
@@ -119,3 +124,8 @@ class MixedStorageFromConfTestCase(BaseMidexStorageTestCase):
         path = yield self.storage.get_crypto('path')
         expect(self.storage.crypto_storage).to_be_instance_of(NoStorage)
         expect(path).to_be_null()
+
+    @tornado.testing.gen_test
+    def test_get_all(self):
+        stored = yield self.storage.get_all('path')
+        expect(stored).to_equal({'image': None, 'crypto': None, 'detector': None})
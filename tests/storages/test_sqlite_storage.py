@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import shutil
+import sqlite3
+import tempfile
+from os.path import join
+
+import tornado.testing
+from preggy import expect
+
+from thumbor.config import Config
+from thumbor.context import ServerParameters
+from thumbor.storages.sqlite_storage import SQLiteStore, Storage as SQLiteStorage
+
+from tests.base import TestCase
+
+
+class SQLiteStorageTestCase(TestCase):
+    def get_config(self):
+        self.root_path = tempfile.mkdtemp()
+        return Config(
+            SQLITE_STORAGE_PATH=join(self.root_path, 'storage.db'),
+            SQLITE_STORAGE_BATCH_SIZE=3,
+            SQLITE_STORAGE_FLUSH_INTERVAL=60,
+            STORES_CRYPTO_KEY_FOR_EACH_IMAGE=True,
+        )
+
+    def get_server(self):
+        server = ServerParameters(8888, 'localhost', 'thumbor.conf', None, 'info', None)
+        server.security_key = 'ACME-SEC'
+        return server
+
+    def tearDown(self):
+        store = SQLiteStore.for_context(self.context)
+        if store.periodic_callback is not None:
+            store.periodic_callback.stop()
+        shutil.rmtree(self.root_path)
+        super(SQLiteStorageTestCase, self).tearDown()
+
+    def get_rows(self):
+        connection = sqlite3.connect(self.config.SQLITE_STORAGE_PATH)
+        try:
+            return connection.execute('SELECT path, kind, value FROM records ORDER BY path, kind').fetchall()
+        finally:
+            connection.close()
+
+    @tornado.testing.gen_test
+    def test_can_store_crypto_and_detector_data(self):
+        storage = SQLiteStorage(self.context)
+        storage.put_crypto('image.jpg')
+        storage.put_detector_data('image.jpg', [{'x': 1}])
+
+        crypto = yield storage.get_crypto('image.jpg')
+        detector_data = yield storage.get_detector_data('image.jpg')
+        expect(crypto).to_equal('ACME-SEC')
+        expect(detector_data).to_equal([{'x': 1}])
+
+    @tornado.testing.gen_test
+    def test_writes_records_in_batches(self):
+        storage = SQLiteStorage(self.context)
+        storage.put_crypto('a.jpg')
+        storage.put_crypto('b.jpg')
+        expect(storage.store.pending).to_length(2)
+
+        storage.put_crypto('c.jpg')
+        expect(storage.store.pending).to_be_empty()
+        expect(self.get_rows()).to_equal([
+            ('a.jpg', 'crypto', 'ACME-SEC'),
+            ('b.jpg', 'crypto', 'ACME-SEC'),
+            ('c.jpg', 'crypto', 'ACME-SEC'),
+        ])
+
+    @tornado.testing.gen_test
+    def test_reads_records_from_database(self):
+        storage = SQLiteStorage(self.context)
+        storage.put_detector_data('image.jpg', [{'x': 1}])
+        storage.store.flush()
+        storage.store.cache.clear()
+
+        detector_data = yield storage.get_detector_data('image.jpg')
+        expect(detector_data).to_equal([{'x': 1}])
+        expect(storage.store.cache).to_include(('image.jpg', 'detector'))
+
+    @tornado.testing.gen_test
+    def test_returns_none_for_missing_or_removed_records(self):
+        storage = SQLiteStorage(self.context)
+        crypto = yield storage.get_crypto('image.jpg')
+        expect(crypto).to_be_null()
+
+        storage.put_crypto('image.jpg')
+        storage.store.flush()
+        storage.remove('image.jpg')
+        crypto = yield storage.get_crypto('image.jpg')
+        expect(crypto).to_be_null()
+
+        storage.store.flush()
+        expect(self.get_rows()).to_be_empty()
+
+    @tornado.testing.gen_test
+    def test_detector_data_expire(self):
+        self.context.config.STORAGE_EXPIRATION_SECONDS = 1
+        storage = SQLiteStorage(self.context)
+        storage.store.put('image.jpg', 'detector', '[]')
+        storage.store.pending[('image.jpg', 'detector')] = ('[]', 0)
+
+        detector_data = yield storage.get_detector_data('image.jpg')
+        expect(detector_data).to_be_null()
+
+
+class SQLiteStoreTestCase(TestCase):
+    def test_evicts_least_recently_used_records(self):
+        store = SQLiteStore(':memory:', cache_size=2)
+        store._cache(('a', 'crypto'), ('1', 0))
+        store._cache(('b', 'crypto'), ('2', 0))
+        store._cache(('a', 'crypto'), ('1', 0))
+        store._cache(('c', 'crypto'), ('3', 0))
+
+        expect(list(store.cache.keys())).to_equal([('a', 'crypto'), ('c', 'crypto')])
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import time
+
+import tornado.testing
+from preggy import expect
+
+from thumbor.blacklist import Blacklist
+
+from tests.base import TestCase
+
+
+class Storage(object):
+    def __init__(self, contents=None):
+        self.contents = contents
+        self.reads = 0
+
+    def exists(self, path):
+        return self.contents is not None
+
+    def get(self, path):
+        self.reads += 1
+        return self.contents
+
+    def put(self, path, contents):
+        self.contents = contents
+
+
+class BlacklistTestCase(TestCase):
+    def test_can_get_blacklist_instance(self):
+        expect(Blacklist.instance(60)).to_equal(Blacklist.instance(60))
+        expect(Blacklist.instance(60)).not_to_equal(Blacklist.instance(30))
+
+    @tornado.testing.gen_test
+    def test_reads_storage_once(self):
+        storage = Storage('a.jpg\n b.jpg \n\n')
+        blacklist = Blacklist(60)
+
+        a = yield blacklist.contains(storage, 'a.jpg')
+        b = yield blacklist.contains(storage, 'b.jpg')
+        c = yield blacklist.contains(storage, 'c.jpg')
+
+        expect(a).to_be_true()
+        expect(b).to_be_true()
+        expect(c).to_be_false()
+        expect(storage.reads).to_equal(1)
+
+    @tornado.testing.gen_test
+    def test_matches_whole_urls(self):
+        blacklist = Blacklist(60)
+        blacklisted = yield blacklist.contains(Storage('http://a.com/image.jpg\n'), 'image.jpg')
+        expect(blacklisted).to_be_false()
+
+    @tornado.testing.gen_test
+    def test_refreshes_after_interval(self):
+        storage = Storage('a.jpg\n')
+        blacklist = Blacklist(60)
+        yield blacklist.contains(storage, 'a.jpg')
+
+        storage.contents = 'a.jpg\nb.jpg\n'
+        blacklisted = yield blacklist.contains(storage, 'b.jpg')
+        expect(blacklisted).to_be_false()
+
+        blacklist.loaded_at = time.time() - 61
+        yield blacklist.contains(storage, 'b.jpg')
+        blacklisted = yield blacklist.contains(storage, 'b.jpg')
+        expect(blacklisted).to_be_true()
+        expect(storage.reads).to_equal(2)
+
+    @tornado.testing.gen_test
+    def test_appends_urls(self):
+        storage = Storage('a.jpg\n')
+        blacklist = Blacklist(60)
+
+        yield blacklist.add(storage, 'b.jpg')
+        yield blacklist.add(storage, 'b.jpg')
+        blacklisted = yield blacklist.contains(storage, 'b.jpg')
+
+        expect(blacklisted).to_be_true()
+        expect(storage.contents).to_equal('a.jpg\nb.jpg\n')
+        expect(storage.reads).to_equal(2)
+
+    @tornado.testing.gen_test
+    def test_keeps_urls_added_by_other_processes(self):
+        storage = Storage('a.jpg\n')
+        blacklist = Blacklist(60)
+        other_blacklist = Blacklist(60)
+        yield blacklist.contains(storage, 'a.jpg')
+        yield other_blacklist.contains(storage, 'a.jpg')
+
+        yield blacklist.add(storage, 'b.jpg')
+        yield other_blacklist.add(storage, 'c.jpg')
+
+        expect(storage.contents).to_equal('a.jpg\nb.jpg\nc.jpg\n')
+        blacklisted = yield other_blacklist.contains(storage, 'b.jpg')
+        expect(blacklisted).to_be_true()
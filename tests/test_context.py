@@ -9,8 +9,13 @@
 # Copyright (c) 2011 globo.com thumbor@googlegroups.com
 
 from unittest import TestCase, skip
+import functools
+import threading
+import time
 
 import mock
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
 from preggy import expect
 
 from thumbor.config import Config
@@ -19,7 +24,7 @@ from thumbor.filters import FiltersFactory
 from thumbor.metrics.logger_metrics import Metrics
 from thumbor.context import (
     Context, ThreadPool, ServerParameters, RequestParameters,
-    ContextImporter,
+    ContextImporter, EngineBusyError, RequestCancelledError, IOExecutor,
 )
 
 
@@ -61,6 +66,25 @@ class ContextTestCase(TestCase):
         expect(ctx.modules).not_to_be_null()
         expect(ctx.modules.importer).to_equal(importer)
 
+    def test_can_create_context_with_per_worker_metrics(self):
+        cfg = Config(METRICS_PER_WORKER=True)
+        server = ServerParameters(8888, 'localhost', 'thumbor.conf', None, 'info', None, processes=2)
+        server.worker_id = 1
+
+        ctx = Context(server=server, config=cfg)
+        ctx.metrics.metrics = mock.Mock()
+        ctx.metrics.incr('response.count')
+        ctx.metrics.timing('response.time', 10)
+
+        ctx.metrics.metrics.incr.assert_has_calls([
+            mock.call('response.count', 1),
+            mock.call('worker.1.response.count', 1),
+        ])
+        ctx.metrics.metrics.timing.assert_has_calls([
+            mock.call('response.time', 10),
+            mock.call('worker.1.response.time', 10),
+        ])
+
     def test_can_config_define_app_class(self):
         server = ServerParameters(
             port=8888,
@@ -109,6 +133,7 @@ class ServerParametersTestCase(TestCase):
             app_class='app',
             fd='fd',
             gifsicle_path='gifsicle_path',
+            processes=4,
         )
 
         expect(params.port).to_equal(8888)
@@ -120,6 +145,8 @@ class ServerParametersTestCase(TestCase):
         expect(params._security_key).to_equal('SECURITY_KEY_FILE')
         expect(params.fd).to_equal('fd')
         expect(params.gifsicle_path).to_equal('gifsicle_path')
+        expect(params.processes).to_equal(4)
+        expect(params.worker_id).to_be_null()
 
         expect(params.security_key).to_equal('SECURITY_KEY_FILE')
 
@@ -262,6 +289,20 @@ class RequestParametersTestCase(TestCase):
         params = RequestParameters(focal_points=['a', 'b'])
         expect(params.focal_points).to_length(2)
 
+    def test_is_cancelled_by_client_or_deadline(self):
+        params = RequestParameters()
+        expect(params.is_cancelled()).to_be_false()
+
+        params.deadline = time.time() + 60
+        expect(params.is_cancelled()).to_be_false()
+
+        params.deadline = time.time() - 1
+        expect(params.is_cancelled()).to_be_true()
+
+        params.deadline = None
+        params.cancelled = True
+        expect(params.is_cancelled()).to_be_true()
+
     def test_can_get_params_from_request(self):
         request = mock.Mock(
             path='/test.jpg',
@@ -383,9 +424,131 @@ class ThreadPoolTestCase(TestCase):
     def test_can_run_async(self):
         expect.not_to_be_here()
 
+    def test_rejects_admission_when_queue_is_full(self):
+        instance = ThreadPool.instance(1, max_queue_size=1)
+        metrics = mock.Mock()
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        try:
+            instance.queue(block, lambda future: None)
+            started.wait()
+            instance.queue(lambda: None, lambda future: None)
+            expect(instance.queue_size).to_equal(1)
+
+            def handle_operation(result):
+                self.handled = True
+                with expect.error_to_happen(EngineBusyError):
+                    result.result()
+
+            instance.queue(lambda: None, handle_operation, admission=True, metrics=metrics)
+            expect(self.handled).to_be_true()
+            metrics.incr.assert_called_with('engine.queue.rejected')
+        finally:
+            release.set()
+            instance.cleanup()
+
+    def test_skips_cancelled_tasks(self):
+        instance = ThreadPool.instance(1)
+        operation = mock.Mock()
+
+        def queue():
+            future = Future()
+            instance.queue(operation, future.set_result, is_cancelled=lambda: True)
+            return future
+
+        try:
+            result = IOLoop().run_sync(queue)
+        finally:
+            instance.cleanup()
+
+        expect(operation.called).to_be_false()
+        with expect.error_to_happen(RequestCancelledError):
+            result.result()
+
+    def run_blocked(self, instance, costs):
+        release = threading.Event()
+        started = threading.Event()
+        done = threading.Event()
+        order = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        def run(cost):
+            order.append(cost)
+            if len(order) == len(costs):
+                done.set()
+
+        try:
+            instance.queue(block, lambda future: None)
+            started.wait()
+            for cost in costs:
+                instance.queue(functools.partial(run, cost), lambda future: None, cost=cost)
+            release.set()
+            done.wait(5)
+        finally:
+            release.set()
+            instance.cleanup()
+
+        return order
+
+    def test_runs_cheaper_tasks_first(self):
+        instance = ThreadPool.instance(1, cost_weight=1)
+        expect(self.run_blocked(instance, [100, 1, 50])).to_equal([1, 50, 100])
+
+    def test_runs_tasks_in_arrival_order_without_cost_weight(self):
+        instance = ThreadPool.instance(1)
+        expect(self.run_blocked(instance, [100, 1, 50])).to_equal([100, 1, 50])
+
     def test_can_cleanup_pool(self):
         instance = ThreadPool.instance(0)
         instance.pool = mock.Mock()
         instance.cleanup()
 
         expect(instance.pool.shutdown.called).to_be_true()
+
+
+class IOExecutorTestCase(TestCase):
+    def test_runs_in_foreground_without_pool(self):
+        executor = IOExecutor(0)
+        expect(executor.run(lambda x: x * 2, 21).result()).to_equal(42)
+
+        with expect.error_to_happen(ValueError):
+            executor.run(int, 'a')
+
+    def test_runs_operations_in_pool(self):
+        executor = IOExecutor(1)
+        threads = []
+
+        def operation():
+            threads.append(threading.current_thread())
+            return 'done'
+
+        try:
+            result = IOLoop().run_sync(lambda: executor.run(operation))
+        finally:
+            executor.cleanup()
+
+        expect(result).to_equal('done')
+        expect(threads).not_to_include(threading.current_thread())
+
+    def test_drops_writes_over_max_pending_writes(self):
+        executor = IOExecutor(1, max_pending_writes=1)
+        release = threading.Event()
+        written = []
+
+        try:
+            expect(executor.write_behind(release.wait)).to_be_true()
+            expect(executor.write_behind(written.append, 'a')).to_be_false()
+        finally:
+            release.set()
+            executor.cleanup()
+
+        expect(executor.pending_writes).to_equal(0)
+        expect(written).to_be_empty()
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from os.path import exists, join
+
+import tornado.testing
+from preggy import expect
+from tornado import gen
+
+from thumbor.config import Config
+from thumbor.context import Context, IOExecutor
+from thumbor.disk_cache import DiskCacheJanitor
+from thumbor.storages.file_storage import Storage as FileStorage
+
+from tests.base import TestCase
+
+
+class DiskCacheJanitorTestCase(TestCase):
+    def setUp(self):
+        super(DiskCacheJanitorTestCase, self).setUp()
+        self.root_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+        super(DiskCacheJanitorTestCase, self).tearDown()
+
+    def write(self, name, size=10, age=0):
+        path = join(self.root_path, name)
+        with open(path, 'w') as f:
+            f.write('a' * size)
+        if age:
+            modified = time.time() - age
+            os.utime(path, (modified, modified))
+        return path
+
+    def test_indexes_files_incrementally(self):
+        for name in ('a', 'b', 'c'):
+            self.write(name)
+        janitor = DiskCacheJanitor(self.root_path)
+
+        janitor.scan(2)
+        expect(janitor).to_length(2)
+        janitor.scan(2)
+        expect(janitor).to_length(3)
+        expect(janitor.size).to_equal(30)
+
+    def test_evicts_least_recently_used_files(self):
+        scanned = self.write('scanned', age=60)
+        janitor = DiskCacheJanitor(self.root_path, max_files=2)
+        janitor.scan(10)
+
+        old = self.write('old')
+        janitor.record(old, 10)
+        new = self.write('new')
+        janitor.record(new, 10)
+
+        expect(janitor.evict(10)).to_equal(1)
+        expect(exists(scanned)).to_be_false()
+
+        janitor.touch(old)
+        janitor.record(self.write('newer'), 10)
+        expect(janitor.evict(10)).to_equal(1)
+        expect(exists(new)).to_be_false()
+        expect(exists(old)).to_be_true()
+
+    def test_evicts_up_to_max_size_in_batches(self):
+        janitor = DiskCacheJanitor(self.root_path, max_size=25)
+        paths = [self.write(str(i)) for i in range(5)]
+        for path in paths:
+            janitor.record(path, 10)
+
+        expect(janitor.evict(2)).to_equal(2)
+        expect(janitor.evict(2)).to_equal(1)
+        expect(janitor.size).to_equal(20)
+        expect([exists(path) for path in paths]).to_equal([False, False, False, True, True])
+
+    def test_removes_expired_files(self):
+        expired = self.write('expired', age=120)
+        fresh = self.write('fresh')
+        janitor = DiskCacheJanitor(self.root_path, max_files=10, expiration=60)
+
+        expired_count, evicted_count = janitor.run()
+
+        expect(expired_count).to_equal(1)
+        expect(evicted_count).to_equal(0)
+        expect(exists(expired)).to_be_false()
+        expect(exists(fresh)).to_be_true()
+
+    def test_evicts_scanned_files_by_last_use(self):
+        paths = [self.write(name, age=age) for name, age in (('a', 30), ('b', 90), ('c', 60))]
+        janitor = DiskCacheJanitor(self.root_path, max_files=1)
+        janitor.scan(10)
+        janitor.record(self.write('d'), 10)
+
+        expect(janitor.evict(1)).to_equal(1)
+        expect([exists(path) for path in paths]).to_equal([True, False, True])
+        expect(janitor.evict(10)).to_equal(2)
+        expect([exists(path) for path in paths]).to_equal([False, False, False])
+        expect(janitor).to_length(1)
+
+    def test_skips_files_being_written(self):
+        self.write('a')
+        self.write('a.%s' % ('0123456789abcdef' * 2))
+        janitor = DiskCacheJanitor(self.root_path)
+        janitor.scan(10)
+
+        expect(janitor).to_length(1)
+
+    def test_forgets_deleted_files_after_full_scan(self):
+        path = self.write('a')
+        janitor = DiskCacheJanitor(self.root_path)
+        janitor.scan(10)
+        janitor.scan(10)
+        os.remove(path)
+
+        janitor.scan(10)
+        janitor.scan(10)
+        expect(janitor).to_length(0)
+        expect(janitor.size).to_equal(0)
+
+    def test_leaves_metadata_files_alone(self):
+        image = self.write('a', age=120)
+        crypto = self.write('a.txt', age=120)
+        blacklist = self.write('blacklist.txt', age=120)
+        janitor = DiskCacheJanitor(self.root_path, max_files=1, expiration=60)
+
+        expired_count, evicted_count = janitor.run()
+
+        expect(expired_count).to_equal(1)
+        expect(exists(image)).to_be_false()
+        expect(exists(crypto)).to_be_true()
+        expect(exists(blacklist)).to_be_true()
+
+    @tornado.testing.gen_test
+    def test_runs_in_a_thread_without_io_thread_pool(self):
+        threads = []
+
+        def run():
+            threads.append(threading.current_thread())
+            return 0, 0
+
+        janitor = DiskCacheJanitor(self.root_path, max_files=1)
+        janitor.run = run
+        janitor.start(IOExecutor(0), 0.01)
+        try:
+            while not threads:
+                yield gen.sleep(0.01)
+        finally:
+            janitor.periodic_callback.stop()
+
+        expect(threads[0]).not_to_equal(threading.current_thread())
+
+
+class FileStorageWithJanitorTestCase(TestCase):
+    def get_context(self):
+        self.root_path = tempfile.mkdtemp()
+        cfg = Config(FILE_STORAGE_ROOT_PATH=self.root_path, FILE_STORAGE_MAX_FILES=1)
+        return Context(None, cfg, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+        super(FileStorageWithJanitorTestCase, self).tearDown()
+
+    def test_records_stored_images(self):
+        storage = FileStorage(self.context)
+        storage.put('image_a.jpg', 'a')
+        storage.put('image_b.jpg', 'bb')
+
+        janitor = storage.janitor
+        expect(janitor).to_length(2)
+        expect(janitor.size).to_equal(3)
+
+        janitor.evict(10)
+        expect(exists(storage.path_on_filesystem('image_a.jpg'))).to_be_false()
+        expect(exists(storage.path_on_filesystem('image_b.jpg'))).to_be_true()
+
+    def test_does_not_record_metadata(self):
+        storage = FileStorage(self.context)
+        storage.put('image.jpg', 'a')
+        storage.put_detector_data('image.jpg', [])
+        storage.put_validators('image.jpg', {})
+
+        expect(storage.janitor).to_length(1)
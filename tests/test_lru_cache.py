@@ -0,0 +1,60 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from preggy import expect
+
+from thumbor.lru_cache import LRUCache
+from thumbor.negative_cache import NegativeCache
+from thumbor.url_cache import ParsedUrlCache
+
+from tests.base import TestCase
+
+
+class WeighedCache(LRUCache):
+    def weigh(self, value):
+        return len(value)
+
+
+class LRUCacheTestCase(TestCase):
+    def test_shares_instances_per_class_and_arguments(self):
+        instance = NegativeCache.instance(10)
+        expect(NegativeCache.instance(10)).to_equal(instance)
+        expect(ParsedUrlCache.instance(10)).not_to_equal(instance)
+
+    def test_evicts_least_recently_used_entries(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        expect(cache.get('a')).to_equal(1)
+
+        expect(cache.put('c', 3)).to_equal(1)
+        expect(cache.get('b')).to_be_null()
+        expect(cache).to_length(2)
+
+    def test_evicts_entries_by_weight(self):
+        cache = WeighedCache(5)
+        cache.put('a', 'aa')
+        cache.put('b', 'bb')
+
+        expect(cache.put('c', 'cccc')).to_equal(2)
+        expect(cache.size).to_equal(4)
+        expect(cache.put('d', 'dddddd')).to_equal(0)
+        expect(cache.get('d')).to_be_null()
+
+    def test_removes_and_clears_entries(self):
+        cache = LRUCache(3)
+        cache.put('a', 1)
+        cache.put('b', 2)
+
+        expect(cache.remove('a')).to_equal(1)
+        expect(cache.size).to_equal(1)
+        cache.clear()
+        expect(cache).to_length(0)
+        expect(cache.size).to_equal(0)
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import time
+
+import mock
+from preggy import expect
+
+from thumbor.negative_cache import NegativeCache
+
+from tests.base import TestCase
+
+
+class NegativeCacheTestCase(TestCase):
+    def test_can_get_cache_instance(self):
+        instance = NegativeCache.instance(10)
+        expect(NegativeCache.instance(10)).to_equal(instance)
+        expect(NegativeCache.instance(20)).not_to_equal(instance)
+
+    def test_returns_cached_errors(self):
+        cache = NegativeCache(10)
+        cache.put('a', 'not_found', 60)
+        expect(cache.get('a')).to_equal('not_found')
+        expect(cache.get('b')).to_be_null()
+
+    def test_expires_errors(self):
+        cache = NegativeCache(10)
+        cache.put('a', 'not_found', 60)
+        cache.put('b', 'timeout', 10)
+
+        with mock.patch('time.time', return_value=time.time() + 30):
+            expect(cache.get('a')).to_equal('not_found')
+            expect(cache.get('b')).to_be_null()
+
+        expect(cache).to_length(1)
+
+    def test_evicts_oldest_errors(self):
+        cache = NegativeCache(2)
+        cache.put('a', 'not_found', 60)
+        cache.put('b', 'not_found', 60)
+        cache.put('c', 'timeout', 60)
+
+        expect(cache.get('a')).to_be_null()
+        expect(cache.get('b')).to_equal('not_found')
+        expect(cache.get('c')).to_equal('timeout')
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from datetime import datetime, timedelta
+
+import mock
+import pytz
+from preggy import expect
+
+from thumbor.result_cache import ResultCache
+from thumbor.result_storages import ResultStorageResult
+
+from tests.base import TestCase
+
+
+class ResultCacheTestCase(TestCase):
+    def setUp(self):
+        super(ResultCacheTestCase, self).setUp()
+        self.metrics = mock.Mock()
+
+    def test_can_get_cache_instance(self):
+        instance = ResultCache.instance(100)
+        expect(ResultCache.instance(100)).to_equal(instance)
+        expect(ResultCache.instance(200)).not_to_equal(instance)
+
+    def test_returns_cached_results(self):
+        cache = ResultCache(100)
+        last_modified = datetime.now(pytz.utc)
+        cache.put('a', 'abc', {'ContentType': 'image/jpeg', 'LastModified': last_modified})
+
+        result = cache.get('a', self.metrics)
+
+        expect(result).to_be_instance_of(ResultStorageResult)
+        expect(result.buffer).to_equal('abc')
+        expect(result.mime).to_equal('image/jpeg')
+        expect(result.last_modified).to_equal(last_modified)
+        self.metrics.incr.assert_called_with('result_cache.hit')
+
+    def test_reports_misses(self):
+        cache = ResultCache(100)
+        expect(cache.get('a', self.metrics)).to_be_null()
+        self.metrics.incr.assert_called_with('result_cache.miss')
+
+    def test_evicts_least_recently_used_results(self):
+        cache = ResultCache(10)
+        cache.put('a', 'aaaa', {})
+        cache.put('b', 'bbbb', {})
+        cache.get('a')
+        cache.put('c', 'cccc', {}, self.metrics)
+
+        expect(cache.get('b')).to_be_null()
+        expect(cache.get('a')).not_to_be_null()
+        expect(cache.get('c')).not_to_be_null()
+        expect(cache.size).to_equal(8)
+        self.metrics.incr.assert_called_once_with('result_cache.evicted')
+
+    def test_does_not_cache_results_bigger_than_cache(self):
+        cache = ResultCache(3)
+        cache.put('a', 'aaaa', {})
+        expect(cache).to_length(0)
+        expect(cache.size).to_equal(0)
+
+    def test_replaces_results(self):
+        cache = ResultCache(10)
+        cache.put('a', 'aaaa', {})
+        cache.put('a', 'aa', {})
+        expect(cache.get('a').buffer).to_equal('aa')
+        expect(cache.size).to_equal(2)
+
+    def test_expires_results(self):
+        cache = ResultCache(100, expiration=60)
+        cache.put('fresh', 'abc', {})
+        cache.put('old', 'abc', {'LastModified': datetime.now(pytz.utc) - timedelta(seconds=50)})
+        cache.put('expired', 'abc', {'LastModified': datetime.now(pytz.utc) - timedelta(seconds=70)})
+        expect(cache).to_length(2)
+
+        with mock.patch('time.time', return_value=cache.entries['old'][2] + 1):
+            expect(cache.get('old', self.metrics)).to_be_null()
+            expect(cache.get('fresh')).not_to_be_null()
+
+        self.metrics.incr.assert_any_call('result_cache.expired')
+        expect(cache.size).to_equal(3)
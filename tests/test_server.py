@@ -155,7 +155,7 @@ class ServerTestCase(TestCase):
     def test_can_run_server_with_default_params(self, server_mock):
         application = mock.Mock()
         context = mock.Mock()
-        context.server = mock.Mock(fd=None, port=1234, ip='0.0.0.0')
+        context.server = mock.Mock(fd=None, port=1234, ip='0.0.0.0', processes=1)
 
         server_instance_mock = mock.Mock()
         server_mock.return_value = server_instance_mock
@@ -165,12 +165,42 @@ class ServerTestCase(TestCase):
         server_instance_mock.bind.assert_called_with(1234, '0.0.0.0')
         server_instance_mock.start.assert_called_with(1)
 
+    @mock.patch.object(thumbor.server, 'HTTPServer')
+    @mock.patch('tornado.process.fork_processes')
+    def test_can_run_server_with_multiple_processes(self, fork_processes_mock, server_mock):
+        application = mock.Mock()
+        context = mock.Mock()
+        context.server = mock.Mock(fd=None, port=1234, ip='0.0.0.0', processes=0, worker_id=None)
+
+        server_instance_mock = mock.Mock()
+        server_mock.return_value = server_instance_mock
+        server_instance_mock.bind.side_effect = lambda *args: expect(fork_processes_mock.called).to_be_false()
+        fork_processes_mock.return_value = 3
+
+        run_server(application, context)
+
+        server_instance_mock.bind.assert_called_with(1234, '0.0.0.0')
+        fork_processes_mock.assert_called_with(0)
+        server_instance_mock.start.assert_called_with(1)
+        expect(context.server.worker_id).to_equal(3)
+
+    @mock.patch.object(thumbor.server, 'HTTPServer')
+    @mock.patch('tornado.process.fork_processes')
+    def test_should_not_fork_single_process(self, fork_processes_mock, server_mock):
+        context = mock.Mock()
+        context.server = mock.Mock(fd=None, port=1234, ip='0.0.0.0', processes=1, worker_id=None)
+
+        run_server(mock.Mock(), context)
+
+        expect(fork_processes_mock.called).to_be_false()
+        expect(context.server.worker_id).to_be_null()
+
     @mock.patch.object(thumbor.server, 'HTTPServer')
     @mock.patch.object(thumbor.server, 'socket')
     def test_can_run_server_with_fd(self, socket_mock, server_mock):
         application = mock.Mock()
         context = mock.Mock()
-        context.server = mock.Mock(fd=11, port=1234, ip='0.0.0.0')
+        context.server = mock.Mock(fd=11, port=1234, ip='0.0.0.0', processes=1)
 
         server_instance_mock = mock.Mock()
         server_mock.return_value = server_instance_mock
@@ -187,7 +217,7 @@ class ServerTestCase(TestCase):
     def test_can_run_server_with_null_fd(self, socket_mock, open_mock, server_mock):
         application = mock.Mock()
         context = mock.Mock()
-        context.server = mock.Mock(fd="/path/bin", port=1234, ip='0.0.0.0')
+        context.server = mock.Mock(fd="/path/bin", port=1234, ip='0.0.0.0', processes=1)
 
         server_instance_mock = mock.Mock()
         server_mock.return_value = server_instance_mock
@@ -214,6 +244,7 @@ class ServerTestCase(TestCase):
             fd=None,
             ip='0.0.0.0',
             port=1234,
+            processes=1,
         )
         get_server_parameters_mock.return_value = server_parameters
 
@@ -239,6 +270,7 @@ class ServerTestCase(TestCase):
             fd=None,
             ip='0.0.0.0',
             port=1234,
+            processes=1,
         )
         get_server_parameters_mock.return_value = server_parameters
 
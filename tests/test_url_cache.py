@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from preggy import expect
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+
+from thumbor.context import RequestParameters
+from thumbor.url_cache import ParsedUrlCache
+
+from tests.base import TestCase
+
+
+class ParsedUrlCacheTestCase(TestCase):
+    def test_can_get_cache_instance(self):
+        instance = ParsedUrlCache.instance(10)
+        expect(ParsedUrlCache.instance(10)).to_equal(instance)
+        expect(ParsedUrlCache.instance(20)).not_to_equal(instance)
+
+    def test_returns_cached_urls(self):
+        cache = ParsedUrlCache(10)
+        cache.put('/a', 'KEY', 'request', [])
+
+        entry = cache.get('/a', 'KEY')
+        expect(entry.request).to_equal('request')
+        expect(entry.filters_plan).to_equal([])
+        expect(cache.get('/b', 'KEY')).to_be_null()
+
+    def test_does_not_return_urls_cached_with_other_key(self):
+        cache = ParsedUrlCache(10)
+        cache.put('/a', 'KEY', 'request', [])
+
+        expect(cache.get('/a', 'OTHER-KEY')).to_be_null()
+        expect(cache).to_length(0)
+
+    def test_evicts_least_recently_used_urls(self):
+        cache = ParsedUrlCache(2)
+        cache.put('/a', 'KEY', 'a', [])
+        cache.put('/b', 'KEY', 'b', [])
+        cache.get('/a', 'KEY')
+        cache.put('/c', 'KEY', 'c', [])
+
+        expect(cache.get('/a', 'KEY')).not_to_be_null()
+        expect(cache.get('/b', 'KEY')).to_be_null()
+        expect(cache.get('/c', 'KEY')).not_to_be_null()
+
+
+class RequestParametersCopyTestCase(TestCase):
+    def test_copies_parameters_for_other_request(self):
+        params = RequestParameters(width=300, smart=True, image='image.jpg')
+        request = HTTPServerRequest(method='GET', uri='/unsafe/300x0/smart/image.jpg')
+        request.headers = HTTPHeaders({'Accept': 'image/webp'})
+
+        copied = params.copy_for(request)
+        copied.focal_points.append('point')
+        copied.crop['left'] = 10
+
+        expect(copied.width).to_equal(300)
+        expect(copied.smart).to_be_true()
+        expect(copied.url).to_equal('/unsafe/300x0/smart/image.jpg')
+        expect(copied.accepts_webp).to_be_true()
+        expect(params.focal_points).to_be_empty()
+        expect(params.crop['left']).to_equal(0)
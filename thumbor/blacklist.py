@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import time
+
+from tornado import gen
+
+from thumbor.utils import logger
+
+
+class Blacklist(object):
+    """
+    In-process index of the urls listed in the blacklist.txt file of the
+    storage, one per line.
+
+    The file is read on the first lookup and then again every
+    refresh_interval seconds (0 means never), in the background: lookups
+    are answered from the index meanwhile. Urls added by this process are
+    indexed right away. Like the caches built on LRUCache, it is shared by
+    the requests of a process and is not locked.
+    """
+
+    FILENAME = 'blacklist.txt'
+
+    _instances = {}
+
+    @classmethod
+    def instance(cls, refresh_interval):
+        instance = cls._instances.get(refresh_interval)
+        if instance is None:
+            instance = cls._instances[refresh_interval] = cls(refresh_interval)
+        return instance
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.urls = set()
+        self.contents = ''
+        self.loaded_at = None
+        self.loading = None
+
+    @property
+    def is_stale(self):
+        return bool(self.refresh_interval) and time.time() - self.loaded_at > self.refresh_interval
+
+    @gen.coroutine
+    def contains(self, storage, url):
+        """
+        Returns whether url is blacklisted. Only the first lookup waits for
+        the storage.
+        """
+        if self.loaded_at is None:
+            yield self.load(storage)
+        elif self.is_stale:
+            self.load(storage)
+        raise gen.Return(url in self.urls)
+
+    @gen.coroutine
+    def get_contents(self, storage):
+        """
+        Returns the contents of blacklist.txt as of the last load.
+        """
+        if self.loaded_at is None or self.is_stale:
+            yield self.load(storage)
+        raise gen.Return(self.contents)
+
+    @gen.coroutine
+    def add(self, storage, url):
+        """
+        Adds url to blacklist.txt and to the index. The file is read again
+        first, so that the urls other processes added to it are kept.
+        """
+        contents = yield self._read(storage)
+        self._index(contents)
+
+        if url in self.urls:
+            return
+        self.urls.add(url)
+        self.contents += url + '\n'
+        yield gen.maybe_future(storage.put(self.FILENAME, self.contents))
+
+    def load(self, storage):
+        """
+        Reads blacklist.txt from storage and indexes it. Concurrent calls share
+        the same read.
+        """
+        if self.loading is not None:
+            return self.loading
+
+        loading = self.loading = self._load(storage)
+        loading.add_done_callback(self._end_load)
+        return loading
+
+    def _end_load(self, future):
+        self.loading = None
+
+    @gen.coroutine
+    def _load(self, storage):
+        try:
+            contents = yield self._read(storage)
+        except Exception as e:
+            logger.error('[Blacklist] unable to read %s: %s', self.FILENAME, e)
+            if self.loaded_at is None:
+                raise
+            return
+
+        self._index(contents)
+
+    @gen.coroutine
+    def _read(self, storage):
+        exists = yield gen.maybe_future(storage.exists(self.FILENAME))
+        contents = ''
+        if exists:
+            contents = yield gen.maybe_future(storage.get(self.FILENAME))
+        raise gen.Return(contents or '')
+
+    def _index(self, contents):
+        self.contents = contents
+        self.urls = set(line.strip() for line in contents.splitlines() if line.strip())
+        self.loaded_at = time.time()
@@ -56,6 +56,16 @@ Config.define('PILLOW_RESAMPLING_FILTER', 'LANCZOS',
               'Specify resampling filter for Pillow resize method.'
               'One of LANCZOS, NEAREST, BILINEAR, BICUBIC, HAMMING (Pillow>=3.4.0).', 'Imaging')
 
+Config.define('PILLOW_RESIZE_REDUCING_GAP', None,
+              'When downscaling, first shrinks the image by an integer factor with a fast box filter as long as the '
+              'result stays at least this many times larger than the requested size, then applies '
+              'PILLOW_RESAMPLING_FILTER. Lower values are faster but lose quality. None (the default) disables '
+              'it.', 'Imaging')
+
+Config.define('PILLOW_JPEG_DRAFT_MODE', False,
+              'Decodes JPEG images at a reduced scale (1/2, 1/4 or 1/8) when the requested size allows it. '
+              'Greatly reduces decoding time and memory usage for thumbnails of large images.', 'Imaging')
+
 Config.define('WEBP_QUALITY', None, 'Quality index used for generated WebP images. If not set (None) the same level of '
               'JPEG quality will be used.', 'Imaging')
 
@@ -97,13 +107,59 @@ Config.define(
 Config.define(
     'USE_BLACKLIST', False,
     'Indicates whether thumbor should enable blacklist functionality to prevent processing certain images.', 'Imaging')
+Config.define(
+    'BLACKLIST_REFRESH_INTERVAL', 60,
+    'Number of seconds after which each thumbor process reads the blacklist from the storage again, in the '
+    'background. 0 means it is only read once', 'Imaging')
 
 Config.define(
     'ENGINE_THREADPOOL_SIZE', 0,
-    'Size of the thread pool used for image transformations.  The default value is 0 (don\'t use a threadpoool. '
+    'Size of the thread pool used for image decoding and transformations.  The default value is 0 (don\'t use a threadpoool. '
     'Increase this if you are seeing your IOLoop getting blocked (often indicated by your upstream HTTP '
     'requests timing out)', 'Imaging')
 
+Config.define(
+    'ENGINE_QUEUE_MAX_SIZE', 0,
+    'Maximum number of tasks waiting in the engine thread pool. Requests arriving when the queue is full are '
+    'rejected with a 503 status. The default value is 0 (no limit)', 'Imaging')
+
+Config.define(
+    'ENGINE_QUEUE_MAX_WAIT', 0,
+    'Maximum time in seconds a request may wait in the engine thread pool queue before being rejected with a 503 '
+    'status. The default value is 0 (no limit)', 'Imaging')
+
+Config.define(
+    'ENGINE_QUEUE_COST_WEIGHT', 0.05,
+    'Seconds of queueing in the engine thread pool that a request is delayed by per megapixel of estimated cost '
+    '(source and target sizes, smart detection and filters), so that cheap requests run before expensive ones. '
+    'Set to 0 to run requests in arrival order', 'Imaging')
+
+Config.define(
+    'ENGINE_QUEUE_RETRY_AFTER', 1,
+    'Value in seconds of the Retry-After header sent with requests rejected by the engine thread pool', 'Imaging')
+
+Config.define(
+    'ENGINE_EXECUTOR', 'thread',
+    'Where image decoding, transformations and encoding run. Use \'thread\' to run them in the IOLoop process '
+    '(in the thread pool if ENGINE_THREADPOOL_SIZE is set) or \'process\' to ship the source image and the '
+    'request parameters to a pool of worker processes, leaving only networking and caching to the IOLoop '
+    'process', 'Imaging')
+
+Config.define(
+    'ENGINE_PROCESSPOOL_SIZE', 0,
+    'Number of worker processes used when ENGINE_EXECUTOR is \'process\'. The default value is 0 (one worker '
+    'per CPU)', 'Imaging')
+
+Config.define(
+    'REQUEST_DEADLINE', 0,
+    'Number of seconds after which generating an image stops and the request fails with a 504. Requests '
+    'also stop when the client closes the connection. The default value is 0 (no deadline)', 'Imaging')
+
+Config.define(
+    'REQUEST_DEADLINE_HEADER', None,
+    'Name of a request header holding a number of seconds to use as deadline when it is lower than '
+    'REQUEST_DEADLINE (e.g. \'X-Request-Timeout\'). The default value is None (the header is ignored)', 'Imaging')
+
 Config.define(
     'METRICS', 'thumbor.metrics.logger_metrics',
     'The metrics backend thumbor should use to measure internal actions. This must be the full name of a python module ' +
@@ -116,6 +172,27 @@ Config.define(
     'STORAGE', 'thumbor.storages.file_storage',
     'The file storage thumbor should use to store original images. This must be the full name of a python module ' +
     '(python must be able to import it)', 'Extensibility')
+Config.define(
+    'FILE_IO_THREADPOOL_SIZE', 0,
+    'Size of the thread pool used for the disk operations of the file storage, the file result storage and the '
+    'file loader. The default value is 0 (they run on the IOLoop). Increase this if the images are kept on a '
+    'slow (e.g. network) filesystem', 'Storage')
+Config.define(
+    'NEGATIVE_CACHE_NOT_FOUND_SECONDS', 0,
+    'Number of seconds during which originals the loader did not find are answered with a 404 without '
+    'calling the loader again. The default value is 0 (not found errors are not cached)', 'Storage')
+Config.define(
+    'NEGATIVE_CACHE_TIMEOUT_SECONDS', 0,
+    'Number of seconds during which originals the loader timed out on are answered with a 504 without '
+    'calling the loader again. The default value is 0 (timeouts are not cached)', 'Storage')
+Config.define(
+    'NEGATIVE_CACHE_MAX_ENTRIES', 10000,
+    'Maximum number of loader errors kept in memory by each thumbor process', 'Storage')
+Config.define(
+    'NEGATIVE_CACHE_USE_STORAGE', False,
+    'Indicates whether loader errors should also be kept in the storage, to share them between thumbor '
+    'processes', 'Storage')
+
 Config.define(
     'RESULT_STORAGE', None,
     'The result storage thumbor should use to store generated images. This must be the full name of a python ' +
@@ -134,6 +211,10 @@ Config.define('SECURITY_KEY', 'MY_SECURE_KEY', 'The security key thumbor uses to
 
 Config.define('ALLOW_UNSAFE_URL', True, 'Indicates if the /unsafe URL should be available', 'Security')
 Config.define('ALLOW_OLD_URLS', True, 'Indicates if encrypted (old style) URLs should be allowed', 'Security')
+Config.define(
+    'PARSED_URL_CACHE_SIZE', 0,
+    'Number of valid image URLs whose signature check and parsing each thumbor process keeps in memory. Least '
+    'recently used URLs are evicted first. The default value is 0 (no cache)', 'Security')
 Config.define('ENABLE_ETAGS', True, 'Enables automatically generated etags', 'HTTP')
 Config.define('MAX_ID_LENGTH', 32, 'Set maximum id length for images when stored', 'Storage')
 Config.define('GC_INTERVAL', None, 'Set garbage collection interval in seconds', 'Performance')
@@ -142,6 +223,10 @@ Config.define('GC_INTERVAL', None, 'Set garbage collection interval in seconds',
 Config.define('STATSD_HOST', None, 'Host to send statsd instrumentation to', 'Metrics')
 Config.define('STATSD_PORT', 8125, 'Port to send statsd instrumentation to', 'Metrics')
 Config.define('STATSD_PREFIX', None, 'Prefix for statsd', 'Metrics')
+Config.define(
+    'METRICS_PER_WORKER', False,
+    'When running with more than one process (--processes), also reports every metric prefixed with worker.<id>.',
+    'Metrics')
 
 # FILE LOADER OPTIONS
 Config.define('FILE_LOADER_ROOT_PATH', home, 'The root path where the File Loader will try to find images', 'File Loader')
@@ -201,6 +286,47 @@ Config.define(
 Config.define(
     'HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT', False,
     'If the CurlAsyncHTTPClient should be used', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_MAX_BODY_SIZE', 0,
+    'The maximum size in bytes of images downloaded by the HTTP Loader. When set, images are streamed and the '
+    'download is aborted as soon as it is over that size or as soon as the image headers show more than '
+    'MAX_PIXELS pixels. The default value is 0 (images are downloaded at once without limit)', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_MAX_CONNECTIONS_PER_HOST', 0,
+    'The maximum number of simultaneous connections the loader keeps open to each origin host when the '
+    'CurlAsyncHTTPClient is used. The default value is 0 (only limited by HTTP_LOADER_MAX_CLIENTS)', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_MAX_CLIENTS_PER_HOST', 0,
+    'The maximum number of simultaneous requests the HTTP loader makes to each origin host before queuing them. '
+    'The default value is 0 (only limited by HTTP_LOADER_MAX_CLIENTS)', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_CIRCUIT_BREAKER_ERRORS', 0,
+    'Number of consecutive errors or timeouts of an origin host after which the HTTP loader stops requesting it '
+    'and fails right away. The default value is 0 (disabled)', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_CIRCUIT_BREAKER_RESET_TIMEOUT', 30,
+    'Number of seconds between the requests the HTTP loader sends to probe an origin host it stopped requesting',
+    'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_HEDGE_PERCENTILE', 0,
+    'Percentile of the response times of an origin host after which the HTTP loader sends a request that did not '
+    'get an answer yet a second time, using the first response. The default value is 0 (disabled)', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_HEDGE_MIN_DELAY', 0.05,
+    'Minimum number of seconds after which the HTTP loader sends a request a second time', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_MAX_RETRIES', 0,
+    'Number of times the HTTP loader sends a request again after a 5xx response or a connection error. '
+    'The default value is 0 (no retries)', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_RETRY_BACKOFF', 0.1,
+    'Number of seconds the HTTP loader waits for at most before the first retry of a request, doubled for each '
+    'following retry. The actual wait is random, up to that value', 'HTTP Loader')
+Config.define(
+    'HTTP_LOADER_CONNECTION_IDLE_TIMEOUT', 0,
+    'Number of seconds after which idle connections to origin hosts are closed instead of being reused when the '
+    'CurlAsyncHTTPClient is used. Requires libcurl 7.65.0 or later. The default value is 0 (libcurl default)',
+    'HTTP Loader')
 Config.define(
     'HTTP_LOADER_CURL_LOW_SPEED_TIME', 0,
     'If HTTP_LOADER_CURL_LOW_SPEED_LIMIT and HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT ' +
@@ -225,6 +351,37 @@ Config.define(
 Config.define(
     'FILE_STORAGE_ROOT_PATH', join(tempfile.gettempdir(), 'thumbor', 'storage'),
     'The root path where the File Storage will try to find images', 'File Storage')
+Config.define(
+    'FILE_STORAGE_MAX_SIZE', 0,
+    'Maximum size in bytes of the images kept by the File Storage under FILE_STORAGE_ROOT_PATH. Least recently used '
+    'images are deleted in the background above it. The default value is 0 (no limit)', 'File Storage')
+Config.define(
+    'FILE_STORAGE_MAX_FILES', 0,
+    'Maximum number of images kept by the File Storage under FILE_STORAGE_ROOT_PATH. Least recently used images are '
+    'deleted in the background above it. The default value is 0 (no limit)', 'File Storage')
+Config.define(
+    'DISK_CACHE_JANITOR_INTERVAL', 10,
+    'Number of seconds between the runs of the background task keeping the file storages within their limits',
+    'File Storage')
+Config.define(
+    'DISK_CACHE_JANITOR_BATCH_SIZE', 1000,
+    'Maximum number of files looked at and of files deleted by each run of the background task keeping the file '
+    'storages within their limits', 'File Storage')
+
+# SQLITE STORAGE OPTIONS
+Config.define(
+    'SQLITE_STORAGE_PATH', join(tempfile.gettempdir(), 'thumbor', 'storage.db'),
+    'Path of the database where the SQLite Storage keeps crypto keys and detector data', 'SQLite Storage')
+Config.define(
+    'SQLITE_STORAGE_CACHE_SIZE', 10000,
+    'Number of recently used records the SQLite Storage keeps in memory. 0 disables the cache', 'SQLite Storage')
+Config.define(
+    'SQLITE_STORAGE_BATCH_SIZE', 100,
+    'Number of pending records after which the SQLite Storage writes them in one transaction', 'SQLite Storage')
+Config.define(
+    'SQLITE_STORAGE_FLUSH_INTERVAL', 1,
+    'Number of seconds between writes of the pending records of the SQLite Storage. 0 writes each record '
+    'right away', 'SQLite Storage')
 
 # PHOTO UPLOAD OPTIONS
 Config.define('UPLOAD_MAX_SIZE', 0, "Max size in Kb for images uploaded to thumbor", 'Upload')
@@ -245,6 +402,17 @@ Config.alias('ALLOW_ORIGINAL_PHOTO_PUTTING', 'UPLOAD_PUT_ALLOWED')
 
 # MEMCACHE STORAGE OPTIONS
 Config.define('MEMCACHE_STORAGE_SERVERS', ['localhost:11211'], 'List of Memcache storage server hosts', 'Memcache Storage')
+Config.define(
+    'MEMCACHE_STORAGE_MAX_CONNECTIONS', 4,
+    'Maximum number of connections to each Memcache storage server', 'Memcache Storage')
+Config.define(
+    'MEMCACHE_STORAGE_TIMEOUT', 1,
+    'Number of seconds after which operations of the Memcache storage fail (images are then not found)',
+    'Memcache Storage')
+Config.define(
+    'MEMCACHE_STORAGE_ITEM_SIZE', 1000000,
+    'Maximum size in bytes of the items the Memcache storage stores. Bigger images are split in several items. '
+    'It must be lower than the item size limit of the servers (1MB by default)', 'Memcache Storage')
 
 # MIXED STORAGE OPTIONS
 Config.define(
@@ -347,9 +515,48 @@ Config.define(
 Config.define(
     'RESULT_STORAGE_FILE_STORAGE_ROOT_PATH', join(tempfile.gettempdir(), 'thumbor', 'result_storage'),
     'Path where the Result storage will store generated images', 'Result Storage')
+Config.define(
+    'RESULT_STORAGE_FILE_STORAGE_MAX_SIZE', 0,
+    'Maximum size in bytes of the images kept by the File Result Storage. Least recently used images are deleted '
+    'in the background above it. The default value is 0 (no limit)', 'Result Storage')
+Config.define(
+    'RESULT_STORAGE_FILE_STORAGE_MAX_FILES', 0,
+    'Maximum number of images kept by the File Result Storage. Least recently used images are deleted in the '
+    'background above it. The default value is 0 (no limit)', 'Result Storage')
 Config.define(
     'RESULT_STORAGE_STORES_UNSAFE', False,
     'Indicates whether unsafe requests should also be stored in the Result Storage', 'Result Storage')
+Config.define(
+    'RESULT_STORAGE_MEMORY_CACHE_SIZE', 0,
+    'Maximum size in bytes of the in-memory cache of generated images checked before the Result Storage. Least '
+    'recently used images are evicted first and images expire after RESULT_STORAGE_EXPIRATION_SECONDS. '
+    'The default value is 0 (no in-memory cache)', 'Result Storage')
+Config.define(
+    'RESULT_STORAGE_MAX_PENDING_WRITES', 100,
+    'Maximum number of images waiting to be written by the file result storage when FILE_IO_THREADPOOL_SIZE is '
+    'set. Further images are not stored. 0 means no limit', 'Result Storage')
+Config.define(
+    'RESULT_COALESCING', True,
+    'Indicates whether identical requests arriving while an image is being generated should wait for it and reuse its '
+    'result and headers instead of generating it again', 'Result Storage')
+
+# REDIS RESULT STORAGE OPTIONS
+Config.define(
+    'REDIS_RESULT_STORAGE_SERVER_HOST', 'localhost', 'Server host for the Redis Result Storage', 'Redis Result Storage')
+Config.define(
+    'REDIS_RESULT_STORAGE_SERVER_PORT', 6379, 'Server port for the Redis Result Storage', 'Redis Result Storage')
+Config.define(
+    'REDIS_RESULT_STORAGE_SERVER_DB', 0, 'Server database index for the Redis Result Storage', 'Redis Result Storage')
+Config.define(
+    'REDIS_RESULT_STORAGE_SERVER_PASSWORD', None, 'Server password for the Redis Result Storage',
+    'Redis Result Storage')
+Config.define(
+    'REDIS_RESULT_STORAGE_MAX_CONNECTIONS', 4,
+    'Maximum number of connections to the Redis Result Storage server', 'Redis Result Storage')
+Config.define(
+    'REDIS_RESULT_STORAGE_TIMEOUT', 1,
+    'Number of seconds after which operations of the Redis Result Storage fail (images are then not found)',
+    'Redis Result Storage')
 
 # QUEUED DETECTOR REDIS OPTIONS
 Config.define('REDIS_QUEUE_SERVER_HOST', 'localhost', 'Server host for the queued redis detector', 'Queued Redis Detector')
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from datetime import timedelta
+
+from tornado import gen, locks
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+
+class ConnectionPool(object):
+    '''
+    Connections to one server: at most max_connections are open, idle ones
+    are kept for the next operations. If given, prepare is a coroutine run
+    on each new connection before it is used (to authenticate, for instance).
+    '''
+
+    def __init__(self, server, max_connections=4, default_port=None, prepare=None):
+        host, _, port = server.partition(':')
+        self.host = host
+        self.port = int(port or default_port)
+        self.prepare = prepare
+        self.idle = []
+        self.semaphore = locks.Semaphore(max_connections)
+
+    @gen.coroutine
+    def acquire(self, timeout):
+        yield self.semaphore.acquire(timeout=timedelta(seconds=timeout))
+
+        stream = None
+        while self.idle and stream is None:
+            stream = self.idle.pop()
+            if stream.closed():
+                stream = None
+
+        if stream is None:
+            try:
+                stream = yield gen.with_timeout(
+                    timedelta(seconds=timeout),
+                    self.connect(),
+                    quiet_exceptions=(StreamClosedError, IOError)
+                )
+            except Exception:
+                self.semaphore.release()
+                raise
+
+        raise gen.Return(stream)
+
+    @gen.coroutine
+    def connect(self):
+        stream = yield TCPClient().connect(self.host, self.port)
+        stream.set_nodelay(True)
+
+        if self.prepare is not None:
+            try:
+                yield self.prepare(stream)
+            except Exception:
+                stream.close()
+                raise
+
+        raise gen.Return(stream)
+
+    def release(self, stream, reuse=True):
+        if reuse and not stream.closed():
+            self.idle.append(stream)
+        else:
+            stream.close()
+        self.semaphore.release()
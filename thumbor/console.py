@@ -38,6 +38,12 @@ def get_server_parameters(arguments=None):
         "[default: %(default)s]."
     )
 
+    parser.add_argument(
+        '-n', '--processes', default=1, type=int,
+        help="Number of processes to fork, sharing the listening socket. 0 forks one process per CPU "
+        "[default: %(default)s]."
+    )
+
     parser.add_argument(
         '-c', '--conf', default=None,
         help="The path of the configuration file to use for this thumbor instance [default: %(default)s]."
@@ -73,4 +79,5 @@ def get_server_parameters(arguments=None):
                             log_level=options.log_level,
                             app_class=options.app,
                             debug=options.debug,
-                            fd=options.fd)
+                            fd=options.fd,
+                            processes=options.processes)
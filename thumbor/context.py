@@ -10,11 +10,24 @@
 
 from os.path import abspath, exists
 import tornado
-from concurrent.futures import ThreadPoolExecutor, Future
+import tornado.concurrent
+import tornado.ioloop
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+import copy
 import functools
+import heapq
+import itertools
+import multiprocessing
+import threading
+import time
 
 from thumbor.filters import FiltersFactory
+from thumbor.metrics import WorkerMetrics
 from thumbor.metrics.logger_metrics import Metrics
+from thumbor.blacklist import Blacklist
+from thumbor.negative_cache import NegativeCache
+from thumbor.result_cache import ResultCache
+from thumbor.url_cache import ParsedUrlCache
 from thumbor.utils import logger
 
 try:
@@ -47,6 +60,10 @@ class Context:
             self.modules = None
             self.metrics = Metrics(config)
 
+        worker_id = getattr(server, 'worker_id', None)
+        if worker_id is not None and getattr(config, 'METRICS_PER_WORKER', False):
+            self.metrics = WorkerMetrics(self.metrics, worker_id)
+
         self.app_class = 'thumbor.app.ThumborServiceApp'
 
         if hasattr(self.config, 'APP_CLASS'):
@@ -58,7 +75,34 @@ class Context:
         self.filters_factory = FiltersFactory(self.modules.filters if self.modules else [])
         self.request_handler = request_handler
         self.statsd_client = self.metrics  # TODO statsd_client is deprecated, remove me on next minor version bump
-        self.thread_pool = ThreadPool.instance(getattr(config, 'ENGINE_THREADPOOL_SIZE', 0))
+        self.thread_pool = ThreadPool.instance(
+            getattr(config, 'ENGINE_THREADPOOL_SIZE', 0),
+            getattr(config, 'ENGINE_QUEUE_MAX_SIZE', 0),
+            getattr(config, 'ENGINE_QUEUE_MAX_WAIT', 0),
+            getattr(config, 'ENGINE_QUEUE_COST_WEIGHT', 0),
+        )
+        self.process_pool = None
+        if getattr(config, 'ENGINE_EXECUTOR', 'thread') == 'process':
+            self.process_pool = ProcessPool.instance(getattr(config, 'ENGINE_PROCESSPOOL_SIZE', 0), self)
+        self.result_cache = None
+        if getattr(config, 'RESULT_STORAGE_MEMORY_CACHE_SIZE', 0):
+            self.result_cache = ResultCache.instance(
+                config.RESULT_STORAGE_MEMORY_CACHE_SIZE,
+                getattr(config, 'RESULT_STORAGE_EXPIRATION_SECONDS', 0),
+            )
+        self.negative_cache = None
+        if getattr(config, 'NEGATIVE_CACHE_NOT_FOUND_SECONDS', 0) or getattr(config, 'NEGATIVE_CACHE_TIMEOUT_SECONDS', 0):
+            self.negative_cache = NegativeCache.instance(config.NEGATIVE_CACHE_MAX_ENTRIES)
+        self.url_cache = None
+        if getattr(config, 'PARSED_URL_CACHE_SIZE', 0):
+            self.url_cache = ParsedUrlCache.instance(config.PARSED_URL_CACHE_SIZE)
+        self.blacklist = None
+        if getattr(config, 'USE_BLACKLIST', False):
+            self.blacklist = Blacklist.instance(config.BLACKLIST_REFRESH_INTERVAL)
+        self.io_executor = IOExecutor.instance(
+            getattr(config, 'FILE_IO_THREADPOOL_SIZE', 0),
+            getattr(config, 'RESULT_STORAGE_MAX_PENDING_WRITES', 0),
+        )
         self.headers = {}
 
     def __enter__(self):
@@ -69,10 +113,12 @@ class Context:
             self.modules.cleanup()
 
         self.thread_pool.cleanup()
+        self.io_executor.cleanup()
 
 
 class ServerParameters(object):
-    def __init__(self, port, ip, config_path, keyfile, log_level, app_class, debug=False, fd=None, gifsicle_path=None):
+    def __init__(self, port, ip, config_path, keyfile, log_level, app_class, debug=False, fd=None, gifsicle_path=None,
+                 processes=1):
         self.port = port
         self.ip = ip
         self.config_path = config_path
@@ -84,6 +130,8 @@ class ServerParameters(object):
         self.fd = fd
         self.load_security_key()
         self.gifsicle_path = gifsicle_path
+        self.processes = processes
+        self.worker_id = None
 
     @property
     def security_key(self):
@@ -200,6 +248,12 @@ class RequestParameters:
         self.accepts_webp = accepts_webp
         self.max_bytes = None
         self.max_age = max_age
+        self.cost = 0
+        self.source_validators = None
+        # url -> what the storage keeps for it, see BaseHandler._get_stored
+        self.stored = {}
+        self.deadline = None
+        self.cancelled = False
 
         if request:
             self.url = request.path
@@ -208,6 +262,28 @@ class RequestParameters:
     def int_or_0(self, value):
         return 0 if value is None else int(value)
 
+    def copy_for(self, request):
+        '''
+        Returns a copy of these parameters for another request to the same
+        url, in the state they were parsed in.
+        '''
+        params = copy.copy(self)
+        params.crop = dict(self.crop)
+        params.focal_points = list(self.focal_points)
+        if isinstance(self.filters, list):
+            params.filters = list(self.filters)
+        params.stored = {}
+        params.url = request.path
+        params.accepts_webp = 'image/webp' in request.headers.get('Accept', '')
+        return params
+
+    def is_cancelled(self):
+        '''
+        Whether the client went away or the deadline of the request passed, in
+        which case generating the image should stop.
+        '''
+        return self.cancelled or (self.deadline is not None and time.time() > self.deadline)
+
 
 class ContextImporter:
     def __init__(self, context, importer):
@@ -245,26 +321,57 @@ class ContextImporter:
             self.engine.cleanup()
 
 
+class EngineBusyError(RuntimeError):
+    """
+    Raised when a request is not admitted in the engine thread pool, either
+    because its queue is full or because the request waited too long in it.
+    """
+
+
+class RequestCancelledError(RuntimeError):
+    """
+    Raised when an operation of a cancelled request (see
+    RequestParameters.is_cancelled) is skipped.
+    """
+
+
 class ThreadPool(object):
 
     @classmethod
-    def instance(cls, size):
+    def instance(cls, size, max_queue_size=0, max_queue_wait=0, cost_weight=0):
         """
         Cache threadpool since context is
         recreated for each request
         """
         if not getattr(cls, "_instance", None):
             cls._instance = {}
-        if size not in cls._instance:
-            cls._instance[size] = ThreadPool(size)
-        return cls._instance[size]
+        key = (size, max_queue_size, max_queue_wait, cost_weight)
+        if key not in cls._instance:
+            cls._instance[key] = ThreadPool(size, max_queue_size, max_queue_wait, cost_weight)
+        return cls._instance[key]
 
-    def __init__(self, thread_pool_size):
+    def __init__(self, thread_pool_size, max_queue_size=0, max_queue_wait=0, cost_weight=0):
         if thread_pool_size:
             self.pool = ThreadPoolExecutor(thread_pool_size)
         else:
             self.pool = None
 
+        self.size = thread_pool_size
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self.cost_weight = cost_weight
+
+        # Tasks are only handed to the executor when a thread is free, so
+        # that they can be scheduled by cost instead of in arrival order.
+        self.pending = []
+        self.running = 0
+        self.queue_lock = threading.Lock()
+        self.sequence = itertools.count()
+
+    @property
+    def queue_size(self):
+        return len(self.pending)
+
     def _execute_in_foreground(self, operation, callback):
         result = Future()
         returned = None
@@ -279,21 +386,251 @@ class ThreadPool(object):
 
         callback(result)
 
-    def _execute_in_pool(self, operation, callback):
-        task = self.pool.submit(operation)
-        task.add_done_callback(
-            lambda future: tornado.ioloop.IOLoop.instance().add_callback(
-                functools.partial(callback, future)
+    def _reject(self, callback, metrics, message):
+        logger.warn('[ThreadPool] %s', message)
+        if metrics is not None:
+            metrics.incr('engine.queue.rejected')
+
+        result = Future()
+        result.set_exception(EngineBusyError(message))
+        callback(result)
+
+    def _dispatch(self):
+        tasks = []
+        with self.queue_lock:
+            while self.pending and self.running < self.size:
+                tasks.append(heapq.heappop(self.pending)[2])
+                self.running += 1
+
+        for submit in tasks:
+            submit()
+
+    def _task_done(self):
+        with self.queue_lock:
+            self.running -= 1
+        self._dispatch()
+
+    def _execute_in_pool(self, operation, callback, admission=False, metrics=None, cost=0, is_cancelled=None):
+        if admission and self.max_queue_size and self.queue_size >= self.max_queue_size:
+            self._reject(callback, metrics, 'Engine queue is full ({0} tasks)'.format(self.queue_size))
+            return
+
+        queued_at = time.time()
+        waits = []
+
+        def run():
+            try:
+                wait = time.time() - queued_at
+                waits.append(wait)
+
+                # Upstream has probably given up on this request already
+                if admission and self.max_queue_wait and wait > self.max_queue_wait:
+                    raise EngineBusyError('Task waited {0:.3f}s in the engine queue'.format(wait))
+
+                if is_cancelled is not None and is_cancelled():
+                    raise RequestCancelledError('Request was cancelled while waiting in the engine queue')
+
+                return operation()
+            finally:
+                self._task_done()
+
+        def done(future):
+            if metrics is not None and waits:
+                metrics.timing('engine.queue.wait', waits[0] * 1000)
+                if isinstance(future.exception(), EngineBusyError):
+                    metrics.incr('engine.queue.rejected')
+            callback(future)
+
+        io_loop = tornado.ioloop.IOLoop.current()
+
+        def submit():
+            task = self.pool.submit(run)
+            task.add_done_callback(
+                lambda future: io_loop.add_callback(
+                    functools.partial(done, future)
+                )
             )
-        )
 
-    def queue(self, operation, callback):
+        # Cheaper tasks run first, but each queued second outweighs
+        # 1 / cost_weight of cost, so expensive tasks are not starved.
+        deadline = queued_at + cost * self.cost_weight
+        with self.queue_lock:
+            heapq.heappush(self.pending, (deadline, next(self.sequence), submit))
+            queue_size = len(self.pending)
+
+        if metrics is not None:
+            metrics.timing('engine.queue.depth', queue_size)
+
+        self._dispatch()
+
+    def queue(self, operation, callback, admission=False, metrics=None, cost=0, is_cancelled=None):
+        """
+        Runs operation in the thread pool (or in the foreground if there is no
+        pool) and calls callback with a future of its result.
+
+        Queued operations are run by increasing estimated cost (see
+        BaseHandler.estimate_cost) weighted against their time in the queue.
+        When admission is True, the operation is the first one of a request and
+        fails with EngineBusyError if the queue is full or if it waited more than
+        the maximum queue wait. Operations for which is_cancelled() is True once
+        they leave the queue fail with RequestCancelledError instead of running.
+        Queue metrics are reported to metrics, if given.
+        """
         if not self.pool:
             self._execute_in_foreground(operation, callback)
         else:
-            self._execute_in_pool(operation, callback)
+            self._execute_in_pool(operation, callback, admission, metrics, cost, is_cancelled)
 
     def cleanup(self):
         if self.pool:
             print("Joining threads....")
             self.pool.shutdown()
+
+
+class IOExecutor(object):
+    """
+    Runs the disk operations of the file storages and of the file loader.
+    With a size of 0 they run right away on the calling thread, otherwise in
+    a dedicated thread pool so that a slow filesystem does not block the
+    IOLoop.
+    """
+
+    @classmethod
+    def instance(cls, size, max_pending_writes=0):
+        if not getattr(cls, "_instance", None):
+            cls._instance = {}
+        key = (size, max_pending_writes)
+        if key not in cls._instance:
+            cls._instance[key] = IOExecutor(size, max_pending_writes)
+        return cls._instance[key]
+
+    def __init__(self, size, max_pending_writes=0):
+        if size:
+            self.pool = ThreadPoolExecutor(size)
+        else:
+            self.pool = None
+
+        self.size = size
+        self.max_pending_writes = max_pending_writes
+        self.pending_writes = 0
+        self.lock = threading.Lock()
+
+    def run(self, operation, *args):
+        """
+        Returns a tornado Future of the result of operation(*args).
+        Without a pool, errors of operation are raised right away.
+        """
+        result = tornado.concurrent.Future()
+        if not self.pool:
+            result.set_result(operation(*args))
+            return result
+
+        tornado.ioloop.IOLoop.current().add_future(
+            self.pool.submit(operation, *args),
+            lambda future: tornado.concurrent.chain_future(future, result)
+        )
+        return result
+
+    def submit(self, callback, operation, *args):
+        """
+        Calls callback with the result of operation(*args), right away if there
+        is no pool or on the IOLoop once the operation is done otherwise.
+        """
+        if not self.pool:
+            callback(operation(*args))
+            return
+
+        tornado.ioloop.IOLoop.current().add_future(
+            self.pool.submit(operation, *args),
+            lambda future: callback(future.result())
+        )
+
+    def write_behind(self, operation, *args):
+        """
+        Runs operation(*args) without waiting for it. When max_pending_writes
+        operations are already queued or running, it is dropped and False is
+        returned.
+        """
+        if not self.pool:
+            operation(*args)
+            return True
+
+        with self.lock:
+            if self.max_pending_writes and self.pending_writes >= self.max_pending_writes:
+                return False
+            self.pending_writes += 1
+
+        def write():
+            try:
+                operation(*args)
+            except Exception as e:
+                logger.exception('[IOExecutor] %s', e)
+            finally:
+                with self.lock:
+                    self.pending_writes -= 1
+
+        self.pool.submit(write)
+        return True
+
+    def cleanup(self):
+        if self.pool:
+            self.pool.shutdown()
+        if getattr(IOExecutor, '_instance', None):
+            IOExecutor._instance.pop((self.size, self.max_pending_writes), None)
+
+
+class ProcessPool(object):
+
+    @classmethod
+    def instance(cls, size, context=None):
+        """
+        Cache process pool since context is
+        recreated for each request
+        """
+        if not getattr(cls, "_instance", None):
+            cls._instance = {}
+        if size not in cls._instance:
+            cls._instance[size] = ProcessPool(size, context.server, context.config, context.modules.importer)
+        return cls._instance[size]
+
+    def __init__(self, process_pool_size, server, config, importer):
+        # Workers are forked from this process, so they inherit the server
+        # parameters, configuration and imported modules stored here.
+        self.size = process_pool_size
+        self.server = server
+        self.config = config
+        self.importer = importer
+        self._pool = None
+
+    @property
+    def pool(self):
+        # Created on first use, so that server processes forked after the
+        # context was created do not share the executor queues.
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.size or multiprocessing.cpu_count())
+        return self._pool
+
+    def create_context(self):
+        """
+        Creates a context in a worker process. Image operations run in the
+        foreground, as the worker has no thread pool nor process pool of its own.
+        """
+        context = Context(server=self.server, config=self.config, importer=self.importer)
+        context.thread_pool = ThreadPool.instance(0)
+        context.process_pool = None
+        return context
+
+    def submit(self, operation, *args):
+        """
+        Runs operation(pool_size, *args) in a worker process. Both the operation
+        and its arguments must be picklable.
+
+        :return: A future resolved with what the operation returned
+        :rtype: concurrent.futures.Future
+        """
+        return self.pool.submit(operation, self.size, *args)
+
+    def cleanup(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        ProcessPool._instance.pop(self.size, None)
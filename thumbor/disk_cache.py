@@ -0,0 +1,264 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import errno
+import heapq
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from os.path import join
+
+import tornado.ioloop
+
+from thumbor.context import IOExecutor
+from thumbor.utils import logger
+
+
+class DiskCacheJanitor(object):
+    """
+    Keeps the images under root_path below max_size bytes and max_files
+    files (0 means no limit) and deletes the images older than expiration
+    seconds (None or 0 means never). Files ending with METADATA_SUFFIX, such
+    as the crypto keys, the detector data or blacklist.txt, are left alone,
+    as are the temporary files the storages are writing.
+
+    It keeps an index of the sizes of the images, filled by the storages as
+    they write and read images and by a scan of root_path that goes through
+    batch_size files at each run. The least recently used images are evicted
+    first: the ones found by the scan, used by other processes or before a
+    restart, are ranked by their last access or modification time. Runs
+    happen every few seconds on the I/O executor, see start.
+    """
+
+    METADATA_SUFFIX = '.txt'
+    # Files the storages are writing, see their write_file
+    TEMP_FILE_RE = re.compile(r'\.[0-9a-f]{32}$')
+
+    _instances = {}
+
+    @classmethod
+    def instance(cls, root_path, max_size=0, max_files=0, expiration=None, batch_size=1000):
+        key = (root_path, max_size, max_files, expiration, batch_size)
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = cls._instances[key] = cls(*key)
+        return instance
+
+    @classmethod
+    def for_context(cls, context, root_path, max_size, max_files, expiration):
+        """
+        Returns the started janitor of root_path or None if it has no limits.
+        """
+        if not max_size and not max_files:
+            return None
+
+        config = context.config
+        janitor = cls.instance(root_path, max_size, max_files, expiration, config.DISK_CACHE_JANITOR_BATCH_SIZE)
+        janitor.start(context.io_executor, config.DISK_CACHE_JANITOR_INTERVAL, context.metrics)
+        return janitor
+
+    def __init__(self, root_path, max_size=0, max_files=0, expiration=None, batch_size=1000):
+        self.root_path = root_path
+        self.max_size = max_size
+        self.max_files = max_files
+        self.expiration = expiration
+        self.batch_size = batch_size
+
+        # path -> [size, number of the scan that last saw it, last use time]
+        self.scanned = {}
+        # (last use time, path) of the scanned files, stale items included
+        self.scanned_order = []
+        self.used = OrderedDict()
+        self.size = 0
+        self.scans = 0
+        self.walker = None
+        self.lock = threading.Lock()
+        self.running = False
+        self.periodic_callback = None
+
+    def __len__(self):
+        return len(self.scanned) + len(self.used)
+
+    @property
+    def over_limits(self):
+        return bool(
+            (self.max_size and self.size > self.max_size) or
+            (self.max_files and len(self) > self.max_files)
+        )
+
+    def start(self, executor, interval, metrics=None):
+        """
+        Runs the janitor on executor every interval seconds, on the current
+        IOLoop. Reports the deleted files to metrics.
+        """
+        if self.periodic_callback is not None:
+            return
+
+        if executor.pool is None:
+            # Without an I/O thread pool the runs would block the IOLoop
+            executor = IOExecutor(1)
+
+        def done(future):
+            self.running = False
+            if future.exception() is not None:
+                logger.error('[DiskCacheJanitor] %s', future.exception())
+                return
+
+            expired, evicted = future.result()
+            if metrics is not None:
+                if expired:
+                    metrics.incr('disk_cache.expired', expired)
+                if evicted:
+                    metrics.incr('disk_cache.evicted', evicted)
+
+        def run():
+            if self.running:
+                return
+            self.running = True
+            tornado.ioloop.IOLoop.current().add_future(executor.run(self.run), done)
+
+        self.periodic_callback = tornado.ioloop.PeriodicCallback(run, interval * 1000)
+        self.periodic_callback.start()
+
+    def record(self, path, size):
+        """
+        Indexes the file a storage wrote at path.
+        """
+        with self.lock:
+            self._forget(path)
+            self.used[path] = [size, self.scans, time.time()]
+            self.size += size
+
+    def touch(self, path):
+        """
+        Marks the indexed file at path as the most recently used one.
+        """
+        with self.lock:
+            entry = self.used.pop(path, None) or self.scanned.pop(path, None)
+            if entry is not None:
+                entry[2] = time.time()
+                self.used[path] = entry
+
+    def forget(self, path):
+        with self.lock:
+            self._forget(path)
+
+    def run(self):
+        """
+        Scans and evicts up to batch_size files each. Returns the number of
+        expired and of evicted files.
+        """
+        expired = self.scan(self.batch_size)
+        evicted = self.evict(self.batch_size)
+        return expired, evicted
+
+    def scan(self, count):
+        """
+        Indexes the next count files of root_path and deletes the expired
+        ones. Once every file was seen, the files that disappeared are
+        dropped from the index and the scan starts over.
+        """
+        if self.walker is None:
+            self.walker = self._walk()
+
+        expired = 0
+        now = time.time()
+        for i in range(count):
+            try:
+                path, stat = next(self.walker)
+            except StopIteration:
+                self._end_scan()
+                break
+
+            if self.expiration and now - stat.st_mtime > self.expiration:
+                self.forget(path)
+                self._remove(path)
+                expired += 1
+                continue
+
+            with self.lock:
+                entry = self.used.get(path) or self.scanned.get(path)
+                if entry is None:
+                    used_at = max(stat.st_atime, stat.st_mtime)
+                    self.scanned[path] = [stat.st_size, self.scans, used_at]
+                    heapq.heappush(self.scanned_order, (used_at, path))
+                    self.size += stat.st_size
+                else:
+                    self.size += stat.st_size - entry[0]
+                    entry[0] = stat.st_size
+                    entry[1] = self.scans
+
+        return expired
+
+    def evict(self, count):
+        """
+        Deletes up to count files, least recently used first, until the index
+        is within the limits.
+        """
+        evicted = 0
+        while evicted < count:
+            with self.lock:
+                if not self.over_limits:
+                    break
+                path = self._least_recently_used()
+                entry = self.used.pop(path, None) or self.scanned.pop(path)
+                self.size -= entry[0]
+
+            self._remove(path)
+            evicted += 1
+
+        return evicted
+
+    def _least_recently_used(self):
+        order = self.scanned_order
+        while order and self.scanned.get(order[0][1], (None, None, None))[2] != order[0][0]:
+            heapq.heappop(order)
+
+        used = next(iter(self.used.items()), None)
+        if not order or (used is not None and used[1][2] < order[0][0]):
+            return used[0]
+        return heapq.heappop(order)[1]
+
+    def _forget(self, path):
+        entry = self.used.pop(path, None) or self.scanned.pop(path, None)
+        if entry is not None:
+            self.size -= entry[0]
+
+    def _walk(self):
+        for dirpath, dirnames, filenames in os.walk(self.root_path):
+            for name in filenames:
+                if name.endswith(self.METADATA_SUFFIX) or self.TEMP_FILE_RE.search(name):
+                    continue
+                path = join(dirpath, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    continue
+
+    def _end_scan(self):
+        with self.lock:
+            for entries in (self.scanned, self.used):
+                for path, entry in list(entries.items()):
+                    if entry[1] < self.scans:
+                        del entries[path]
+                        self.size -= entry[0]
+            self.scanned_order = [(entry[2], path) for path, entry in self.scanned.items()]
+            heapq.heapify(self.scanned_order)
+            self.scans += 1
+        self.walker = None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                logger.warn('[DiskCacheJanitor] unable to remove %s: %s', path, err)
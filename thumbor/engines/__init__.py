@@ -23,11 +23,15 @@ except ImportError:
     METADATA_AVAILABLE = False
 
 import re
+import struct
 
 from thumbor.utils import logger, EXTENSION
 
 WEBP_SIDE_LIMIT = 16383
 
+# Start of frame markers, which hold the dimensions of JPEG images
+JPEG_SOF_MARKERS = set(range(0xc0, 0xd0)) - set([0xc4, 0xc8, 0xcc])
+
 SVG_RE = re.compile(r'<svg\s[^>]*([\"\'])http[^\"\']*svg[^\"\']*', re.I)
 
 
@@ -120,6 +124,63 @@ class BaseEngine(object):
         elif SVG_RE.search(buffer[:2048].replace(b'\0', '')):
             return 'image/svg+xml'
 
+    @classmethod
+    def get_dimensions(cls, buffer):
+        '''
+        Reads the dimensions of the image from its headers, without decoding it.
+        Works with JPEG, PNG, GIF and WebP and only needs the beginning of the
+        file (up to the JPEG frame header).
+
+        :return: The (width, height) of the image or None if they are unknown
+        :rtype: tuple
+        '''
+        try:
+            if buffer.startswith(b'\x89PNG\r\n\x1a\n') and buffer[12:16] == b'IHDR':
+                return struct.unpack_from('>II', buffer, 16)
+
+            if buffer[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack_from('<HH', buffer, 6)
+
+            if buffer.startswith(b'RIFF') and buffer[8:12] == b'WEBP':
+                chunk = buffer[12:16]
+                if chunk == b'VP8 ':
+                    width, height = struct.unpack_from('<HH', buffer, 26)
+                    return width & 0x3fff, height & 0x3fff
+                if chunk == b'VP8L':
+                    bits, = struct.unpack_from('<I', buffer, 21)
+                    return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+                if chunk == b'VP8X':
+                    width_low, width_high, height_low, height_high = struct.unpack_from('<HBHB', buffer, 24)
+                    return (width_low | width_high << 16) + 1, (height_low | height_high << 16) + 1
+                return None
+
+            if buffer.startswith(b'\xff\xd8'):
+                return cls._get_jpeg_dimensions(buffer)
+        except struct.error:
+            pass
+
+        return None
+
+    @classmethod
+    def _get_jpeg_dimensions(cls, buffer):
+        position = 2
+        while True:
+            prefix, marker = struct.unpack_from('>BB', buffer, position)
+            if prefix != 0xff:
+                return None
+            if marker == 0xff:  # fill byte
+                position += 1
+                continue
+            if marker == 0x01 or 0xd0 <= marker <= 0xd8:  # markers without length
+                position += 2
+                continue
+
+            length, = struct.unpack_from('>H', buffer, position + 2)
+            if marker in JPEG_SOF_MARKERS:
+                height, width = struct.unpack_from('>HH', buffer, position + 5)
+                return width, height
+            position += 2 + length
+
     def wrap(self, multiple_engine):
         for method_name in ['resize', 'crop', 'flip_vertically',
                             'flip_horizontally']:
@@ -309,6 +370,12 @@ class BaseEngine(object):
     def focus(self, points):
         pass
 
+    def flush_operations(self):
+        """
+        Applies any image operation the engine might have deferred.
+        """
+        pass
+
     def flip_horizontally(self):
         raise NotImplementedError()
 
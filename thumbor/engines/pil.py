@@ -9,6 +9,8 @@
 # Copyright (c) 2011 globo.com thumbor@googlegroups.com
 
 
+import inspect
+import math
 import os
 from tempfile import mkstemp
 from subprocess import Popen, PIPE
@@ -43,6 +45,22 @@ FORMATS = {
     '.webp': 'WEBP'
 }
 
+# (transposed, mirrored horizontally, mirrored vertically) => single transpose
+TRANSPOSE_METHODS = {
+    (False, True, False): Image.FLIP_LEFT_RIGHT,
+    (False, False, True): Image.FLIP_TOP_BOTTOM,
+    (False, True, True): Image.ROTATE_180,
+    (True, False, False): Image.TRANSPOSE,
+    (True, False, True): Image.ROTATE_90,
+    (True, True, False): Image.ROTATE_270,
+    (True, True, True): getattr(Image, 'TRANSVERSE', None),
+}
+
+NO_ORIENTATION = (False, False, False)
+
+# Pillow >= 4.3.0 can resize a region of the image without cropping it first
+RESIZE_SUPPORTS_BOX = 'box' in inspect.getargspec(Image.Image.resize).args
+
 ImageFile.MAXBLOCK = 2 ** 25
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -56,6 +74,154 @@ class Engine(BaseEngine):
         if self.context and self.context.config.MAX_PIXELS:
             Image.MAX_IMAGE_PIXELS = self.context.config.MAX_PIXELS
 
+    @property
+    def image(self):
+        self.flush_operations()
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self._reset_operations()
+
+    @property
+    def size(self):
+        if self.is_multiple():
+            return self.multiple_engine.size()
+
+        width, height = self._get_unoriented_size()
+        if self._orientation[0]:
+            return height, width
+        return width, height
+
+    def _reset_operations(self):
+        # Geometric operations are recorded and only applied to the pixels when
+        # they are needed, so that crop, resize, flips and right angle rotations
+        # are executed as a single resize (with a source box) and a single transpose.
+        self._box = None
+        self._resize_to = None
+        self._orientation = NO_ORIENTATION
+
+    def has_pending_operations(self):
+        return self._box is not None or self._resize_to is not None or self._orientation != NO_ORIENTATION
+
+    def _get_unoriented_size(self):
+        if self._resize_to is not None:
+            return self._resize_to
+
+        if self._box is not None:
+            left, top, right, bottom = self._box
+            return right - left, bottom - top
+
+        return self._image.size
+
+    def flush_operations(self):
+        if self.is_multiple():
+            for frame_engine in self.frame_engines():
+                frame_engine.flush_operations()
+
+        if not self.has_pending_operations():
+            return
+
+        image = self._image
+        box, resize_to, orientation = self._box, self._resize_to, self._orientation
+        self._reset_operations()
+
+        if resize_to is not None:
+            image = self._resize_image(image, resize_to, box)
+        elif box is not None:
+            image = image.crop(box)
+
+        method = TRANSPOSE_METHODS.get(orientation)
+        if orientation == (True, True, True) and method is None:
+            image = image.transpose(Image.TRANSPOSE).transpose(Image.ROTATE_180)
+        elif method is not None:
+            image = image.transpose(method)
+
+        self._image = image
+
+    def _resize_image(self, image, size, box=None):
+        # Indexed color modes (such as 1 and P) will be forced to use a
+        # nearest neighbor resampling algorithm. So we convert them to
+        # RGBA mode before resizing to avoid nasty scaling artifacts.
+        original_mode = image.mode
+        if image.mode in ['1', 'P']:
+            logger.debug('converting image from 8-bit/1-bit palette to 32-bit RGBA for resize')
+            image = image.convert('RGBA')
+            # Workaround for pillow < 4.3.0. See https://github.com/python-pillow/Pillow/issues/2702
+            image.palette = None
+
+        if box is not None and box == (0, 0) + image.size:
+            box = None
+
+        if box is not None and not RESIZE_SUPPORTS_BOX:
+            image = image.crop(tuple(int(round(value)) for value in box))
+            box = None
+
+        image, box = self._reduce_image(image, size, box)
+
+        resample = self.get_resize_filter()
+        if box is not None:
+            image = image.resize(size, resample, box)
+        else:
+            image = image.resize(size, resample)
+
+        # 1 and P mode images will be much smaller if converted back to
+        # their original mode. So let's do that after resizing. Get $$.
+        if original_mode != image.mode:
+            image = image.convert(original_mode)
+
+        return image
+
+    def _reduce_image(self, image, size, box=None):
+        '''
+        Shrinks the image by an integer factor using a cheap box filter, so that
+        the configured resampling filter only has to cover the remaining ratio.
+        The reduced image is kept at least PILLOW_RESIZE_REDUCING_GAP times
+        larger than the requested size. Returns the reduced image and the
+        resize box translated to it.
+        '''
+        reducing_gap = self.context.config.PILLOW_RESIZE_REDUCING_GAP
+        if not reducing_gap or self.get_resize_filter() == Image.NEAREST:
+            return image, box
+
+        left, top, right, bottom = box or (0, 0) + image.size
+        factor_x = max(int(float(right - left) / size[0] / reducing_gap), 1)
+        factor_y = max(int(float(bottom - top) / size[1] / reducing_gap), 1)
+        if factor_x == 1 and factor_y == 1:
+            return image, box
+
+        reduce_box = (
+            int(math.floor(left)), int(math.floor(top)),
+            int(math.ceil(right)), int(math.ceil(bottom)),
+        )
+        width = reduce_box[2] - reduce_box[0]
+        height = reduce_box[3] - reduce_box[1]
+
+        logger.debug('reducing image by (%d, %d) before resampling' % (factor_x, factor_y))
+        if hasattr(image, 'reduce'):
+            image = image.reduce((factor_x, factor_y), reduce_box)
+        else:
+            reduced_size = (
+                int(math.ceil(float(width) / factor_x)),
+                int(math.ceil(float(height) / factor_y)),
+            )
+            if reduce_box == (0, 0) + image.size:
+                image = image.resize(reduced_size, Image.BOX)
+            else:
+                image = image.resize(reduced_size, Image.BOX, reduce_box)
+
+        scale_x = float(image.size[0]) / width
+        scale_y = float(image.size[1]) / height
+        box = (
+            (left - reduce_box[0]) * scale_x, (top - reduce_box[1]) * scale_y,
+            (right - reduce_box[0]) * scale_x, (bottom - reduce_box[1]) * scale_y,
+        )
+        if box == (0, 0) + image.size:
+            box = None
+
+        return image, box
+
     def gen_image(self, size, color):
         if color == 'transparent':
             color = None
@@ -76,6 +242,9 @@ class Engine(BaseEngine):
             self.subsampling = None
         self.qtables = getattr(img, 'quantization', None)
 
+        if img.format == 'JPEG' and self.context.config.PILLOW_JPEG_DRAFT_MODE:
+            self.draft(img)
+
         if self.context.config.ALLOW_ANIMATED_GIFS and self.extension == '.gif':
             frames = []
             for frame in ImageSequence.Iterator(img):
@@ -86,6 +255,87 @@ class Engine(BaseEngine):
 
         return img
 
+    def get_draft_scale(self, source_width, source_height):
+        """
+        Returns the largest DCT scale (1, 2, 4 or 8) libjpeg can decode the
+        source with while keeping the requested area at least as big as the
+        requested dimensions.
+        :rtype: int
+        """
+        request = self.context.request
+
+        width, height = request.width, request.height
+        if width == 'orig' or height == 'orig' or not (width or height):
+            return 1
+
+        if self.context.config.RESPECT_ORIENTATION and self.get_orientation() in (5, 6, 7, 8):
+            # the request refers to the image after it has been rotated
+            source_width, source_height = source_height, source_width
+
+        region_width, region_height = source_width, source_height
+        if request.should_crop:
+            crop = request.crop
+            region_width = min(crop['right'], source_width) - max(crop['left'], 0)
+            region_height = min(crop['bottom'], source_height) - max(crop['top'], 0)
+            if region_width <= 0 or region_height <= 0:
+                return 1
+
+        ratios = []
+        if width:
+            ratios.append(float(width) / region_width)
+        if height:
+            ratios.append(float(height) / region_height)
+
+        if request.fit_in and not (request.full or request.adaptive):
+            ratio = min(ratios)
+        else:
+            ratio = max(ratios)
+
+        for scale in (8, 4, 2):
+            if ratio * scale <= 1:
+                return scale
+
+        return 1
+
+    def draft(self, img):
+        """
+        Asks libjpeg to decode the image at a reduced scale when the requested
+        size is known, translating the request crop and focal points accordingly.
+        """
+        request = getattr(self.context, 'request', None)
+
+        # Only the engine holding the requested source may be drafted, other
+        # instances (watermarks, frames, uploads) must decode at full size.
+        if request is None or getattr(request, 'engine', None) is not self:
+            return
+
+        has_detectors = self.context.modules and self.context.modules.detectors
+        if request.meta or request.debug or (request.smart and has_detectors):
+            return
+
+        source_width, source_height = img.size
+        scale = self.get_draft_scale(source_width, source_height)
+        if scale == 1:
+            return
+
+        img.draft(img.mode, (source_width // scale, source_height // scale))
+
+        factor = float(img.size[0]) / source_width
+        if factor == 1:
+            return
+
+        logger.debug('[PILEngine] drafted JPEG from %dx%d to %dx%d' % (source_width, source_height, img.size[0], img.size[1]))
+
+        if request.should_crop:
+            for key in ('left', 'top', 'right', 'bottom'):
+                request.crop[key] = int(round(request.crop[key] * factor))
+
+        for point in request.focal_points:
+            point.x *= factor
+            point.y *= factor
+            point.width *= factor
+            point.height *= factor
+
     def get_resize_filter(self):
         config = self.context.config
         resample = config.PILLOW_RESAMPLING_FILTER if config.PILLOW_RESAMPLING_FILTER is not None else 'LANCZOS'
@@ -113,48 +363,67 @@ class Engine(BaseEngine):
         del d
 
     def resize(self, width, height):
-        # Indexed color modes (such as 1 and P) will be forced to use a
-        # nearest neighbor resampling algorithm. So we convert them to
-        # RGBA mode before resizing to avoid nasty scaling artifacts.
-        original_mode = self.image.mode
-        if self.image.mode in ['1', 'P']:
-            logger.debug('converting image from 8-bit/1-bit palette to 32-bit RGBA for resize')
-            self.image = self.image.convert('RGBA')
-            # Workaround for pillow < 4.3.0. See https://github.com/python-pillow/Pillow/issues/2702
-            self.image.palette = None
-
-        resample = self.get_resize_filter()
-        self.image = self.image.resize((int(width), int(height)), resample)
-
-        # 1 and P mode images will be much smaller if converted back to
-        # their original mode. So let's do that after resizing. Get $$.
-        if original_mode != self.image.mode:
-            self.image = self.image.convert(original_mode)
+        width, height = int(width), int(height)
+        if self._orientation[0]:
+            width, height = height, width
+        self._resize_to = (width, height)
 
     def crop(self, left, top, right, bottom):
-        self.image = self.image.crop((
-            int(left),
-            int(top),
-            int(right),
-            int(bottom)
-        ))
+        left, top, right, bottom = int(left), int(top), int(right), int(bottom)
+        width, height = self.size
+
+        in_bounds = 0 <= left < right <= width and 0 <= top < bottom <= height
+        if not in_bounds or (self._resize_to is not None and not RESIZE_SUPPORTS_BOX):
+            image = self.image
+            self.image = image.crop((left, top, right, bottom))
+            return
+
+        # translate the box to the coordinates before flips and rotations
+        transposed, mirrored_x, mirrored_y = self._orientation
+        if mirrored_x:
+            left, right = width - right, width - left
+        if mirrored_y:
+            top, bottom = height - bottom, height - top
+        if transposed:
+            left, top, right, bottom = top, left, bottom, right
+
+        # then to the coordinates of the image before resizing
+        base_left, base_top, base_right, base_bottom = self._box or ((0, 0) + self._image.size)
+        if self._resize_to is None:
+            self._box = (base_left + left, base_top + top, base_left + right, base_top + bottom)
+            return
+
+        resize_width, resize_height = self._resize_to
+        scale_x = float(base_right - base_left) / resize_width
+        scale_y = float(base_bottom - base_top) / resize_height
+        self._box = (
+            base_left + left * scale_x,
+            base_top + top * scale_y,
+            base_left + right * scale_x,
+            base_top + bottom * scale_y,
+        )
+        self._resize_to = (right - left, bottom - top)
 
     def rotate(self, degrees):
         # PIL rotates counter clockwise
+        transposed, mirrored_x, mirrored_y = self._orientation
         if degrees == 90:
-            self.image = self.image.transpose(Image.ROTATE_90)
+            self._orientation = (not transposed, mirrored_y, not mirrored_x)
         elif degrees == 180:
-            self.image = self.image.transpose(Image.ROTATE_180)
+            self._orientation = (transposed, not mirrored_x, not mirrored_y)
         elif degrees == 270:
-            self.image = self.image.transpose(Image.ROTATE_270)
+            self._orientation = (not transposed, not mirrored_y, mirrored_x)
         else:
-            self.image = self.image.rotate(degrees, expand=1)
+            image = self.image
+            self.image = image.rotate(degrees, expand=1)
 
     def flip_vertically(self):
-        self.image = self.image.transpose(Image.FLIP_TOP_BOTTOM)
+        transposed, mirrored_x, mirrored_y = self._orientation
+        self._orientation = (transposed, mirrored_x, not mirrored_y)
 
     def flip_horizontally(self):
-        self.image = self.image.transpose(Image.FLIP_LEFT_RIGHT)
+        transposed, mirrored_x, mirrored_y = self._orientation
+        self._orientation = (transposed, not mirrored_x, mirrored_y)
 
     def get_default_extension(self):
         # extension is not present => force JPEG or PNG
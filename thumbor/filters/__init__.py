@@ -47,9 +47,18 @@ class FiltersFactory:
             self.filter_classes_map[filter_name] = cls
 
     def create_instances(self, context, filter_params):
-        filter_instances = collections.defaultdict(list)
+        return self.create_instances_from_plan(context, self.compile(filter_params))
+
+    def compile(self, filter_params):
+        '''
+        Returns the plan of filter_params (e.g. 'blur(2):quality(80)'): the
+        class, the parameters and the parsed parameters of each valid filter.
+        Plans do not depend on the request, so they can be reused by
+        create_instances_from_plan.
+        '''
+        plan = []
         if not filter_params:
-            return FiltersRunner(filter_instances)
+            return plan
 
         filter_params = filter_params.split('):')
         last_idx = len(filter_params) - 1
@@ -63,7 +72,17 @@ class FiltersFactory:
 
             if i != last_idx:
                 param = param + ')'
-            instance = cls.init_if_valid(param, context)
+            parsed_params = cls.parse_params(param)
+
+            if parsed_params is not None:
+                plan.append((cls, param, parsed_params))
+
+        return plan
+
+    def create_instances_from_plan(self, context, plan):
+        filter_instances = collections.defaultdict(list)
+        for cls, param, parsed_params in plan:
+            instance = cls.init_if_valid(param, context, parsed_params=parsed_params)
 
             if instance:
                 filter_instances[getattr(cls, 'phase', PHASE_POST_TRANSFORM)].append(instance)
@@ -151,18 +170,36 @@ class BaseFilter(object):
         cls.regex = re.compile(cls.regex_str)
 
     @classmethod
-    def init_if_valid(cls, param, context):
-        instance = cls(param, context)
+    def init_if_valid(cls, param, context, parsed_params=None):
+        if parsed_params is None:
+            instance = cls(param, context)
+        else:
+            instance = cls(param, context, parsed_params=parsed_params)
         if instance.params is not None:
             return instance
         else:
             return None
 
-    def __init__(self, params, context=None):
-        params = self.regex.match(params) if self.regex else None
+    @classmethod
+    def parse_params(cls, params):
+        '''
+        Returns the values of the parameters in params (e.g. 'blur(2)') or
+        None if they are not valid for the filter.
+        '''
+        params = cls.regex.match(params) if cls.regex else None
         if params:
-            params = [parser(param) if parser else param for parser, param in zip(self.parsers, params.groups()) if param]
-        self.params = params
+            params = [parser(param) if parser else param for parser, param in zip(cls.parsers, params.groups()) if param]
+        return params
+
+    def __init__(self, params, context=None, parsed_params=None):
+        '''
+        parsed_params are the values parse_params returned for params, when
+        they are already known (see FiltersFactory.compile).
+        '''
+        if parsed_params is None:
+            self.params = self.parse_params(params)
+        else:
+            self.params = list(parsed_params)
         self.context = context
         self.engine = context.modules.engine if context and context.modules else None
 
@@ -9,6 +9,7 @@
 # Copyright (c) 2011 globo.com thumbor@googlegroups.com
 
 import sys
+import time
 import functools
 import datetime
 import re
@@ -18,10 +19,12 @@ import schedule
 
 import tornado.web
 import tornado.gen as gen
+from tornado.concurrent import Future
+from tornado.httputil import HTTPServerRequest
 from tornado.locks import Condition
 
 from thumbor import __version__
-from thumbor.context import Context
+from thumbor.context import Context, EngineBusyError, ProcessPool, RequestCancelledError, RequestParameters
 from thumbor.engines import BaseEngine, EngineResult
 from thumbor.engines.json_engine import JSONEngine
 from thumbor.loaders import LoaderResult
@@ -49,10 +52,17 @@ class FetchResult(object):
         self.buffer = buffer
         self.successful = successful
         self.loader_error = loader_error
+        self.retry_after = None
+        # Stores the loaded source once a worker of the engine process pool
+        # could load it, see process_image_in_pool
+        self.store_source = None
 
 
 class BaseHandler(tornado.web.RequestHandler):
     url_locks = {}
+    result_flights = {}
+    # The filters of the request, see FiltersFactory.compile
+    filters_plan = None
 
     def prepare(self, *args, **kwargs):
         super(BaseHandler, self).prepare(*args, **kwargs)
@@ -72,6 +82,8 @@ class BaseHandler(tornado.web.RequestHandler):
         if not hasattr(self, 'context'):
             return
 
+        self._land_result_flight({'status': self.get_status(), 'retry_after': self._headers.get('Retry-After')})
+
         total_time = (datetime.datetime.now() - self._response_start).total_seconds() * 1000
         status = self.get_status()
         self.context.metrics.timing('response.time', total_time)
@@ -85,43 +97,121 @@ class BaseHandler(tornado.web.RequestHandler):
             if self._response_length is not None:
                 self.context.metrics.incr('response.bytes{0}'.format(ext), self._response_length)
 
+    def on_connection_close(self):
+        super(BaseHandler, self).on_connection_close()
+
+        request = getattr(getattr(self, 'context', None), 'request', None)
+        if request is not None:
+            request.cancelled = True
+
     def _error(self, status, msg=None):
         self.set_status(status)
         if msg is not None:
             logger.warn(msg)
         self.finish()
 
+    def _error_engine_busy(self, error):
+        self.set_header('Retry-After', str(self.context.config.ENGINE_QUEUE_RETRY_AFTER))
+        self._error(503, 'Request rejected by the engine: {}'.format(error))
+
+    def get_deadline(self):
+        '''
+        Returns the time after which generating the image should stop: the
+        lowest of REQUEST_DEADLINE and of the number of seconds in the
+        REQUEST_DEADLINE_HEADER header, if any. None means no deadline.
+        '''
+        timeout = self.context.config.REQUEST_DEADLINE
+
+        header = self.context.config.REQUEST_DEADLINE_HEADER
+        if header and header in self.request.headers:
+            try:
+                header_timeout = float(self.request.headers[header])
+            except ValueError:
+                logger.warn('Ignoring invalid {0} header: {1}'.format(header, self.request.headers[header]))
+            else:
+                if header_timeout > 0:
+                    timeout = min(timeout, header_timeout) if timeout else header_timeout
+
+        if not timeout:
+            return None
+        return time.time() + timeout
+
+    def _abort_if_cancelled(self, stage):
+        '''
+        Finishes the request if it was cancelled, see RequestParameters.is_cancelled.
+        Called between the stages of the image generation.
+        '''
+        if not self.context.request.is_cancelled():
+            return False
+
+        self._finish_cancelled(stage)
+        return True
+
+    def _finish_cancelled(self, stage):
+        req = self.context.request
+        # Requests sharing this result have to generate it themselves
+        self._land_result_flight({'status': None})
+        self.context.metrics.incr('request.cancelled.{0}'.format(stage))
+
+        if req.cancelled:
+            logger.debug('Client closed the connection, stopped generating {0} at {1}'.format(req.url, stage))
+            self.set_status(499, 'Client Closed Request')
+            self.finish()
+        else:
+            self._error(504, 'Deadline of {0} exceeded, stopped generating it at {1}'.format(req.url, stage))
+
     @gen.coroutine
     def execute_image_operations(self):
         self.context.request.quality = None
+        self.context.request.deadline = self.get_deadline()
 
         req = self.context.request
         conf = self.context.config
 
         should_store = self.context.config.RESULT_STORAGE_STORES_UNSAFE or not self.context.request.unsafe
         if self.context.modules.result_storage and should_store:
-            start = datetime.datetime.now()
+            result = None
+            if self.context.result_cache is not None:
+                result = self.context.result_cache.get(self.get_result_flight_key(), self.context.metrics)
 
-            try:
-                result = yield gen.maybe_future(self.context.modules.result_storage.get())
-            except Exception as e:
-                logger.exception('[BaseHander.execute_image_operations] %s', e)
-                self._error(500, 'Error while trying to get the image from the result storage: {}'.format(e))
-                return
+            if result is None:
+                start = datetime.datetime.now()
 
-            finish = datetime.datetime.now()
+                try:
+                    result = yield gen.maybe_future(self.context.modules.result_storage.get())
+                except Exception as e:
+                    logger.exception('[BaseHander.execute_image_operations] %s', e)
+                    self._error(500, 'Error while trying to get the image from the result storage: {}'.format(e))
+                    return
 
-            self.context.metrics.timing('result_storage.incoming_time', (finish - start).total_seconds() * 1000)
+                finish = datetime.datetime.now()
 
-            if result is None:
-                self.context.metrics.incr('result_storage.miss')
-            else:
-                self.context.metrics.incr('result_storage.hit')
-                self.context.metrics.incr('result_storage.bytes_read', len(result))
-                logger.debug('[RESULT_STORAGE] IMAGE FOUND: %s' % req.url)
+                self.context.metrics.timing('result_storage.incoming_time', (finish - start).total_seconds() * 1000)
+
+                if result is None:
+                    self.context.metrics.incr('result_storage.miss')
+                else:
+                    self.context.metrics.incr('result_storage.hit')
+                    self.context.metrics.incr('result_storage.bytes_read', len(result))
+                    logger.debug('[RESULT_STORAGE] IMAGE FOUND: %s' % req.url)
+                    self._put_in_result_cache(result)
+
+            if result is not None:
                 self.finish_request(self.context, result)
                 return
 
+        if conf.RESULT_COALESCING:
+            key = self.get_result_flight_key()
+            flight = BaseHandler.result_flights.get(key)
+            if flight is None:
+                self._result_flight_key = key
+                BaseHandler.result_flights[key] = Future()
+            else:
+                self.context.metrics.incr('result.coalesced')
+                result = yield flight
+                if self._finish_from_result_flight(result):
+                    return
+
         if conf.MAX_WIDTH and (not isinstance(req.width, basestring)) and req.width > conf.MAX_WIDTH:
             req.width = conf.MAX_WIDTH
         if conf.MAX_HEIGHT and (not isinstance(req.height, basestring)) and req.height > conf.MAX_HEIGHT:
@@ -129,7 +219,9 @@ class BaseHandler(tornado.web.RequestHandler):
 
         req.meta_callback = conf.META_CALLBACK_NAME or self.request.arguments.get('callback', [None])[0]
 
-        self.filters_runner = self.context.filters_factory.create_instances(self.context, self.context.request.filters)
+        if self.filters_plan is None:
+            self.filters_plan = self.context.filters_factory.compile(self.context.request.filters)
+        self.filters_runner = self.context.filters_factory.create_instances_from_plan(self.context, self.filters_plan)
         # Apply all the filters from the PRE_LOAD phase and call get_image() afterwards.
         self.filters_runner.apply_filters(thumbor.filters.PHASE_PRE_LOAD, self.get_image)
 
@@ -139,6 +231,9 @@ class BaseHandler(tornado.web.RequestHandler):
         This function is called after the PRE_LOAD filters have been applied.
         It applies the AFTER_LOAD filters on the result, then crops the image.
         """
+        if self._abort_if_cancelled('pre_load'):
+            return
+
         try:
             result = yield self._fetch(
                 self.context.request.image_url
@@ -156,6 +251,15 @@ class BaseHandler(tornado.web.RequestHandler):
                     # Return a Gateway Timeout status if upstream timed out (i.e. 599)
                     self._error(504)
                     return
+                elif result.loader_error == LoaderResult.ERROR_BUSY:
+                    # The loader spared the origin, the request was not sent
+                    self.set_header('Retry-After', str(result.retry_after or 1))
+                    self._error(503)
+                    return
+                elif result.loader_error == LoaderResult.ERROR_TOO_LARGE:
+                    # Return a Bad Request status if the source is over the size limits
+                    self._error(400)
+                    return
                 elif isinstance(result.loader_error, int):
                     self._error(result.loader_error)
                     return
@@ -166,6 +270,12 @@ class BaseHandler(tornado.web.RequestHandler):
                     self._error(500)
                     return
 
+        except EngineBusyError as e:
+            self._error_engine_busy(e)
+            return
+        except RequestCancelledError:
+            self._finish_cancelled('load')
+            return
         except Exception as e:
             msg = '[BaseHandler] get_image failed for url `{url}`. error: `{error}`'.format(
                 url=self.context.request.image_url,
@@ -182,27 +292,48 @@ class BaseHandler(tornado.web.RequestHandler):
                 self._error(500)
             return
 
+        if self._abort_if_cancelled('load'):
+            return
+
         normalized = result.normalized
         buffer = result.buffer
         engine = result.engine
 
-        req = self.context.request
-
         if engine is None:
             if buffer is None:
                 self._error(504)
                 return
 
+            if self.context.process_pool is not None:
+                yield self.process_image_in_pool(buffer, result.store_source)
+                return
+
             engine = self.context.request.engine
             try:
-                engine.load(buffer, self.context.request.extension)
+                yield self._load_image(engine, buffer, self.context.request.extension)
+            except EngineBusyError as e:
+                self._error_engine_busy(e)
+                return
+            except RequestCancelledError:
+                self._finish_cancelled('load')
+                return
             except Exception:
                 self._error(504)
                 return
 
+        self.transform_image(normalized, engine)
+
+    def transform_image(self, normalized, engine):
+        """
+        Applies the AFTER_LOAD filters, then transforms the image loaded in the engine.
+        """
+        req = self.context.request
         self.context.transformer = Transformer(self.context)
 
         def transform():
+            if self._abort_if_cancelled('after_load'):
+                return
+
             self.normalize_crops(normalized, req, engine)
 
             if req.meta:
@@ -249,6 +380,9 @@ class BaseHandler(tornado.web.RequestHandler):
             req.crop['bottom'] = new_crops[3]
 
     def after_transform(self, context):
+        if self._abort_if_cancelled('transform'):
+            return
+
         finish_callback = functools.partial(self.finish_request, context)
         if context.request.extension == '.gif' and context.config.USE_GIFSICLE_ENGINE:
             finish_callback()
@@ -345,6 +479,8 @@ class BaseHandler(tornado.web.RequestHandler):
                 context.request.max_bytes
             )
         if not context.request.meta:
+            if context.request.is_cancelled():
+                raise RequestCancelledError('Request was cancelled before optimizing the image')
             results = self.optimize(context, image_extension, results)
             # An optimizer might have modified the image format.
             content_type = BaseEngine.get_mimetype(results)
@@ -387,30 +523,125 @@ class BaseHandler(tornado.web.RequestHandler):
 
             return
 
+        if self._abort_if_cancelled('post_transform'):
+            return
+
         should_store = result_from_storage is None and (
             context.config.RESULT_STORAGE_STORES_UNSAFE or not context.request.unsafe)
 
         def inner(future):
             try:
                 future_result = future.result()
+            except RequestCancelledError:
+                self._finish_cancelled('encode')
+                return
             except Exception as e:
                 logger.exception('[BaseHander.finish_request] %s', e)
                 self._error(500, 'Error while trying to fetch the image: {}'.format(e))
                 return
 
             results, content_type = future_result
-            self._write_results_to_client(context, results, content_type)
-
-            if should_store:
-                self._store_results(context, results)
-
-            schedule.run_pending()
+            self._finish_results(context, results, content_type, should_store)
 
         self.context.thread_pool.queue(
             operation=functools.partial(self._load_results, context),
             callback=inner,
+            cost=context.request.cost,
+            is_cancelled=context.request.is_cancelled
         )
 
+    def get_result_flight_key(self):
+        '''
+        Identical requests share the generated image: the key is the one of the
+        result storage (the request url and whether it is an automatic WebP).
+        It also keys the in-memory result cache.
+        '''
+        req = self.context.request
+        return req.url, bool(self.context.config.AUTO_WEBP and req.accepts_webp)
+
+    def _land_result_flight(self, result):
+        key = getattr(self, '_result_flight_key', None)
+        if key is None:
+            return
+
+        self._result_flight_key = None
+        flight = BaseHandler.result_flights.pop(key, None)
+        if flight is not None:
+            flight.set_result(result)
+
+    def _finish_from_result_flight(self, result):
+        buffer = result.get('buffer')
+        if buffer is None:
+            if result['status'] is None or result['status'] < 400:
+                # The request generating the image did not finish it, generate it again
+                return False
+            if result.get('retry_after') is not None:
+                # e.g. the request generating the image was shed, see _error_engine_busy
+                self.set_header('Retry-After', result['retry_after'])
+            self._error(result['status'])
+            return True
+
+        for name, value in result['headers'].get_all():
+            self.set_header(name, value)
+
+        self._response_ext = EXTENSION.get(result['headers'].get('Content-Type'))
+        self._response_length = len(buffer)
+
+        self.write(buffer)
+        self.finish()
+        return True
+
+    def _finish_results(self, context, results, content_type, should_store):
+        self._write_results_to_client(context, results, content_type)
+
+        if should_store:
+            self._store_results(context, results)
+
+        schedule.run_pending()
+
+    @gen.coroutine
+    def process_image_in_pool(self, buffer, store_source=None):
+        """
+        Ships the source image and the request parameters to a worker of the
+        engine process pool and writes the image it generated to the client.
+        Calls store_source, if any, once the worker could load the image.
+        """
+        context = self.context
+        if self._abort_if_cancelled('load'):
+            return
+
+        plan = {
+            'buffer': buffer,
+            'uri': self.request.uri,
+            'request': get_request_state(context.request),
+        }
+
+        try:
+            result = yield context.process_pool.submit(process_image, plan)
+        except Exception as e:
+            logger.exception('[BaseHandler.process_image_in_pool] %s', e)
+            self._error(500, 'Error while trying to process the image: {}'.format(e))
+            return
+
+        if self._abort_if_cancelled('encode'):
+            return
+
+        if result['status'] is not None:
+            self._error(result['status'])
+            return
+
+        if store_source is not None:
+            try:
+                store_source()
+            except Exception as e:
+                logger.exception('[BaseHandler.process_image_in_pool] unable to store the source: %s', e)
+
+        # Filters and the transformer might have changed the request (e.g. max_age)
+        context.request.__dict__.update(result['request'])
+
+        should_store = context.config.RESULT_STORAGE_STORES_UNSAFE or not context.request.unsafe
+        self._finish_results(context, result['buffer'], result['content_type'], should_store)
+
     def _write_results_to_client(self, context, results, content_type):
         max_age = context.config.MAX_AGE
 
@@ -448,6 +679,7 @@ class BaseHandler(tornado.web.RequestHandler):
             self.set_header('Vary', 'Accept')
 
         context.headers = self._headers.copy()
+        self._land_result_flight({'buffer': buffer, 'headers': context.headers})
 
         self._response_ext = EXTENSION.get(content_type)
         self._response_length = len(buffer)
@@ -455,10 +687,29 @@ class BaseHandler(tornado.web.RequestHandler):
         self.write(buffer)
         self.finish()
 
+    def _put_in_result_cache(self, result, last_modified=None):
+        '''
+        Keeps a generated image (or one read from the result storage) in the
+        in-memory result cache, if RESULT_STORAGE_MEMORY_CACHE_SIZE is set.
+        '''
+        if self.context.result_cache is None:
+            return
+
+        if isinstance(result, ResultStorageResult):
+            buffer, metadata = result.buffer, dict(result.metadata)
+        else:
+            buffer, metadata = result, {'ContentLength': len(result), 'ContentType': BaseEngine.get_mimetype(result)}
+            if last_modified is not None:
+                metadata['LastModified'] = last_modified
+
+        self.context.result_cache.put(self.get_result_flight_key(), buffer, metadata, self.context.metrics)
+
     def _store_results(self, context, results):
         if not context.modules.result_storage or context.request.prevent_result_storage:
             return
 
+        self._put_in_result_cache(results, last_modified=datetime.datetime.now(pytz.utc))
+
         @gen.coroutine
         def save_to_result_storage():
             start = datetime.datetime.now()
@@ -555,7 +806,15 @@ class BaseHandler(tornado.web.RequestHandler):
         yield self.acquire_url_lock(url)
 
         try:
-            fetch_result.buffer = yield gen.maybe_future(storage.get(url))
+            stored = self.context.request.stored.get(url)
+            if stored is None and self.context.request.smart and url == self.context.request.image_url:
+                stored = yield self._get_stored(url)
+
+            if stored is not None and 'image' in stored:
+                # The image is not kept for the rest of the request
+                fetch_result.buffer = stored.pop('image')
+            else:
+                fetch_result.buffer = yield gen.maybe_future(storage.get(url))
             mime = None
 
             if fetch_result.buffer is not None:
@@ -575,7 +834,12 @@ class BaseHandler(tornado.web.RequestHandler):
             else:
                 self.context.metrics.incr('storage.miss')
 
-            loader_result = yield self.context.modules.loader.load(self.context, url)
+            loader_error = yield self._get_cached_loader_error(url)
+            if loader_error is not None:
+                fetch_result.loader_error = loader_error
+                raise gen.Return(fetch_result)
+
+            loader_result, revalidated = yield self._load_source(url)
         finally:
             self.release_url_lock(url)
 
@@ -583,8 +847,10 @@ class BaseHandler(tornado.web.RequestHandler):
             # TODO _fetch should probably return a result object vs a list to
             # to allow returning metadata
             if not loader_result.successful:
+                self._cache_loader_error(url, loader_result.error)
                 fetch_result.buffer = None
                 fetch_result.loader_error = loader_result.error
+                fetch_result.retry_after = loader_result.metadata.get('RetryAfter')
                 raise gen.Return(fetch_result)
 
             fetch_result.buffer = loader_result.buffer
@@ -608,16 +874,21 @@ class BaseHandler(tornado.web.RequestHandler):
             else:
                 self.context.request.engine = self.context.modules.engine
 
-            self.context.request.engine.load(fetch_result.buffer, extension)
-
-            if self.context.request.engine.image is None:
-                fetch_result.successful = False
-                fetch_result.buffer = None
-                fetch_result.engine = self.context.request.engine
-                fetch_result.engine_error = EngineResult.COULD_NOT_LOAD_IMAGE
-                raise gen.Return(fetch_result)
-
-            fetch_result.normalized = self.context.request.engine.normalize()
+            # When using a process pool the image is only loaded by the worker
+            if self.context.process_pool is None:
+                fetch_result.normalized = yield self._load_image(
+                    self.context.request.engine,
+                    fetch_result.buffer,
+                    extension,
+                    normalize=True
+                )
+
+                if fetch_result.normalized is None:
+                    fetch_result.successful = False
+                    fetch_result.buffer = None
+                    fetch_result.engine = self.context.request.engine
+                    fetch_result.engine_error = EngineResult.COULD_NOT_LOAD_IMAGE
+                    raise gen.Return(fetch_result)
 
             # Allows engine or loader to override storage on the fly for the purpose of
             # marking a specific file as unstoreable
@@ -627,8 +898,15 @@ class BaseHandler(tornado.web.RequestHandler):
             is_mixed_storage = isinstance(storage, MixedStorage)
             is_mixed_no_file_storage = is_mixed_storage and isinstance(storage.file_storage, NoStorage)
 
-            if not (is_no_storage or is_mixed_no_file_storage):
-                storage.put(url, fetch_result.buffer)
+            if not (is_no_storage or is_mixed_no_file_storage or revalidated):
+                store_source = functools.partial(self._store_source, storage, url, fetch_result.buffer, loader_result)
+                if self.context.process_pool is None:
+                    store_source()
+                else:
+                    # Nothing decoded the source yet: it is stored once a
+                    # worker could load it, so that broken sources are not
+                    # served from the storage to the following requests
+                    fetch_result.store_source = store_source
 
             storage.put_crypto(url)
         except Exception:
@@ -636,20 +914,203 @@ class BaseHandler(tornado.web.RequestHandler):
         finally:
             if not fetch_result.successful:
                 raise
-            fetch_result.buffer = None
-            fetch_result.engine = self.context.request.engine
+            if self.context.process_pool is None:
+                fetch_result.buffer = None
+                fetch_result.engine = self.context.request.engine
             raise gen.Return(fetch_result)
 
     @gen.coroutine
-    def get_blacklist_contents(self):
-        filename = 'blacklist.txt'
+    def _get_stored(self, url):
+        """
+        Gets the image, crypto key and detector data the storage keeps for url
+        in one concurrent step (see BaseStorage.get_all) and keeps them for the
+        rest of the request.
+
+        :return: The dict returned by get_all or None if the storage has no get_all
+        :rtype: dict
+        """
+        storage = self.context.modules.storage
+        if not hasattr(storage, 'get_all'):
+            raise gen.Return(None)
+
+        if url not in self.context.request.stored:
+            stored = yield gen.maybe_future(storage.get_all(url))
+            self.context.request.stored[url] = stored
+        raise gen.Return(self.context.request.stored[url])
+
+    @gen.coroutine
+    def _load_source(self, url):
+        """
+        Loads the original image with the loader. When the storage keeps an
+        expired copy of it with its ETag or Last-Modified, the loader asks the
+        origin whether it changed and the copy is reused if it did not.
+
+        :return: The loader result and whether it holds the revalidated copy
+        :rtype: tuple
+        """
+        storage = self.context.modules.storage
+        loader = self.context.modules.loader
+
+        try:
+            validators = yield gen.maybe_future(storage.get_validators(url))
+        except NotImplementedError:
+            validators = None
+
+        self.context.request.source_validators = validators
+        try:
+            loader_result = yield loader.load(self.context, url)
+        finally:
+            self.context.request.source_validators = None
+
+        if isinstance(loader_result, LoaderResult) and loader_result.metadata.get('NotModified'):
+            try:
+                refreshed = yield gen.maybe_future(storage.refresh(url))
+            except Exception as e:
+                logger.warn('[BaseHandler] unable to refresh the stored copy of {0}: {1}'.format(url, e))
+                refreshed = False
+
+            buffer = None
+            if refreshed is not False:
+                buffer = yield gen.maybe_future(storage.get(url))
+            if buffer is not None:
+                self.context.metrics.incr('storage.revalidated')
+                raise gen.Return((LoaderResult(buffer=buffer, metadata={}), True))
+
+            # The stored copy went away in the meantime
+            loader_result = yield loader.load(self.context, url)
+
+        raise gen.Return((loader_result, False))
+
+    @gen.coroutine
+    def _get_cached_loader_error(self, url):
+        """
+        Returns the error the loader recently failed with for url, kept in the
+        negative cache (and in the storage if NEGATIVE_CACHE_USE_STORAGE is set).
+        """
+        if self.context.negative_cache is None:
+            raise gen.Return(None)
+
+        error = self.context.negative_cache.get(url)
+        if error is None and self.context.config.NEGATIVE_CACHE_USE_STORAGE:
+            try:
+                stored = yield gen.maybe_future(self.context.modules.storage.get_loader_error(url))
+            except NotImplementedError:
+                stored = None
+
+            if stored is not None:
+                # Kept in memory until it expires in the storage as well
+                error, expires_at = stored
+                self.context.negative_cache.put(url, error, expires_at - time.time())
+
+        self.context.metrics.incr('loader.negative_cache.{0}'.format('miss' if error is None else 'hit'))
+        raise gen.Return(error)
+
+    def _cache_loader_error(self, url, error):
+        if self.context.negative_cache is None:
+            return
+
+        expiration = {
+            LoaderResult.ERROR_NOT_FOUND: self.context.config.NEGATIVE_CACHE_NOT_FOUND_SECONDS,
+            LoaderResult.ERROR_TIMEOUT: self.context.config.NEGATIVE_CACHE_TIMEOUT_SECONDS,
+        }.get(error)
+        if not expiration:
+            return
+
+        self.context.negative_cache.put(url, error, expiration)
+        if self.context.config.NEGATIVE_CACHE_USE_STORAGE:
+            try:
+                self.context.modules.storage.put_loader_error(url, error, expiration)
+            except NotImplementedError:
+                pass
+
+    def _store_source(self, storage, url, buffer, loader_result):
+        storage.put(url, buffer)
+        self._put_source_validators(storage, url, loader_result)
+
+    def _put_source_validators(self, storage, url, loader_result):
+        metadata = loader_result.metadata if isinstance(loader_result, LoaderResult) else {}
+        validators = dict((key, metadata[key]) for key in ('ETag', 'LastModified') if key in metadata)
+        if not validators:
+            return
+
+        try:
+            storage.put_validators(url, validators)
+        except NotImplementedError:
+            pass
 
-        exists = yield gen.maybe_future(self.context.modules.storage.exists(filename))
-        if exists:
-            blacklist = yield gen.maybe_future(self.context.modules.storage.get(filename))
-            raise tornado.gen.Return(blacklist)
+    def estimate_cost(self, buffer):
+        """
+        Estimates how expensive generating the requested image is, in megapixels
+        processed, from the source dimensions read in the image headers, the
+        requested size, smart detection and the filters.
+
+        :rtype: float
+        """
+        req = self.context.request
+
+        dimensions = BaseEngine.get_dimensions(buffer)
+        if dimensions is None:
+            # Roughly what the usual compression ratios give
+            source_pixels = len(buffer) * 4
+        else:
+            source_pixels = dimensions[0] * dimensions[1]
+
+        width = 0 if isinstance(req.width, basestring) else req.width
+        height = 0 if isinstance(req.height, basestring) else req.height
+        if width and height:
+            target_pixels = width * height
+        elif (width or height) and dimensions:
+            scale = max(float(width) / dimensions[0], float(height) / dimensions[1])
+            target_pixels = source_pixels * scale * scale
         else:
-            raise tornado.gen.Return("")
+            target_pixels = source_pixels
+
+        cost = source_pixels
+        if req.smart and self.context.modules.detectors:
+            cost += source_pixels
+
+        filters_runner = getattr(self, 'filters_runner', None)
+        if filters_runner is not None:
+            filters_count = sum(len(filters) for filters in filters_runner.filter_instances.values())
+            cost += target_pixels * filters_count
+
+        return cost / 1000000.0
+
+    @gen.coroutine
+    def _load_image(self, engine, buffer, extension, normalize=False):
+        """
+        Decodes the buffer into the engine (and optionally normalizes it) using
+        the engine thread pool, so that decoding, metadata reading and format
+        conversions do not block the IOLoop. As the first engine operation of
+        a request, it raises EngineBusyError if the engine queue is full.
+
+        :return: Whether the engine normalized (resized) the image or None if
+                 the engine could not load it
+        :rtype: bool
+        """
+        self.context.request.cost = self.estimate_cost(buffer)
+
+        def load():
+            engine.load(buffer, extension)
+            if engine.image is None:
+                return None
+            if normalize:
+                return engine.normalize()
+            return False
+
+        future = yield gen.Task(
+            self.context.thread_pool.queue,
+            operation=load,
+            admission=True,
+            metrics=self.context.metrics,
+            cost=self.context.request.cost
+        )
+        raise gen.Return(future.result())
+
+    @gen.coroutine
+    def get_blacklist_contents(self):
+        blacklist = yield self.context.blacklist.get_contents(self.context.modules.storage)
+        raise tornado.gen.Return(blacklist)
 
     @gen.coroutine
     def acquire_url_lock(self, url):
@@ -666,6 +1127,112 @@ class BaseHandler(tornado.web.RequestHandler):
             pass
 
 
+class ProcessWorkerHandler(BaseHandler):
+    """
+    Runs the image operations of BaseHandler in a worker of the engine process
+    pool. It is not bound to any connection: errors and results are stored in
+    a future instead of being written to the client.
+    """
+
+    def __init__(self, context, uri):
+        self.context = context
+        self.request = HTTPServerRequest(method='GET', uri=uri)
+        self.result = Future()
+
+    def _error(self, status, msg=None):
+        if msg is not None:
+            logger.warn(msg)
+        self._set_result(status=status)
+
+    def _finish_cancelled(self, stage):
+        # The deadline travels with the request state, the handler that
+        # submitted the image tells cancellations apart
+        self._set_result(status=504)
+
+    def _set_result(self, status=None, buffer=None, content_type=None):
+        if self.result.done():
+            return
+        self.result.set_result({
+            'status': status,
+            'buffer': buffer,
+            'content_type': content_type,
+            'request': get_request_state(self.context.request),
+        })
+
+    def finish_request(self, context, result_from_storage=None):
+        try:
+            results, content_type = self._load_results(context)
+        except RequestCancelledError:
+            self._finish_cancelled('encode')
+            return
+        except Exception as e:
+            logger.exception('[ProcessWorkerHandler.finish_request] %s', e)
+            self._error(500, 'Error while trying to fetch the image: {}'.format(e))
+            return
+
+        self._set_result(buffer=results, content_type=content_type)
+
+    @gen.coroutine
+    def process(self, buffer):
+        req = self.context.request
+        mime = BaseEngine.get_mimetype(buffer)
+        req.extension = EXTENSION.get(mime, '.jpg')
+        if mime == 'image/gif' and self.context.config.USE_GIFSICLE_ENGINE:
+            req.engine = self.context.modules.gif_engine
+        else:
+            req.engine = self.context.modules.engine
+
+        try:
+            normalized = yield self._load_image(req.engine, buffer, req.extension, normalize=True)
+        except Exception as e:
+            logger.exception('[ProcessWorkerHandler.process] %s', e)
+            self._error(400 if 'cannot identify image file' in str(e) else 500)
+        else:
+            if normalized is None:
+                self._error(400)
+            else:
+                self.filters_runner = self.context.filters_factory.create_instances(self.context, req.filters)
+                self.transform_image(normalized, req.engine)
+
+        result = yield self.result
+        raise gen.Return(result)
+
+
+def get_request_state(request):
+    """
+    Returns the picklable attributes of the request parameters.
+    """
+    return dict(
+        (key, value) for key, value in request.__dict__.items()
+        if key not in ('engine', 'buffer')
+    )
+
+
+def process_image(pool_size, plan):
+    """
+    Entry point of the engine process pool workers: loads, transforms and
+    encodes the image described by the plan.
+    """
+    global _worker_io_loop
+    if _worker_io_loop is None:
+        _worker_io_loop = tornado.ioloop.IOLoop()
+
+    # Not used as a context manager: leaving it would shut down the thread
+    # pools the contexts of the worker share, such as the IOExecutor.
+    context = ProcessPool.instance(pool_size).create_context()
+    context.request = RequestParameters()
+    context.request.__dict__.update(plan['request'])
+
+    try:
+        handler = ProcessWorkerHandler(context, plan['uri'])
+        return _worker_io_loop.run_sync(functools.partial(handler.process, plan['buffer']))
+    finally:
+        context.modules.cleanup()
+
+
+_worker_io_loop = None
+
+
 class ContextHandler(BaseHandler):
     def initialize(self, context):
         self.context = Context(
@@ -27,8 +27,6 @@ class BlacklistHandler(ContextHandler):
     @tornado.web.asynchronous
     @tornado.gen.coroutine
     def put(self):
-        blacklist = yield self.get_blacklist_contents()
-        blacklist += self.request.query + "\n"
         logger.debug('Adding to blacklist: %s' % self.request.query)
-        self.context.modules.storage.put('blacklist.txt', blacklist)
+        yield self.context.blacklist.add(self.context.modules.storage, self.request.query)
         self.set_status(200)
@@ -33,11 +33,49 @@ class ImagingHandler(ContextHandler):
                 kw['image'] = kw['image'][:self.context.config.MAX_ID_LENGTH]
 
         url = self.request.path
+        url_cache = self.context.url_cache
+        cache_key = (url, kw['image'])
+        security_key = getattr(self.context.server, 'security_key', None)
+
+        parsed_url = None
+        if url_cache is not None:
+            parsed_url = url_cache.get(cache_key, security_key)
+            self.context.metrics.incr('url_cache.{0}'.format('miss' if parsed_url is None else 'hit'))
+
+        if parsed_url is not None:
+            self.context.request = parsed_url.request.copy_for(self.request)
+            self.filters_plan = parsed_url.filters_plan
+        else:
+            valid, cacheable = yield self.check_url(url, kw)
+            if not valid:
+                return
+
+            if url_cache is not None and cacheable:
+                self.filters_plan = self.context.filters_factory.compile(self.context.request.filters)
+                url_cache.put(cache_key, security_key, self.context.request.copy_for(self.request), self.filters_plan)
 
+        if self.context.config.USE_BLACKLIST:
+            blacklisted = yield self.context.blacklist.contains(self.context.modules.storage, self.context.request.image_url)
+            if blacklisted:
+                self._error(400, 'Source image url has been blacklisted: %s' % self.context.request.image_url)
+                return
+
+        self.execute_image_operations()
+
+    @gen.coroutine
+    def check_url(self, url, kw):
+        """
+        Parses the url into the request parameters of the context and checks
+        its signature, answering with an error if it is not valid.
+
+        :return: Whether the url is valid and whether its validity may be
+                 cached, i.e. it does not depend on a key kept in the storage
+        :rtype: tuple
+        """
         kw['image'] = quote(kw['image'].encode('utf-8'))
         if not self.validate(kw['image']):
             self._error(400, 'No original image was specified in the given URL')
-            return
+            raise gen.Return((False, False))
 
         kw['request'] = self.request
         self.context.request = RequestParameters(**kw)
@@ -47,45 +85,48 @@ class ImagingHandler(ContextHandler):
 
         if has_none or has_both:
             self._error(400, 'URL does not have hash or unsafe, or has both: %s' % url)
-            return
+            raise gen.Return((False, False))
 
         if self.context.request.unsafe and not self.context.config.ALLOW_UNSAFE_URL:
             self._error(400, 'URL has unsafe but unsafe is not allowed by the config: %s' % url)
-            return
-
-        if self.context.config.USE_BLACKLIST:
-            blacklist = yield self.get_blacklist_contents()
-            if self.context.request.image_url in blacklist:
-                self._error(400, 'Source image url has been blacklisted: %s' % self.context.request.image_url)
-                return
+            raise gen.Return((False, False))
 
         url_signature = self.context.request.hash
-        if url_signature:
-            signer = self.context.modules.url_signer(self.context.server.security_key)
-
-            try:
-                quoted_hash = quote(self.context.request.hash)
-            except KeyError:
-                self._error(400, 'Invalid hash: %s' % self.context.request.hash)
-                return
-
-            url_to_validate = url.replace('/%s/' % self.context.request.hash, '') \
-                .replace('/%s/' % quoted_hash, '')
-
-            valid = signer.validate(unquote(url_signature), url_to_validate)
-
-            if not valid and self.context.config.STORES_CRYPTO_KEY_FOR_EACH_IMAGE:
-                # Retrieves security key for this image if it has been seen before
-                security_key = yield gen.maybe_future(self.context.modules.storage.get_crypto(self.context.request.image_url))
-                if security_key is not None:
-                    signer = self.context.modules.url_signer(security_key)
-                    valid = signer.validate(url_signature, url_to_validate)
-
-            if not valid:
-                self._error(400, 'Malformed URL: %s' % url)
-                return
-
-        self.execute_image_operations()
+        if not url_signature:
+            raise gen.Return((True, True))
+
+        signer = self.context.modules.url_signer(self.context.server.security_key)
+
+        try:
+            quoted_hash = quote(self.context.request.hash)
+        except KeyError:
+            self._error(400, 'Invalid hash: %s' % self.context.request.hash)
+            raise gen.Return((False, False))
+
+        url_to_validate = url.replace('/%s/' % self.context.request.hash, '') \
+            .replace('/%s/' % quoted_hash, '')
+
+        valid = signer.validate(unquote(url_signature), url_to_validate)
+        if valid:
+            raise gen.Return((True, True))
+
+        if self.context.config.STORES_CRYPTO_KEY_FOR_EACH_IMAGE:
+            # Retrieves security key for this image if it has been seen before,
+            # along with the image and its detector data needed later on
+            stored = yield self._get_stored(self.context.request.image_url)
+            if stored is not None:
+                security_key = stored['crypto']
+            else:
+                security_key = yield gen.maybe_future(
+                    self.context.modules.storage.get_crypto(self.context.request.image_url)
+                )
+            if security_key is not None:
+                signer = self.context.modules.url_signer(security_key)
+                valid = signer.validate(url_signature, url_to_validate)
+
+        if not valid:
+            self._error(400, 'Malformed URL: %s' % url)
+        raise gen.Return((valid, False))
 
     @tornado.web.asynchronous
     def get(self, **kw):
@@ -14,6 +14,10 @@ class LoaderResult(object):
     ERROR_NOT_FOUND = 'not_found'
     ERROR_UPSTREAM = 'upstream'
     ERROR_TIMEOUT = 'timeout'
+    ERROR_TOO_LARGE = 'too_large'
+    # The loader did not request the origin, e.g. to spare it while it is
+    # failing. The 'RetryAfter' metadata tells when to try again, in seconds.
+    ERROR_BUSY = 'busy'
 
     def __init__(self, buffer=None, successful=True, error=None, metadata=dict()):
         '''
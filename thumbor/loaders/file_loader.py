@@ -21,9 +21,17 @@ def load(context, path, callback):
     file_path = abspath(file_path)
     inside_root_path = file_path.startswith(context.config.FILE_LOADER_ROOT_PATH)
 
-    result = LoaderResult()
+    if not inside_root_path:
+        callback(LoaderResult(successful=False, error=LoaderResult.ERROR_NOT_FOUND))
+        return
 
-    if inside_root_path and exists(file_path):
+    context.io_executor.submit(callback, read, file_path)
+
+
+def read(file_path):
+    result = LoaderResult(metadata={})
+
+    if exists(file_path):
 
         with open(file_path, 'r') as f:
             stats = fstat(f.fileno())
@@ -39,4 +47,4 @@ def load(context, path, callback):
         result.error = LoaderResult.ERROR_NOT_FOUND
         result.successful = False
 
-    callback(result)
+    return result
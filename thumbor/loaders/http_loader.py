@@ -9,16 +9,516 @@
 # Copyright (c) 2011 globo.com thumbor@googlegroups.com
 
 import datetime
+import math
+import random
 import re
+import time
+import weakref
+from collections import deque, OrderedDict
 from functools import partial
 
+import pycurl
 import tornado.httpclient
+import tornado.httputil
+import tornado.ioloop
+from tornado import stack_context
+from tornado.curl_httpclient import CurlAsyncHTTPClient
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
 from six.moves.urllib.parse import quote, unquote, urlparse
 
 from . import LoaderResult
+from thumbor.engines import BaseEngine
 from thumbor.utils import logger
 from tornado.concurrent import return_future
 
+# CURLOPT_MAXAGE_CONN appeared in libcurl 7.65.0, older pycurl releases do
+# not name it
+CURLOPT_MAXAGE_CONN = getattr(pycurl, 'MAXAGE_CONN', 288)
+CURLOPT_MAXAGE_CONN_VERSION = 0x074100
+
+
+class PooledCurlAsyncHTTPClient(CurlAsyncHTTPClient):
+    '''
+    CurlAsyncHTTPClient keeping connections alive per origin host: libcurl
+    reuses the connections of its multi handle across requests. Connections
+    left idle for idle_timeout seconds are closed instead of being reused.
+    '''
+
+    def initialize(self, io_loop, max_clients=10, defaults=None, max_host_connections=0, idle_timeout=0):
+        self.idle_timeout = idle_timeout
+        if idle_timeout and pycurl.version_info()[2] < CURLOPT_MAXAGE_CONN_VERSION:
+            logger.warn('libcurl %s cannot close idle connections, HTTP_LOADER_CONNECTION_IDLE_TIMEOUT is ignored.',
+                        pycurl.version_info()[1])
+            self.idle_timeout = 0
+
+        super(PooledCurlAsyncHTTPClient, self).initialize(io_loop, max_clients=max_clients, defaults=defaults)
+        if max_host_connections:
+            self._multi.setopt(pycurl.M_MAX_HOST_CONNECTIONS, max_host_connections)
+
+    def _curl_create(self):
+        curl = super(PooledCurlAsyncHTTPClient, self)._curl_create()
+        curl.setopt(pycurl.TCP_NODELAY, 1)
+        if self.idle_timeout:
+            curl.setopt(CURLOPT_MAXAGE_CONN, self.idle_timeout)
+        return curl
+
+    def _finish(self, curl, curl_error=None, curl_message=None):
+        if not curl_error:
+            # Number of connections opened for the request, 0 if one was reused.
+            # Responses refer to the request given to fetch, not to its proxy.
+            curl.info['request'].request.new_connections = curl.getinfo(pycurl.NUM_CONNECTS)
+        super(PooledCurlAsyncHTTPClient, self)._finish(curl, curl_error, curl_message)
+
+
+class SourceTooLargeError(Exception):
+    pass
+
+
+class StreamedBody(object):
+    '''
+    Collects the body of a source image while it is downloaded and aborts
+    the download as soon as it is bigger than max_size bytes or its headers
+    show more than max_pixels pixels.
+    '''
+
+    # Bytes of the body in which the image dimensions are looked for
+    HEADER_MAX_SIZE = 256 * 1024
+
+    def __init__(self, max_size, max_pixels=None):
+        self.max_size = max_size
+        self.max_pixels = max_pixels
+        self.chunks = []
+        self.size = 0
+        self.dimensions = None
+        self.error = None
+
+    @property
+    def buffer(self):
+        return b''.join(self.chunks)
+
+    def fail(self, error):
+        self.error = error
+        raise SourceTooLargeError(error)
+
+    def on_header(self, header_line):
+        name, _, value = header_line.partition(':')
+        if name.strip().lower() == 'content-length' and value.strip().isdigit() and int(value) > self.max_size:
+            self.fail('Content-Length of {0} bytes is over {1} bytes'.format(value.strip(), self.max_size))
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+
+        if self.size > self.max_size:
+            self.fail('Body is over {0} bytes'.format(self.max_size))
+
+        if self.max_pixels and self.dimensions is None and self.size - len(chunk) < self.HEADER_MAX_SIZE:
+            self.dimensions = BaseEngine.get_dimensions(self.buffer)
+            if self.dimensions is not None and self.dimensions[0] * self.dimensions[1] > self.max_pixels:
+                self.fail('Image of {0}x{1} pixels is over {2} pixels'.format(
+                    self.dimensions[0], self.dimensions[1], self.max_pixels))
+
+    def write(self, chunk):
+        '''
+        libcurl write function: returning a number of bytes different from
+        the size of the chunk aborts the transfer.
+        '''
+        try:
+            self.append(chunk)
+        except SourceTooLargeError:
+            return 0
+
+
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client(config):
+    '''
+    Returns the HTTP client of the loader for the current IOLoop. It is
+    created once and kept for the life of the IOLoop so that connections to
+    the origins can be reused.
+    '''
+    using_proxy = config.HTTP_LOADER_PROXY_HOST and config.HTTP_LOADER_PROXY_PORT
+    use_curl = using_proxy or config.HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT
+
+    key = (
+        use_curl,
+        config.HTTP_LOADER_MAX_CLIENTS,
+        config.HTTP_LOADER_MAX_CONNECTIONS_PER_HOST,
+        config.HTTP_LOADER_CONNECTION_IDLE_TIMEOUT,
+    )
+    clients = _http_clients.setdefault(tornado.ioloop.IOLoop.current(), {})
+    client = clients.get(key)
+    if client is None:
+        if use_curl:
+            client = PooledCurlAsyncHTTPClient(
+                force_instance=True,
+                max_clients=config.HTTP_LOADER_MAX_CLIENTS,
+                max_host_connections=config.HTTP_LOADER_MAX_CONNECTIONS_PER_HOST,
+                idle_timeout=config.HTTP_LOADER_CONNECTION_IDLE_TIMEOUT,
+            )
+        else:
+            client = SimpleAsyncHTTPClient(force_instance=True, max_clients=config.HTTP_LOADER_MAX_CLIENTS)
+        clients[key] = client
+
+    return client
+
+
+class Origin(object):
+    '''
+    Fetches of the loader from one origin host. At most max_fetches of them
+    run at the same time (0 means no limit), the others wait in a queue.
+
+    After max_errors consecutive errors or timeouts (0 disables it) the
+    circuit opens: fetches fail right away, queued ones included, except for
+    one probe let through every reset_timeout seconds, until a probe
+    succeeds.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host, max_fetches=0, max_errors=0, reset_timeout=0):
+        self.host = host
+        self.max_fetches = max_fetches
+        self.max_errors = max_errors
+        self.reset_timeout = reset_timeout
+        self.active = 0
+        self.queue = deque()
+        self.state = self.CLOSED
+        self.errors = 0
+        self.last_error = None
+        self.opened_at = None
+
+    @property
+    def key(self):
+        return (self.host, self.max_fetches, self.max_errors, self.reset_timeout)
+
+    @property
+    def idle(self):
+        return not self.active and not self.queue and self.state == self.CLOSED and not self.errors
+
+    def allow(self, metrics):
+        '''
+        Returns whether a fetch can be sent to the host.
+        '''
+        if self.state == self.CLOSED:
+            return True
+
+        if time.time() - self.opened_at < self.reset_timeout:
+            return False
+
+        self.opened_at = time.time()
+        self._set_state(self.HALF_OPEN, metrics)
+        return True
+
+    @property
+    def retry_after(self):
+        '''
+        Number of seconds after which the host might be requested again.
+        '''
+        if self.state != self.OPEN:
+            return 1
+        return max(int(math.ceil(self.opened_at + self.reset_timeout - time.time())), 1)
+
+    def record(self, error, metrics):
+        '''
+        Records the outcome of a fetch: error is None when the host answered,
+        LoaderResult.ERROR_TIMEOUT or LoaderResult.ERROR_UPSTREAM otherwise.
+        '''
+        if not self.max_errors:
+            return
+
+        if error is None:
+            self.errors = 0
+            self._set_state(self.CLOSED, metrics)
+            return
+
+        self.errors += 1
+        self.last_error = error
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.errors >= self.max_errors):
+            self.opened_at = time.time()
+            self._set_state(self.OPEN, metrics)
+
+    def run(self, fetch, on_timeout, timeout=None, on_rejected=None):
+        '''
+        Calls fetch now if less than max_fetches are running, or once one of
+        them is released. Calls on_timeout instead if it waited for timeout
+        seconds, and on_rejected (on_timeout by default) if the circuit
+        opened meanwhile.
+        '''
+        if not self.max_fetches or self.active < self.max_fetches:
+            self.active += 1
+            fetch()
+            return
+
+        io_loop = tornado.ioloop.IOLoop.current()
+        entry = [stack_context.wrap(fetch), None, stack_context.wrap(on_rejected or on_timeout)]
+
+        def expire():
+            self.queue.remove(entry)
+            on_timeout()
+
+        if timeout:
+            entry[1] = io_loop.add_timeout(io_loop.time() + timeout, expire)
+        self.queue.append(entry)
+
+    def release(self):
+        self.active -= 1
+        while self.queue:
+            fetch, timeout_handle, on_rejected = self.queue.popleft()
+            if timeout_handle is not None:
+                tornado.ioloop.IOLoop.current().remove_timeout(timeout_handle)
+
+            if self.state == self.OPEN:
+                on_rejected()
+                continue
+
+            self.active += 1
+            fetch()
+            return
+
+    def _set_state(self, state, metrics):
+        if state == self.state:
+            return
+
+        logger.warn(u"Circuit of origin {0} is now {1}".format(self.host, state))
+        metrics.incr('original_image.circuit.{0}.{1}'.format(state, self.host))
+        self.state = state
+
+
+_origins = weakref.WeakKeyDictionary()
+
+
+def get_origin(config, host):
+    '''
+    Returns the Origin of host for the current IOLoop. It is kept while it
+    has fetches running or queued or while its circuit is not closed.
+    '''
+    key = (
+        host,
+        config.HTTP_LOADER_MAX_CLIENTS_PER_HOST,
+        config.HTTP_LOADER_CIRCUIT_BREAKER_ERRORS,
+        config.HTTP_LOADER_CIRCUIT_BREAKER_RESET_TIMEOUT,
+    )
+    origins = _origins.setdefault(tornado.ioloop.IOLoop.current(), {})
+    origin = origins.get(key)
+    if origin is None:
+        origin = origins[key] = Origin(*key)
+
+    return origin
+
+
+def release_origin(origin):
+    origin.release()
+    if origin.idle:
+        origins = _origins.get(tornado.ioloop.IOLoop.current(), {})
+        if origins.get(origin.key) is origin:
+            del origins[origin.key]
+
+
+def get_busy_result(origin):
+    '''
+    Returns the result of the loads failed without requesting origin, because
+    its circuit is open or because no fetch slot freed up in time.
+    '''
+    return LoaderResult(successful=False, error=LoaderResult.ERROR_BUSY, metadata={'RetryAfter': origin.retry_after})
+
+
+def get_origin_error(response, body=None):
+    '''
+    Returns the error the origin failed with, if any, for the circuit breaker.
+    '''
+    if body is not None and (body.error or getattr(response.error, 'errno', None) == pycurl.E_FILESIZE_EXCEEDED):
+        return None
+
+    if response.code == 599:
+        return LoaderResult.ERROR_TIMEOUT
+
+    if response.code >= 500:
+        return LoaderResult.ERROR_UPSTREAM
+
+    return None
+
+
+def is_retryable(response, body=None):
+    '''
+    Returns whether a load can be tried again after response: it can after
+    5xx responses and connection errors, not after timeouts.
+    '''
+    if get_origin_error(response, body) is None:
+        return False
+
+    if response.code != 599:
+        return True
+
+    if getattr(response.error, 'errno', None) == pycurl.E_OPERATION_TIMEDOUT:
+        return False
+
+    return 'timeout' not in str(response.error).lower()
+
+
+# Latencies of the last successful fetches of each origin host, by least recent use
+_latencies = OrderedDict()
+LATENCY_SAMPLES = 100
+LATENCY_MAX_HOSTS = 1000
+HEDGE_MIN_SAMPLES = 10
+
+
+def record_latency(host, seconds):
+    samples = _latencies.pop(host, None)
+    if samples is None:
+        samples = deque(maxlen=LATENCY_SAMPLES)
+    samples.append(seconds)
+    _latencies[host] = samples
+
+    while len(_latencies) > LATENCY_MAX_HOSTS:
+        _latencies.popitem(last=False)
+
+
+def get_hedge_delay(config, host):
+    '''
+    Returns the number of seconds after which a load from host that did not
+    answer yet is sent again, or None if it should not be.
+    '''
+    if not config.HTTP_LOADER_HEDGE_PERCENTILE:
+        return None
+
+    samples = _latencies.get(host)
+    if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(len(samples) * config.HTTP_LOADER_HEDGE_PERCENTILE / 100.0))
+    return max(samples[index], config.HTTP_LOADER_HEDGE_MIN_DELAY)
+
+
+class OriginFetch(object):
+    '''
+    One load of the HTTP loader from an Origin. If the origin takes longer
+    to answer than usual (see get_hedge_delay), the request is sent a second
+    time and the first response is used. Requests failing with an error
+    worth retrying (see is_retryable) are sent again after a jittered
+    exponential backoff, up to HTTP_LOADER_MAX_RETRIES times.
+    '''
+
+    def __init__(self, context, client, origin, url, new_request, callback):
+        self.context = context
+        self.config = context.config
+        self.client = client
+        self.origin = origin
+        self.url = url
+        self.new_request = new_request
+        self.callback = callback
+        self.retries = 0
+        self.pending = 0
+        self.done = False
+        self.hedge_timeout = None
+
+    def start(self):
+        self.send()
+
+        delay = get_hedge_delay(self.config, self.origin.host)
+        if delay is not None:
+            io_loop = tornado.ioloop.IOLoop.current()
+            self.hedge_timeout = io_loop.add_timeout(io_loop.time() + delay, self.hedge)
+
+    def send(self):
+        req, body = self.new_request()
+        self.pending += 1
+
+        def fetch():
+            self.client.fetch(req, callback=partial(self.on_response, body=body, req_start=datetime.datetime.now()))
+
+        queue_timeout = min(self.config.HTTP_LOADER_CONNECT_TIMEOUT, self.config.HTTP_LOADER_REQUEST_TIMEOUT)
+        self.origin.run(fetch, self.on_queue_timeout, queue_timeout, self.on_circuit_open)
+
+    def hedge(self):
+        self.hedge_timeout = None
+        if self.done or self.origin.state != Origin.CLOSED:
+            return
+
+        self.context.metrics.incr('original_image.hedged.{0}'.format(self.origin.host))
+        self.send()
+
+    def retry(self):
+        self.cancel_hedge()
+        self.retries += 1
+        self.context.metrics.incr('original_image.retried.{0}'.format(self.origin.host))
+
+        backoff = random.uniform(0, self.config.HTTP_LOADER_RETRY_BACKOFF * 2 ** (self.retries - 1))
+        io_loop = tornado.ioloop.IOLoop.current()
+        io_loop.add_timeout(io_loop.time() + backoff, self.resend)
+
+    def resend(self):
+        if not self.origin.allow(self.context.metrics):
+            self.context.metrics.incr('original_image.circuit.rejected.{0}'.format(self.origin.host))
+            self.finish(LoaderResult(successful=False, error=self.origin.last_error))
+            return
+
+        self.send()
+
+    def should_retry(self, response, body):
+        if self.retries >= self.config.HTTP_LOADER_MAX_RETRIES or not is_retryable(response, body):
+            return False
+
+        is_cancelled = getattr(getattr(self.context, 'request', None), 'is_cancelled', None)
+        return is_cancelled is None or not is_cancelled()
+
+    def on_response(self, response, body, req_start):
+        self.pending -= 1
+        error = get_origin_error(response, body)
+        self.origin.record(error, self.context.metrics)
+        release_origin(self.origin)
+        if error is None and response.request_time is not None:
+            record_latency(self.origin.host, response.request_time)
+
+        if self.done:
+            # A hedged request answered first
+            return
+
+        if is_retryable(response, body) and self.pending:
+            # Waits for the other request of the load instead
+            return
+
+        if self.should_retry(response, body):
+            logger.warn(u"ERROR retrieving image {0}: {1}, retrying.".format(self.url, str(response.error)))
+            self.retry()
+            return
+
+        self.done = True
+        self.cancel_hedge()
+        return_contents(response, self.url, self.callback, self.context, req_start=req_start, body=body)
+
+    def on_queue_timeout(self):
+        self.pending -= 1
+        if self.done or self.pending:
+            return
+
+        self.context.metrics.incr('original_image.queue_timeout.{0}'.format(self.origin.host))
+        logger.warn(u"ERROR retrieving image {0}: Timed out waiting for origin {1}.".format(self.url, self.origin.host))
+        self.finish(get_busy_result(self.origin))
+
+    def on_circuit_open(self):
+        self.pending -= 1
+        if self.done or self.pending:
+            return
+
+        self.context.metrics.incr('original_image.circuit.rejected.{0}'.format(self.origin.host))
+        logger.warn(u"ERROR retrieving image {0}: Circuit of origin {1} is open.".format(self.url, self.origin.host))
+        self.finish(get_busy_result(self.origin))
+
+    def finish(self, result):
+        self.done = True
+        self.cancel_hedge()
+        self.callback(result)
+
+    def cancel_hedge(self):
+        if self.hedge_timeout is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.hedge_timeout)
+            self.hedge_timeout = None
+
 
 def encode_url(url):
     if url == unquote(url):
@@ -59,7 +559,7 @@ def validate(context, url, normalize_url_func=_normalize_url):
     return False
 
 
-def return_contents(response, url, callback, context, req_start=None):
+def return_contents(response, url, callback, context, req_start=None, body=None):
     if req_start:
         finish = datetime.datetime.now()
         res = urlparse(url)
@@ -68,9 +568,22 @@ def return_contents(response, url, callback, context, req_start=None):
             (finish - req_start).total_seconds() * 1000
         )
 
-    result = LoaderResult()
+    result = LoaderResult(metadata={})
     context.metrics.incr('original_image.status.' + str(response.code))
-    if response.error:
+    buffer = response.body if body is None else body.buffer
+    if response.code == 304:
+        # The image stored with the validators sent by load_sync did not change
+        result.metadata['NotModified'] = True
+        context.metrics.incr('original_image.not_modified')
+
+    elif body is not None and (body.error or getattr(response.error, 'errno', None) == pycurl.E_FILESIZE_EXCEEDED):
+        result.successful = False
+        result.error = LoaderResult.ERROR_TOO_LARGE
+        context.metrics.incr('original_image.too_large')
+
+        logger.warn(u"ERROR retrieving image {0}: {1}".format(url, body.error or 'Content-Length is too large.'))
+
+    elif response.error:
         result.successful = False
         if response.code == 599:
             # Return a Gateway Timeout status downstream if upstream times out
@@ -80,7 +593,7 @@ def return_contents(response, url, callback, context, req_start=None):
 
         logger.warn(u"ERROR retrieving image {0}: {1}".format(url, str(response.error)))
 
-    elif response.body is None or len(response.body) == 0:
+    elif buffer is None or len(buffer) == 0:
         result.successful = False
         result.error = LoaderResult.ERROR_UPSTREAM
 
@@ -89,9 +602,17 @@ def return_contents(response, url, callback, context, req_start=None):
         if response.time_info:
             for x in response.time_info:
                 context.metrics.timing('original_image.time_info.' + x, response.time_info[x] * 1000)
-            context.metrics.timing('original_image.time_info.bytes_per_second', len(response.body) / response.time_info['total'])
-        result.buffer = response.body
-        context.metrics.incr('original_image.response_bytes', len(response.body))
+            context.metrics.timing('original_image.time_info.bytes_per_second', len(buffer) / response.time_info['total'])
+        result.buffer = buffer
+        context.metrics.incr('original_image.response_bytes', len(buffer))
+
+        for header, key in (('ETag', 'ETag'), ('Last-Modified', 'LastModified')):
+            if response.headers and header in response.headers:
+                result.metadata[key] = response.headers[header]
+
+    new_connections = getattr(getattr(response, 'request', None), 'new_connections', None)
+    if new_connections is not None:
+        context.metrics.incr('original_image.connection.{0}'.format('new' if new_connections else 'reused'))
 
     callback(result)
 
@@ -102,16 +623,8 @@ def load(context, url, callback, normalize_url_func=_normalize_url):
 
 
 def load_sync(context, url, callback, normalize_url_func):
-    using_proxy = context.config.HTTP_LOADER_PROXY_HOST and context.config.HTTP_LOADER_PROXY_PORT
-    if using_proxy or context.config.HTTP_LOADER_CURL_ASYNC_HTTP_CLIENT:
-        http_client_implementation = 'tornado.curl_httpclient.CurlAsyncHTTPClient'
-        prepare_curl_callback = _get_prepare_curl_callback(context.config)
-    else:
-        http_client_implementation = None  # default
-        prepare_curl_callback = None
-
-    tornado.httpclient.AsyncHTTPClient.configure(http_client_implementation, max_clients=context.config.HTTP_LOADER_MAX_CLIENTS)
-    client = tornado.httpclient.AsyncHTTPClient()
+    client = get_http_client(context.config)
+    is_curl = isinstance(client, CurlAsyncHTTPClient)
 
     user_agent = None
     headers = {}
@@ -129,44 +642,91 @@ def load_sync(context, url, callback, normalize_url_func):
     if user_agent is None and 'User-Agent' not in headers:
         user_agent = context.config.HTTP_LOADER_DEFAULT_USER_AGENT
 
+    # Validators of an expired copy of the image in the storage, see BaseHandler._load_source
+    validators = getattr(getattr(context, 'request', None), 'source_validators', None)
+    if validators:
+        headers = tornado.httputil.HTTPHeaders(headers)
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'LastModified' in validators:
+            headers['If-Modified-Since'] = validators['LastModified']
+
     url = normalize_url_func(url)
-    req = tornado.httpclient.HTTPRequest(
-        url=url,
-        headers=headers,
-        connect_timeout=context.config.HTTP_LOADER_CONNECT_TIMEOUT,
-        request_timeout=context.config.HTTP_LOADER_REQUEST_TIMEOUT,
-        follow_redirects=context.config.HTTP_LOADER_FOLLOW_REDIRECTS,
-        max_redirects=context.config.HTTP_LOADER_MAX_REDIRECTS,
-        user_agent=user_agent,
-        proxy_host=encode(context.config.HTTP_LOADER_PROXY_HOST),
-        proxy_port=context.config.HTTP_LOADER_PROXY_PORT,
-        proxy_username=encode(context.config.HTTP_LOADER_PROXY_USERNAME),
-        proxy_password=encode(context.config.HTTP_LOADER_PROXY_PASSWORD),
-        ca_certs=encode(context.config.HTTP_LOADER_CA_CERTS),
-        client_key=encode(context.config.HTTP_LOADER_CLIENT_KEY),
-        client_cert=encode(context.config.HTTP_LOADER_CLIENT_CERT),
-        validate_cert=context.config.HTTP_LOADER_VALIDATE_CERTS,
-        prepare_curl_callback=prepare_curl_callback
-    )
 
-    start = datetime.datetime.now()
-    client.fetch(req, callback=partial(return_contents, url=url, callback=callback, context=context, req_start=start))
+    def new_request():
+        # Each attempt of the load (see OriginFetch) collects its own body
+        body = None
+        header_callback = None
+        streaming_callback = None
+        if context.config.HTTP_LOADER_MAX_BODY_SIZE:
+            body = StreamedBody(context.config.HTTP_LOADER_MAX_BODY_SIZE, context.config.MAX_PIXELS)
+            # Without a stack context, errors of the callbacks reach the HTTP
+            # client (and abort the download) instead of the caller of load
+            with stack_context.NullContext():
+                streaming_callback = stack_context.wrap(body.append)
+                if not is_curl:
+                    # libcurl checks the Content-Length itself, see _get_prepare_curl_callback
+                    header_callback = stack_context.wrap(body.on_header)
+
+        if is_curl:
+            prepare_curl_callback = _get_prepare_curl_callback(context.config, body)
+        else:
+            prepare_curl_callback = None
+
+        req = tornado.httpclient.HTTPRequest(
+            url=url,
+            headers=headers,
+            connect_timeout=context.config.HTTP_LOADER_CONNECT_TIMEOUT,
+            request_timeout=context.config.HTTP_LOADER_REQUEST_TIMEOUT,
+            follow_redirects=context.config.HTTP_LOADER_FOLLOW_REDIRECTS,
+            max_redirects=context.config.HTTP_LOADER_MAX_REDIRECTS,
+            user_agent=user_agent,
+            proxy_host=encode(context.config.HTTP_LOADER_PROXY_HOST),
+            proxy_port=context.config.HTTP_LOADER_PROXY_PORT,
+            proxy_username=encode(context.config.HTTP_LOADER_PROXY_USERNAME),
+            proxy_password=encode(context.config.HTTP_LOADER_PROXY_PASSWORD),
+            ca_certs=encode(context.config.HTTP_LOADER_CA_CERTS),
+            client_key=encode(context.config.HTTP_LOADER_CLIENT_KEY),
+            client_cert=encode(context.config.HTTP_LOADER_CLIENT_CERT),
+            validate_cert=context.config.HTTP_LOADER_VALIDATE_CERTS,
+            prepare_curl_callback=prepare_curl_callback,
+            header_callback=header_callback,
+            streaming_callback=streaming_callback
+        )
+        return req, body
+
+    origin = get_origin(context.config, urlparse(url).netloc)
+    if not origin.allow(context.metrics):
+        context.metrics.incr('original_image.circuit.rejected.{0}'.format(origin.host))
+        logger.warn(u"ERROR retrieving image {0}: Circuit of origin {1} is open.".format(url, origin.host))
+        callback(get_busy_result(origin))
+        return
+
+    OriginFetch(context, client, origin, url, new_request, callback).start()
 
 
 def encode(string):
     return None if string is None else string.encode('ascii')
 
 
-def _get_prepare_curl_callback(config):
-    if config.HTTP_LOADER_CURL_LOW_SPEED_TIME == 0 or config.HTTP_LOADER_CURL_LOW_SPEED_LIMIT == 0:
+def _get_prepare_curl_callback(config, body=None):
+    low_speed_timeout = config.HTTP_LOADER_CURL_LOW_SPEED_TIME != 0 and config.HTTP_LOADER_CURL_LOW_SPEED_LIMIT != 0
+    if not low_speed_timeout and body is None:
         return None
 
     class CurlOpts:
-        def __init__(self, config):
+        def __init__(self, config, body):
             self.config = config
+            self.body = body
 
         def prepare_curl_callback(self, curl):
-            curl.setopt(curl.LOW_SPEED_TIME, self.config.HTTP_LOADER_CURL_LOW_SPEED_TIME)
-            curl.setopt(curl.LOW_SPEED_LIMIT, self.config.HTTP_LOADER_CURL_LOW_SPEED_LIMIT)
-
-    return CurlOpts(config).prepare_curl_callback
+            if low_speed_timeout:
+                curl.setopt(curl.LOW_SPEED_TIME, self.config.HTTP_LOADER_CURL_LOW_SPEED_TIME)
+                curl.setopt(curl.LOW_SPEED_LIMIT, self.config.HTTP_LOADER_CURL_LOW_SPEED_LIMIT)
+            if self.body is not None:
+                # Tornado runs the streaming callback later on the IOLoop, the
+                # body is collected in the write function to be able to abort
+                curl.setopt(curl.MAXFILESIZE, self.body.max_size)
+                curl.setopt(curl.WRITEFUNCTION, self.body.write)
+
+    return CurlOpts(config, body).prepare_curl_callback
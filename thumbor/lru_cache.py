@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    In-process cache evicting its least recently used entries once they
+    weigh more than max_size. Each entry weighs 1 unless weigh is
+    overridden, so that max_size is a number of entries by default.
+
+    The caches built on it are shared by the requests of a process (see
+    instance) and are meant to be used from the IOLoop thread only: they
+    are not locked.
+    """
+
+    _instances = {}
+
+    @classmethod
+    def instance(cls, *args):
+        key = (cls,) + args
+        instance = LRUCache._instances.get(key)
+        if instance is None:
+            instance = LRUCache._instances[key] = cls(*args)
+        return instance
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def weigh(self, value):
+        return 1
+
+    def get(self, key):
+        """
+        Returns the value of key, now the most recently used, or None.
+        """
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        Caches value under key, evicting the least recently used entries to
+        make room for it. Returns the number of evicted entries.
+        """
+        self.remove(key)
+
+        weight = self.weigh(value)
+        if weight > self.max_size:
+            return 0
+
+        evicted = 0
+        while self.entries and self.size + weight > self.max_size:
+            oldest, old_value = self.entries.popitem(last=False)
+            self.size -= self.weigh(old_value)
+            evicted += 1
+
+        self.entries[key] = value
+        self.size += weight
+        return evicted
+
+    def remove(self, key):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.size -= self.weigh(value)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -22,3 +22,26 @@ class BaseMetrics(object):
 
     def timing(self, metricname, value):
         raise NotImplementedError()
+
+
+class WorkerMetrics(BaseMetrics):
+    """
+    Reports every metric both as is and prefixed with the id of the server
+    process, when running thumbor with more than one process.
+    """
+
+    def __init__(self, metrics, worker_id):
+        super(WorkerMetrics, self).__init__(metrics.config)
+        self.metrics = metrics
+        self.prefix = 'worker.{0}.'.format(worker_id)
+
+    def initialize(self, handler):
+        self.metrics.initialize(handler)
+
+    def incr(self, metricname, value=1):
+        self.metrics.incr(metricname, value)
+        self.metrics.incr(self.prefix + metricname, value)
+
+    def timing(self, metricname, value):
+        self.metrics.timing(metricname, value)
+        self.metrics.timing(self.prefix + metricname, value)
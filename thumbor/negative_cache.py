@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import time
+
+from thumbor.lru_cache import LRUCache
+
+
+class NegativeCache(LRUCache):
+    """
+    In-process cache of the errors of the loader (e.g. not found or timed
+    out originals), so that broken urls do not reach the origin on every
+    request.
+
+    Each error expires after its own number of seconds. When more than
+    max_entries urls are cached, the least recently used ones are evicted
+    (see LRUCache).
+    """
+
+    def get(self, url):
+        """
+        Returns the cached loader error of url or None.
+        """
+        entry = super(NegativeCache, self).get(url)
+        if entry is None:
+            return None
+
+        error, expires_at = entry
+        if expires_at <= time.time():
+            self.remove(url)
+            return None
+
+        return error
+
+    def put(self, url, error, expiration):
+        """
+        Caches the loader error of url for expiration seconds.
+        """
+        super(NegativeCache, self).put(url, (error, time.time() + expiration))
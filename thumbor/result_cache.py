@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import calendar
+import time
+
+from thumbor.lru_cache import LRUCache
+from thumbor.result_storages import ResultStorageResult
+
+
+class ResultCache(LRUCache):
+    """
+    In-process cache of generated images checked before the result storage.
+
+    Entries are evicted by least recent use when the cached images exceed
+    max_size bytes (see LRUCache) and expire expiration seconds after the
+    image was stored (0 means never).
+    """
+
+    def __init__(self, max_size, expiration=0):
+        super(ResultCache, self).__init__(max_size)
+        self.expiration = expiration
+
+    def weigh(self, entry):
+        return len(entry[0])
+
+    def get(self, key, metrics=None):
+        """
+        Returns the cached ResultStorageResult for key or None.
+        """
+        entry = super(ResultCache, self).get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.time():
+            self.remove(key)
+            self._incr(metrics, 'result_cache.expired')
+            entry = None
+
+        if entry is None:
+            self._incr(metrics, 'result_cache.miss')
+            return None
+
+        self._incr(metrics, 'result_cache.hit')
+
+        buffer, metadata, expires_at = entry
+        return ResultStorageResult(buffer=buffer, metadata=dict(metadata), successful=True)
+
+    def put(self, key, buffer, metadata, metrics=None):
+        """
+        Caches buffer with its metadata (as in ResultStorageResult) under key,
+        evicting the least recently used entries to make room for it.
+        """
+        expires_at = None
+        if self.expiration:
+            last_modified = metadata.get('LastModified')
+            stored_at = calendar.timegm(last_modified.utctimetuple()) if last_modified else time.time()
+            expires_at = stored_at + self.expiration
+            if expires_at <= time.time():
+                self.remove(key)
+                return
+
+        evicted = super(ResultCache, self).put(key, (buffer, metadata, expires_at))
+        for i in range(evicted):
+            self._incr(metrics, 'result_cache.evicted')
+
+    def _incr(self, metrics, name):
+        if metrics is not None:
+            metrics.incr(name)
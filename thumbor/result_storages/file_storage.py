@@ -15,6 +15,7 @@ import pytz
 
 from os.path import exists, dirname, join, getmtime, abspath
 
+from thumbor.disk_cache import DiskCacheJanitor
 from thumbor.engines import BaseEngine
 from thumbor.result_storages import BaseStorage
 from thumbor.utils import logger, deprecated
@@ -30,16 +31,41 @@ class Storage(BaseStorage):
     def is_auto_webp(self):
         return self.context.config.AUTO_WEBP and self.context.request.accepts_webp
 
+    @property
+    def janitor(self):
+        config = self.context.config
+        return DiskCacheJanitor.for_context(
+            self.context,
+            config.RESULT_STORAGE_FILE_STORAGE_ROOT_PATH,
+            config.RESULT_STORAGE_FILE_STORAGE_MAX_SIZE,
+            config.RESULT_STORAGE_FILE_STORAGE_MAX_FILES,
+            config.get('RESULT_STORAGE_EXPIRATION_SECONDS', None),
+        )
+
     def put(self, bytes):
+        '''
+        Writes the image behind the request: the write is queued on the I/O
+        executor and dropped if RESULT_STORAGE_MAX_PENDING_WRITES are already
+        waiting.
+        '''
         file_abspath = self.normalize_path(self.context.request.url)
         if not self.validate_path(file_abspath):
             logger.warn("[RESULT_STORAGE] unable to write outside root path: %s" % file_abspath)
             return
-        temp_abspath = "%s.%s" % (file_abspath, str(uuid4()).replace('-', ''))
-        file_dir_abspath = dirname(file_abspath)
-        logger.debug("[RESULT_STORAGE] putting at %s (%s)" % (file_abspath, file_dir_abspath))
+        logger.debug("[RESULT_STORAGE] putting at %s" % file_abspath)
 
-        self.ensure_dir(file_dir_abspath)
+        if not self.context.io_executor.write_behind(self.write_file, file_abspath, bytes):
+            logger.warn("[RESULT_STORAGE] too many pending writes, not storing %s" % file_abspath)
+            self.context.metrics.incr('result_storage.write_dropped')
+            return
+
+        janitor = self.janitor
+        if janitor is not None:
+            janitor.record(file_abspath, len(bytes))
+
+    def write_file(self, file_abspath, bytes):
+        temp_abspath = "%s.%s" % (file_abspath, str(uuid4()).replace('-', ''))
+        self.ensure_dir(dirname(file_abspath))
 
         with open(temp_abspath, 'w') as _file:
             _file.write(bytes)
@@ -55,23 +81,28 @@ class Storage(BaseStorage):
             return None
         logger.debug("[RESULT_STORAGE] getting from %s" % file_abspath)
 
+        janitor = self.janitor
+        if janitor is not None:
+            janitor.touch(file_abspath)
+
+        self.context.io_executor.submit(callback, self.read_file, file_abspath)
+
+    def read_file(self, file_abspath):
         if not exists(file_abspath) or self.is_expired(file_abspath):
             logger.debug("[RESULT_STORAGE] image not found at %s" % file_abspath)
-            callback(None)
-        else:
-            with open(file_abspath, 'r') as f:
-                buffer = f.read()
-
-            result = ResultStorageResult(
-                buffer=buffer,
-                metadata={
-                    'LastModified': datetime.fromtimestamp(getmtime(file_abspath)).replace(tzinfo=pytz.utc),
-                    'ContentLength': len(buffer),
-                    'ContentType': BaseEngine.get_mimetype(buffer)
-                }
-            )
-
-            callback(result)
+            return None
+
+        with open(file_abspath, 'r') as f:
+            buffer = f.read()
+
+        return ResultStorageResult(
+            buffer=buffer,
+            metadata={
+                'LastModified': datetime.fromtimestamp(getmtime(file_abspath)).replace(tzinfo=pytz.utc),
+                'ContentLength': len(buffer),
+                'ContentType': BaseEngine.get_mimetype(buffer)
+            }
+        )
 
     def validate_path(self, path):
         return abspath(path).startswith(self.context.config.RESULT_STORAGE_FILE_STORAGE_ROOT_PATH)
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import time
+import weakref
+from datetime import datetime, timedelta
+
+import pytz
+import tornado.ioloop
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from thumbor.connection_pool import ConnectionPool
+from thumbor.engines import BaseEngine
+from thumbor.result_storages import BaseStorage, ResultStorageResult
+from thumbor.utils import logger
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisClient(object):
+    '''
+    Non-blocking client of the redis protocol. Each call to execute sends
+    its commands in one pipeline and reads all their replies.
+    '''
+
+    def __init__(self, server, db=0, password=None, max_connections=4, timeout=1):
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.pool = ConnectionPool(server, max_connections, 6379, prepare=self.prepare)
+
+    @gen.coroutine
+    def prepare(self, stream):
+        commands = []
+        if self.password:
+            commands.append(('AUTH', self.password))
+        if self.db:
+            commands.append(('SELECT', self.db))
+        if commands:
+            replies = yield self._execute(stream, commands)
+            self.check(replies)
+
+    @gen.coroutine
+    def execute(self, *commands):
+        '''
+        Returns the replies of commands, raising the first error replied.
+        '''
+        stream = yield self.pool.acquire(self.timeout)
+
+        reuse = False
+        try:
+            replies = yield gen.with_timeout(
+                timedelta(seconds=self.timeout),
+                self._execute(stream, commands),
+                quiet_exceptions=(StreamClosedError, IOError)
+            )
+            reuse = True
+        finally:
+            self.pool.release(stream, reuse)
+
+        raise gen.Return(self.check(replies))
+
+    @staticmethod
+    def check(replies):
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    @classmethod
+    def encode(cls, command):
+        args = [cls.to_bytes(arg) for arg in command]
+        return b'*%d\r\n' % len(args) + b''.join(b'$%d\r\n%s\r\n' % (len(arg), arg) for arg in args)
+
+    @staticmethod
+    def to_bytes(value):
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, float):
+            return repr(value).encode('ascii')
+        if not isinstance(value, type(u'')):
+            value = str(value)
+        return value.encode('utf-8')
+
+    @gen.coroutine
+    def _execute(self, stream, commands):
+        yield stream.write(b''.join(self.encode(command) for command in commands))
+        replies = []
+        for command in commands:
+            reply = yield self._read_reply(stream)
+            replies.append(reply)
+        raise gen.Return(replies)
+
+    @gen.coroutine
+    def _read_reply(self, stream):
+        line = yield stream.read_until(b'\r\n')
+        kind, value = line[:1], line[1:-2]
+
+        if kind == b'+':
+            raise gen.Return(value)
+        if kind == b'-':
+            raise gen.Return(RedisError(value))
+        if kind == b':':
+            raise gen.Return(int(value))
+        if kind == b'$':
+            if int(value) < 0:
+                raise gen.Return(None)
+            data = yield stream.read_bytes(int(value) + 2)
+            raise gen.Return(data[:-2])
+        if kind == b'*':
+            if int(value) < 0:
+                raise gen.Return(None)
+            items = []
+            for i in range(int(value)):
+                item = yield self._read_reply(stream)
+                items.append(item)
+            raise gen.Return(items)
+
+        raise RedisError('unexpected reply: %r' % line)
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(config):
+    '''
+    Returns the redis client of the current IOLoop, kept for the life of the
+    IOLoop so that connections are reused.
+    '''
+    key = (
+        '%s:%d' % (config.REDIS_RESULT_STORAGE_SERVER_HOST, config.REDIS_RESULT_STORAGE_SERVER_PORT),
+        config.REDIS_RESULT_STORAGE_SERVER_DB,
+        config.REDIS_RESULT_STORAGE_SERVER_PASSWORD,
+        config.REDIS_RESULT_STORAGE_MAX_CONNECTIONS,
+        config.REDIS_RESULT_STORAGE_TIMEOUT,
+    )
+    clients = _clients.setdefault(tornado.ioloop.IOLoop.current(), {})
+    client = clients.get(key)
+    if client is None:
+        client = clients[key] = RedisClient(*key)
+    return client
+
+
+class Storage(BaseStorage):
+    '''
+    Stores each generated image in a redis hash along with its content type
+    and last modification date. Images expire after
+    RESULT_STORAGE_EXPIRATION_SECONDS using the TTLs of redis, and a hit
+    is served by a single round trip. Redis errors are logged and make
+    images not found.
+    '''
+
+    @property
+    def client(self):
+        return get_client(self.context.config)
+
+    @property
+    def is_auto_webp(self):
+        return self.context.config.AUTO_WEBP and self.context.request.accepts_webp
+
+    @property
+    def expiration(self):
+        return self.context.config.RESULT_STORAGE_EXPIRATION_SECONDS or 0
+
+    @property
+    def key(self):
+        url = self.context.request.url
+        if self.is_auto_webp:
+            url = 'webp:%s' % url
+        return 'thumbor-result:%s' % url
+
+    @gen.coroutine
+    def put(self, bytes):
+        key = self.key
+        commands = [
+            ('MULTI',),
+            ('DEL', key),
+            ('HMSET', key,
+             'buffer', bytes,
+             'content_type', BaseEngine.get_mimetype(bytes) or '',
+             'last_modified', time.time()),
+        ]
+        if self.expiration:
+            commands.append(('EXPIRE', key, int(self.expiration)))
+        commands.append(('EXEC',))
+
+        logger.debug("[RESULT_STORAGE] putting at %s" % key)
+        try:
+            yield self.client.execute(*commands)
+        except Exception as e:
+            logger.warn("[RESULT_STORAGE] unable to store %s in redis: %s" % (key, e))
+
+    @gen.coroutine
+    def get(self):
+        key = self.key
+        logger.debug("[RESULT_STORAGE] getting from %s" % key)
+
+        item = yield self.get_item(key)
+        if item is None:
+            raise gen.Return(None)
+
+        buffer = item['buffer']
+        metadata = {
+            'LastModified': self.to_datetime(item['last_modified']),
+            'ContentLength': len(buffer),
+        }
+        if item.get('content_type'):
+            metadata['ContentType'] = item['content_type']
+
+        raise gen.Return(ResultStorageResult(buffer=buffer, metadata=metadata))
+
+    @gen.coroutine
+    def last_updated(self):
+        item = yield self.get_item(self.key)
+        if item is None:
+            raise gen.Return(True)
+        raise gen.Return(self.to_datetime(item['last_modified']))
+
+    @gen.coroutine
+    def get_item(self, key):
+        '''
+        Returns the hash stored at key, or None if there is none. Images
+        stored before RESULT_STORAGE_EXPIRATION_SECONDS was set are given
+        an expiration.
+        '''
+        try:
+            fields, ttl = yield self.client.execute(('HGETALL', key), ('TTL', key))
+        except Exception as e:
+            logger.warn("[RESULT_STORAGE] unable to get %s from redis: %s" % (key, e))
+            raise gen.Return(None)
+
+        item = dict(zip(fields[::2], fields[1::2]))
+        if 'buffer' not in item or 'last_modified' not in item:
+            logger.debug("[RESULT_STORAGE] image not found at %s" % key)
+            raise gen.Return(None)
+
+        if ttl == -1 and self.expiration:
+            tornado.ioloop.IOLoop.current().add_future(
+                self.client.execute(('EXPIRE', key, int(self.expiration))),
+                lambda future: future.exception()
+            )
+
+        raise gen.Return(item)
+
+    @staticmethod
+    def to_datetime(timestamp):
+        return datetime.utcfromtimestamp(float(timestamp)).replace(tzinfo=pytz.utc)
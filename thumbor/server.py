@@ -20,6 +20,7 @@ import socket
 from os.path import expanduser, dirname
 
 import tornado.ioloop
+import tornado.process
 from tornado.httpserver import HTTPServer
 
 from thumbor.console import get_server_parameters
@@ -119,13 +120,29 @@ def run_server(application, context):
         sock = socket.fromfd(fd_number,
                              socket.AF_INET | socket.AF_INET6,
                              socket.SOCK_STREAM)
+        fork_processes(context)
         server.add_socket(sock)
     else:
         server.bind(context.server.port, context.server.ip)
+        fork_processes(context)
 
     server.start(1)
 
 
+def fork_processes(context):
+    '''
+    Forks the server processes once the listening socket is bound. The parent
+    process stays as a supervisor that restarts crashed processes and only
+    the forked processes return from this function.
+    '''
+    processes = context.server.processes
+    if processes == 1:
+        return
+
+    context.server.worker_id = tornado.process.fork_processes(processes)
+    logging.debug('thumbor process %d started' % context.server.worker_id)
+
+
 def gc_collect():
     collected = gc.collect()
     if collected > 0:
@@ -10,6 +10,7 @@
 
 import os
 from os.path import exists
+from tornado import gen
 from tornado.concurrent import return_future
 
 
@@ -38,6 +39,36 @@ class BaseStorage(object):
         '''
         raise NotImplementedError()
 
+    def put_validators(self, path, validators):
+        '''
+        Stores the HTTP validators of the image stored at path (its 'ETag'
+        and 'LastModified' headers), used to revalidate it once expired.
+
+        :returns: Nothing. This method is expected to be asynchronous.
+        :rtype: None
+        '''
+        raise NotImplementedError()
+
+    def put_loader_error(self, path, error, expiration):
+        '''
+        Stores the error of the loader for the image at path (see
+        LoaderResult.error) for expiration seconds.
+
+        :returns: Nothing. This method is expected to be asynchronous.
+        :rtype: None
+        '''
+        raise NotImplementedError()
+
+    def refresh(self, path):
+        '''
+        Marks the image stored at path as fresh again, once the origin
+        confirmed that it did not change.
+
+        :returns: False if the image is no longer stored. This method is expected to be asynchronous.
+        :rtype: bool
+        '''
+        raise NotImplementedError()
+
     @return_future
     def get_crypto(self, path, callback):
         raise NotImplementedError()
@@ -46,6 +77,22 @@ class BaseStorage(object):
     def get_detector_data(self, path, callback):
         raise NotImplementedError()
 
+    @return_future
+    def get_validators(self, path, callback):
+        '''
+        Returns the HTTP validators of the image stored at path, even if it
+        is expired, or None.
+        '''
+        raise NotImplementedError()
+
+    @return_future
+    def get_loader_error(self, path, callback):
+        '''
+        Returns the unexpired error of the loader for the image at path, as
+        an (error, expires_at) tuple where expires_at is a timestamp, or None.
+        '''
+        raise NotImplementedError()
+
     @return_future
     def get(self, path, callback):
         raise NotImplementedError()
@@ -57,6 +104,29 @@ class BaseStorage(object):
     def remove(self, path):
         raise NotImplementedError()
 
+    @gen.coroutine
+    def get_all(self, path):
+        '''
+        Returns a dict of the 'image', 'crypto' and 'detector' data stored
+        for path, None for each one that is not stored (or not supported by
+        the storage). They are looked up concurrently; storages able to get
+        them in one request should override it.
+        '''
+        image, crypto, detector = yield [
+            self._get_or_none(self.get, path),
+            self._get_or_none(self.get_crypto, path),
+            self._get_or_none(self.get_detector_data, path),
+        ]
+        raise gen.Return({'image': image, 'crypto': crypto, 'detector': detector})
+
+    @gen.coroutine
+    def _get_or_none(self, method, path):
+        try:
+            result = yield gen.maybe_future(method(path))
+        except NotImplementedError:
+            result = None
+        raise gen.Return(result)
+
     def ensure_dir(self, path):
         if not exists(path):
             try:
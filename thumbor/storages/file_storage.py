@@ -8,111 +8,154 @@
 # http://www.opensource.org/licenses/mit-license
 # Copyright (c) 2011 globo.com thumbor@googlegroups.com
 
+import errno
 import os
 from shutil import move
 from json import dumps, loads
 from datetime import datetime
 from os.path import exists, dirname, getmtime, splitext
 import hashlib
+import time
 from uuid import uuid4
 
 import thumbor.storages as storages
+from thumbor.disk_cache import DiskCacheJanitor
 from thumbor.utils import logger
 from tornado.concurrent import return_future
 
 
 class Storage(storages.BaseStorage):
+    '''
+    Stores the images on the filesystem. The disk operations run on the I/O
+    executor of the context (see FILE_IO_THREADPOOL_SIZE), the methods
+    return futures.
+    '''
+
+    @property
+    def janitor(self):
+        config = self.context.config
+        return DiskCacheJanitor.for_context(
+            self.context,
+            config.FILE_STORAGE_ROOT_PATH,
+            config.FILE_STORAGE_MAX_SIZE,
+            config.FILE_STORAGE_MAX_FILES,
+            config.STORAGE_EXPIRATION_SECONDS,
+        )
 
     def put(self, path, bytes):
         file_abspath = self.path_on_filesystem(path)
-        temp_abspath = "%s.%s" % (file_abspath, str(uuid4()).replace('-', ''))
-        file_dir_abspath = dirname(file_abspath)
-
-        logger.debug('creating tempfile for %s in %s...' % (path, temp_abspath))
+        logger.debug('storing %s at %s...' % (path, file_abspath))
 
-        self.ensure_dir(file_dir_abspath)
-
-        with open(temp_abspath, 'w') as _file:
-            _file.write(bytes)
-
-        logger.debug('moving tempfile %s to %s...' % (temp_abspath, file_abspath))
-        move(temp_abspath, file_abspath)
-
-        return path
+        janitor = self.janitor
+        if janitor is not None:
+            janitor.record(file_abspath, len(bytes))
+        return self.store(file_abspath, bytes)
 
     def put_crypto(self, path):
         if not self.context.config.STORES_CRYPTO_KEY_FOR_EACH_IMAGE:
             return
 
-        file_abspath = self.path_on_filesystem(path)
-        file_dir_abspath = dirname(file_abspath)
-
-        self.ensure_dir(file_dir_abspath)
-
         if not self.context.server.security_key:
             raise RuntimeError("STORES_CRYPTO_KEY_FOR_EACH_IMAGE can't be True if no SECURITY_KEY specified")
 
+        file_abspath = self.path_on_filesystem(path)
         crypto_path = '%s.txt' % splitext(file_abspath)[0]
-        temp_abspath = "%s.%s" % (crypto_path, str(uuid4()).replace('-', ''))
-        with open(temp_abspath, 'w') as _file:
-            _file.write(self.context.server.security_key)
-
-        move(temp_abspath, crypto_path)
-        logger.debug('Stored crypto at %s (security key: %s)' % (crypto_path, self.context.server.security_key))
+        logger.debug('Storing crypto at %s (security key: %s)' % (crypto_path, self.context.server.security_key))
 
-        return file_abspath
+        return self.store(crypto_path, self.context.server.security_key)
 
     def put_detector_data(self, path, data):
         file_abspath = self.path_on_filesystem(path)
-
         path = '%s.detectors.txt' % splitext(file_abspath)[0]
-        temp_abspath = "%s.%s" % (path, str(uuid4()).replace('-', ''))
 
-        file_dir_abspath = dirname(file_abspath)
-        self.ensure_dir(file_dir_abspath)
+        return self.store(path, dumps(data))
 
-        with open(temp_abspath, 'w') as _file:
-            _file.write(dumps(data))
+    def put_validators(self, path, validators):
+        file_abspath = self.path_on_filesystem(path)
+        path = '%s.validators.txt' % splitext(file_abspath)[0]
+
+        return self.store(path, dumps(validators))
 
-        move(temp_abspath, path)
+    def put_loader_error(self, path, error, expiration):
+        file_abspath = self.path_on_filesystem(path)
+        path = '%s.error.txt' % splitext(file_abspath)[0]
 
-        return file_abspath
+        return self.store(path, dumps({'error': error, 'expires': time.time() + expiration}))
+
+    def refresh(self, path):
+        file_abspath = self.path_on_filesystem(path)
+        self.touch(file_abspath)
+        return self.context.io_executor.run(self.refresh_file, file_abspath)
+
+    def refresh_file(self, file_abspath):
+        try:
+            os.utime(file_abspath, None)
+        except OSError as err:
+            # Deleted while the origin was asked whether it changed
+            if err.errno != errno.ENOENT:
+                raise
+            return False
+        return True
 
     @return_future
     def get(self, path, callback):
         abs_path = self.path_on_filesystem(path)
+        self.touch(abs_path)
 
-        def file_exists(resource_available):
-            if not resource_available:
-                callback(None)
-            else:
-                with open(self.path_on_filesystem(path), 'r') as f:
-                    callback(f.read())
+        def read():
+            if not self.is_fresh(abs_path):
+                return None
+            with open(abs_path, 'r') as f:
+                return f.read()
 
-        self.exists(None, file_exists, path_on_filesystem=abs_path)
+        self.context.io_executor.submit(callback, read)
 
     @return_future
     def get_crypto(self, path, callback):
         file_abspath = self.path_on_filesystem(path)
         crypto_file = "%s.txt" % (splitext(file_abspath)[0])
 
-        if not exists(crypto_file):
-            callback(None)
-        else:
-            with open(crypto_file, 'r') as crypto_f:
-                callback(crypto_f.read())
+        self.context.io_executor.submit(callback, self.read_file, crypto_file)
 
     @return_future
     def get_detector_data(self, path, callback):
         file_abspath = self.path_on_filesystem(path)
         path = '%s.detectors.txt' % splitext(file_abspath)[0]
 
-        def file_exists(resource_available):
-            if not resource_available:
-                callback(None)
-            else:
-                callback(loads(open(path, 'r').read()))
-        self.exists(None, file_exists, path_on_filesystem=path)
+        def read():
+            if not self.is_fresh(path):
+                return None
+            with open(path, 'r') as f:
+                return loads(f.read())
+
+        self.context.io_executor.submit(callback, read)
+
+    @return_future
+    def get_validators(self, path, callback):
+        file_abspath = self.path_on_filesystem(path)
+        path = '%s.validators.txt' % splitext(file_abspath)[0]
+
+        def read():
+            if not exists(file_abspath):
+                return None
+            data = self.read_file(path)
+            return None if data is None else loads(data)
+
+        self.context.io_executor.submit(callback, read)
+
+    @return_future
+    def get_loader_error(self, path, callback):
+        file_abspath = self.path_on_filesystem(path)
+        path = '%s.error.txt' % splitext(file_abspath)[0]
+
+        def read():
+            data = self.read_file(path)
+            if data is None:
+                return None
+            data = loads(data)
+            return (data['error'], data['expires']) if data['expires'] > time.time() else None
+
+        self.context.io_executor.submit(callback, read)
 
     def path_on_filesystem(self, path):
         digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
@@ -126,11 +169,49 @@ class Storage(storages.BaseStorage):
     def exists(self, path, callback, path_on_filesystem=None):
         if path_on_filesystem is None:
             path_on_filesystem = self.path_on_filesystem(path)
-        callback(os.path.exists(path_on_filesystem) and not self.__is_expired(path_on_filesystem))
+        self.context.io_executor.submit(callback, self.is_fresh, path_on_filesystem)
 
     def remove(self, path):
         n_path = self.path_on_filesystem(path)
-        return os.remove(n_path)
+        janitor = self.janitor
+        if janitor is not None:
+            janitor.forget(n_path)
+        return self.context.io_executor.run(os.remove, n_path)
+
+    def store(self, file_abspath, contents):
+        return self.context.io_executor.run(self.write_file, file_abspath, contents)
+
+    def touch(self, file_abspath):
+        janitor = self.janitor
+        if janitor is not None:
+            janitor.touch(file_abspath)
+
+    def write_file(self, file_abspath, contents):
+        '''
+        Writes contents to file_abspath through a temporary file, so that
+        readers never see a partial file. Runs on the I/O executor.
+        '''
+        temp_abspath = "%s.%s" % (file_abspath, str(uuid4()).replace('-', ''))
+        self.ensure_dir(dirname(file_abspath))
+
+        with open(temp_abspath, 'w') as _file:
+            _file.write(contents)
+
+        move(temp_abspath, file_abspath)
+
+    def read_file(self, file_abspath):
+        '''
+        Returns the contents of file_abspath or None if it does not exist.
+        Runs on the I/O executor.
+        '''
+        if not exists(file_abspath):
+            return None
+
+        with open(file_abspath, 'r') as _file:
+            return _file.read()
+
+    def is_fresh(self, file_abspath):
+        return exists(file_abspath) and not self.__is_expired(file_abspath)
 
     def __is_expired(self, path):
         if self.context.config.STORAGE_EXPIRATION_SECONDS is None:
@@ -0,0 +1,304 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import bisect
+import hashlib
+import time
+import weakref
+from datetime import timedelta
+from json import dumps, loads
+
+import tornado.ioloop
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from thumbor.connection_pool import ConnectionPool
+from thumbor.storages import BaseStorage
+from thumbor.utils import logger
+
+# memcached takes expiration times over 30 days as unix timestamps
+MAX_RELATIVE_EXPIRATION = 30 * 24 * 60 * 60
+
+# Flags of the items holding the number of chunks of bigger values
+CHUNKED = 1
+
+
+class MemcacheError(Exception):
+    pass
+
+
+class MemcacheClient(object):
+    '''
+    Non-blocking client of the memcached text protocol. Keys are spread
+    across servers by a consistent hash ring, so that adding or removing a
+    server only moves the keys of that server.
+    '''
+
+    POINTS_PER_SERVER = 160
+
+    def __init__(self, servers, max_connections=4, timeout=1):
+        self.timeout = timeout
+        self.pools = dict((server, ConnectionPool(server, max_connections, 11211)) for server in servers)
+
+        self.ring = []
+        for server in servers:
+            for i in range(self.POINTS_PER_SERVER):
+                self.ring.append((self.hash('%s-%d' % (server, i)), server))
+        self.ring.sort()
+        self.points = [point for point, server in self.ring]
+
+    @staticmethod
+    def hash(key):
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def server_for(self, key):
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+    @gen.coroutine
+    def get_multi(self, keys):
+        '''
+        Returns a dict of the (flags, value) of the keys found, looking for
+        the keys of each server in one request, to all servers at once.
+        Servers that fail are logged and considered empty.
+        '''
+        keys_by_server = {}
+        for key in keys:
+            keys_by_server.setdefault(self.server_for(key), []).append(key)
+
+        results = yield [self._get(server, server_keys) for server, server_keys in keys_by_server.items()]
+
+        items = {}
+        for result in results:
+            items.update(result)
+        raise gen.Return(items)
+
+    @gen.coroutine
+    def set(self, key, value, expiration=0, flags=0):
+        if expiration > MAX_RELATIVE_EXPIRATION:
+            expiration = int(time.time() + expiration)
+
+        command = b'set ' + key + b' %d %d %d\r\n' % (flags, expiration, len(value)) + value + b'\r\n'
+        reply = yield self._call(self.server_for(key), command)
+        raise gen.Return(reply == b'STORED')
+
+    @gen.coroutine
+    def delete(self, key):
+        reply = yield self._call(self.server_for(key), b'delete ' + key + b'\r\n')
+        raise gen.Return(reply == b'DELETED')
+
+    @gen.coroutine
+    def _get(self, server, keys):
+        try:
+            items = yield self._run(server, lambda stream: self._read_values(stream, b'get ' + b' '.join(keys) + b'\r\n'))
+        except Exception as e:
+            logger.warn('[MEMCACHE_STORAGE] unable to get %d keys from %s: %s', len(keys), server, e)
+            items = {}
+        raise gen.Return(items)
+
+    @gen.coroutine
+    def _call(self, server, command):
+        try:
+            reply = yield self._run(server, lambda stream: self._read_reply(stream, command))
+        except Exception as e:
+            logger.warn('[MEMCACHE_STORAGE] unable to run %s on %s: %s', command.split(b' ', 1)[0], server, e)
+            reply = None
+        raise gen.Return(reply)
+
+    @gen.coroutine
+    def _run(self, server, operation):
+        pool = self.pools[server]
+        stream = yield pool.acquire(self.timeout)
+
+        reuse = False
+        try:
+            result = yield gen.with_timeout(
+                timedelta(seconds=self.timeout),
+                operation(stream),
+                quiet_exceptions=(StreamClosedError, IOError)
+            )
+            reuse = True
+        finally:
+            pool.release(stream, reuse)
+
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def _read_reply(self, stream, command):
+        yield stream.write(command)
+        reply = yield stream.read_until(b'\r\n')
+        raise gen.Return(reply[:-2])
+
+    @gen.coroutine
+    def _read_values(self, stream, command):
+        yield stream.write(command)
+
+        items = {}
+        while True:
+            line = yield stream.read_until(b'\r\n')
+            if line == b'END\r\n':
+                break
+            if not line.startswith(b'VALUE '):
+                raise MemcacheError(line.strip())
+
+            key, flags, size = line.split()[1:4]
+            data = yield stream.read_bytes(int(size) + 2)
+            items[key] = (int(flags), data[:-2])
+
+        raise gen.Return(items)
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(config):
+    '''
+    Returns the memcached client of the current IOLoop, kept for the life
+    of the IOLoop so that connections are reused.
+    '''
+    key = (
+        tuple(config.MEMCACHE_STORAGE_SERVERS),
+        config.MEMCACHE_STORAGE_MAX_CONNECTIONS,
+        config.MEMCACHE_STORAGE_TIMEOUT,
+    )
+    clients = _clients.setdefault(tornado.ioloop.IOLoop.current(), {})
+    client = clients.get(key)
+    if client is None:
+        client = clients[key] = MemcacheClient(*key)
+    return client
+
+
+class Storage(BaseStorage):
+    '''
+    Stores the images, crypto keys and detector data in memcached. Images
+    bigger than MEMCACHE_STORAGE_ITEM_SIZE are split in several items. The
+    crypto key and detector data of an image are read along with it (or
+    with each other) in one request and kept for the rest of the request.
+    '''
+
+    def __init__(self, context):
+        BaseStorage.__init__(self, context)
+        self.metadata = {}
+
+    @property
+    def client(self):
+        return get_client(self.context.config)
+
+    @property
+    def expiration(self):
+        return self.context.config.STORAGE_EXPIRATION_SECONDS or 0
+
+    def key(self, kind, path):
+        return ('thumbor-%s-%s' % (kind, hashlib.sha1(path.encode('utf-8')).hexdigest())).encode('ascii')
+
+    @gen.coroutine
+    def put(self, path, bytes):
+        key = self.key('image', path)
+        item_size = self.context.config.MEMCACHE_STORAGE_ITEM_SIZE
+        if len(bytes) <= item_size:
+            yield self.client.set(key, bytes, self.expiration)
+            return
+
+        chunks = [bytes[i:i + item_size] for i in range(0, len(bytes), item_size)]
+        # The chunks go first, so that the image is never found incomplete
+        stored = yield [
+            self.client.set(b'%s-%d' % (key, index), chunk, self.expiration)
+            for index, chunk in enumerate(chunks)
+        ]
+        if all(stored):
+            yield self.client.set(key, str(len(chunks)).encode('ascii'), self.expiration, flags=CHUNKED)
+
+    @gen.coroutine
+    def put_crypto(self, path):
+        if not self.context.config.STORES_CRYPTO_KEY_FOR_EACH_IMAGE:
+            return
+
+        if not self.context.server.security_key:
+            raise RuntimeError("STORES_CRYPTO_KEY_FOR_EACH_IMAGE can't be True if no SECURITY_KEY specified")
+
+        if path in self.metadata:
+            self.metadata[path]['crypto'] = self.context.server.security_key
+        yield self.client.set(self.key('crypto', path), self.context.server.security_key.encode('utf-8'), self.expiration)
+
+    @gen.coroutine
+    def put_detector_data(self, path, data):
+        if path in self.metadata:
+            self.metadata[path]['detector'] = data
+        yield self.client.set(self.key('detector', path), dumps(data).encode('utf-8'), self.expiration)
+
+    @gen.coroutine
+    def get(self, path):
+        key = self.key('image', path)
+        items = yield self.get_with_metadata(path, key)
+        if key not in items:
+            raise gen.Return(None)
+
+        flags, value = items[key]
+        if flags != CHUNKED:
+            raise gen.Return(value)
+
+        chunk_keys = [b'%s-%d' % (key, index) for index in range(int(value))]
+        chunks = yield self.client.get_multi(chunk_keys)
+        if len(chunks) != len(chunk_keys):
+            raise gen.Return(None)
+
+        raise gen.Return(b''.join(chunks[chunk_key][1] for chunk_key in chunk_keys))
+
+    @gen.coroutine
+    def get_all(self, path):
+        image = yield self.get(path)
+        metadata = self.metadata[path]
+        raise gen.Return({'image': image, 'crypto': metadata['crypto'], 'detector': metadata['detector']})
+
+    @gen.coroutine
+    def get_crypto(self, path):
+        metadata = yield self.get_metadata(path)
+        raise gen.Return(metadata['crypto'])
+
+    @gen.coroutine
+    def get_detector_data(self, path):
+        metadata = yield self.get_metadata(path)
+        raise gen.Return(metadata['detector'])
+
+    @gen.coroutine
+    def exists(self, path):
+        key = self.key('image', path)
+        items = yield self.client.get_multi([key])
+        raise gen.Return(key in items)
+
+    @gen.coroutine
+    def remove(self, path):
+        # The chunks of a big image are left to expire
+        yield self.client.delete(self.key('image', path))
+        self.metadata.pop(path, None)
+
+    @gen.coroutine
+    def get_metadata(self, path):
+        if path not in self.metadata:
+            yield self.get_with_metadata(path)
+        raise gen.Return(self.metadata[path])
+
+    @gen.coroutine
+    def get_with_metadata(self, path, *keys):
+        '''
+        Gets keys along with the crypto key and the detector data of path in
+        one request and keeps them for get_crypto and get_detector_data.
+        '''
+        crypto_key = self.key('crypto', path)
+        detector_key = self.key('detector', path)
+
+        items = yield self.client.get_multi(list(keys) + [crypto_key, detector_key])
+
+        detector = items.get(detector_key)
+        self.metadata[path] = {
+            'crypto': items[crypto_key][1].decode('utf-8') if crypto_key in items else None,
+            'detector': loads(detector[1].decode('utf-8')) if detector is not None else None,
+        }
+        raise gen.Return(items)
@@ -62,6 +62,18 @@ class Storage(BaseStorage):
         self._init_crypto_storage()
         self.crypto_storage.put_crypto(path)
 
+    def put_validators(self, path, validators):
+        self._init_file_storage()
+        self.file_storage.put_validators(path, validators)
+
+    def put_loader_error(self, path, error, expiration):
+        self._init_file_storage()
+        self.file_storage.put_loader_error(path, error, expiration)
+
+    def refresh(self, path):
+        self._init_file_storage()
+        return self.file_storage.refresh(path)
+
     @gen.coroutine
     def get_crypto(self, path):
         self._init_crypto_storage()
@@ -74,6 +86,18 @@ class Storage(BaseStorage):
         result = yield gen.maybe_future(self.detector_storage.get_detector_data(path))
         raise gen.Return(result)
 
+    @gen.coroutine
+    def get_validators(self, path):
+        self._init_file_storage()
+        result = yield gen.maybe_future(self.file_storage.get_validators(path))
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def get_loader_error(self, path):
+        self._init_file_storage()
+        result = yield gen.maybe_future(self.file_storage.get_loader_error(path))
+        raise gen.Return(result)
+
     @gen.coroutine
     def get(self, path):
         self._init_file_storage()
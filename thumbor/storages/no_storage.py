@@ -23,6 +23,15 @@ class Storage(BaseStorage):
     def put_detector_data(self, path, data):
         return path
 
+    def put_validators(self, path, validators):
+        return path
+
+    def put_loader_error(self, path, error, expiration):
+        return path
+
+    def refresh(self, path):
+        pass
+
     @return_future
     def get_crypto(self, path, callback):
         callback(None)
@@ -31,6 +40,14 @@ class Storage(BaseStorage):
     def get_detector_data(self, path, callback):
         callback(None)
 
+    @return_future
+    def get_validators(self, path, callback):
+        callback(None)
+
+    @return_future
+    def get_loader_error(self, path, callback):
+        callback(None)
+
     @return_future
     def get(self, path, callback):
         callback(None)
@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+import errno
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from json import dumps, loads
+from os.path import dirname
+
+import tornado.ioloop
+from tornado.concurrent import return_future
+
+from thumbor.storages import BaseStorage
+from thumbor.utils import logger
+
+CRYPTO = 'crypto'
+DETECTOR = 'detector'
+
+
+class SQLiteStore(object):
+    '''
+    Small records (a value and the time it was written) keyed by (path, kind)
+    in one SQLite database in WAL mode. Writes are kept in memory and written
+    in one transaction once batch_size of them are pending or every few
+    seconds, see start. The cache_size most recently used records are kept
+    in memory as well.
+    '''
+
+    _instances = {}
+
+    @classmethod
+    def instance(cls, db_path, cache_size=10000, batch_size=100):
+        key = (db_path, cache_size, batch_size)
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = cls._instances[key] = cls(*key)
+        return instance
+
+    @classmethod
+    def for_context(cls, context):
+        config = context.config
+        store = cls.instance(config.SQLITE_STORAGE_PATH, config.SQLITE_STORAGE_CACHE_SIZE, config.SQLITE_STORAGE_BATCH_SIZE)
+        store.start(context.io_executor, config.SQLITE_STORAGE_FLUSH_INTERVAL)
+        return store
+
+    def __init__(self, db_path, cache_size=10000, batch_size=100):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+
+        # (path, kind) -> (value, updated_at), value being None for deletions
+        self.pending = OrderedDict()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        self.executor = None
+        self.interval = None
+        self.flushing = False
+        self.periodic_callback = None
+
+    def start(self, executor, interval):
+        '''
+        Flushes the pending writes on executor every interval seconds, on the
+        current IOLoop. With an interval of 0 each write is flushed right away.
+        '''
+        if self.executor is not None:
+            return
+
+        self.executor = executor
+        self.interval = interval
+        if interval:
+            self.periodic_callback = tornado.ioloop.PeriodicCallback(self.flush_behind, interval * 1000)
+            self.periodic_callback.start()
+
+    @property
+    def connection(self):
+        '''
+        The connection of the current thread: WAL mode lets readers of other
+        threads go on while a batch is written.
+        '''
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            self.ensure_dir(dirname(self.db_path))
+            connection = sqlite3.connect(self.db_path, timeout=10)
+            connection.text_factory = str
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS records ('
+                'path TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, '
+                'PRIMARY KEY (path, kind)) WITHOUT ROWID'
+            )
+            self.local.connection = connection
+        return connection
+
+    def put(self, path, kind, value):
+        self._write((path, kind), (value, time.time()))
+
+    def remove(self, path, kind):
+        self._write((path, kind), (None, time.time()))
+
+    def get(self, path, kind, callback):
+        '''
+        Calls callback with the (value, updated_at) record of path and kind
+        or None, right away if it is in memory or once read on the executor.
+        '''
+        key = (path, kind)
+        with self.lock:
+            record = self.pending.get(key)
+            if record is None:
+                record = self.cache.pop(key, None)
+                if record is not None:
+                    self.cache[key] = record
+
+        if record is not None:
+            callback(record if record[0] is not None else None)
+            return
+
+        self.executor.submit(callback, self.read, key)
+
+    def read(self, key):
+        row = self.connection.execute(
+            'SELECT value, updated_at FROM records WHERE path = ? AND kind = ?', key
+        ).fetchone()
+        if row is None:
+            return None
+
+        record = tuple(row)
+        with self.lock:
+            if key not in self.pending:
+                self._cache(key, record)
+        return record
+
+    def flush_behind(self):
+        '''
+        Flushes the pending writes on the executor, unless a flush is running.
+        '''
+        if self.flushing or not self.pending:
+            return
+        self.flushing = True
+
+        def done(future):
+            self.flushing = False
+            if future.exception() is not None:
+                logger.error('[SQLiteStore] unable to write to %s: %s', self.db_path, future.exception())
+
+        try:
+            future = self.executor.run(self.flush)
+        except Exception as e:
+            # Without a thread pool the flush runs right away
+            self.flushing = False
+            logger.error('[SQLiteStore] unable to write to %s: %s', self.db_path, e)
+            return
+
+        tornado.ioloop.IOLoop.current().add_future(future, done)
+
+    def flush(self):
+        '''
+        Writes the pending records in one transaction. Returns their number.
+        '''
+        with self.lock:
+            records = list(self.pending.items())
+        if not records:
+            return 0
+
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO records (path, kind, value, updated_at) VALUES (?, ?, ?, ?)',
+                [key + record for key, record in records if record[0] is not None]
+            )
+            connection.executemany(
+                'DELETE FROM records WHERE path = ? AND kind = ?',
+                [key for key, record in records if record[0] is None]
+            )
+
+        # Records are read from pending until they are written
+        with self.lock:
+            for key, record in records:
+                if self.pending.get(key) is record:
+                    del self.pending[key]
+        return len(records)
+
+    def _write(self, key, record):
+        with self.lock:
+            self.pending.pop(key, None)
+            self.pending[key] = record
+            self.cache.pop(key, None)
+            if record[0] is not None:
+                self._cache(key, record)
+            full = len(self.pending) >= self.batch_size
+
+        if full or not self.interval:
+            self.flush_behind()
+
+    def _cache(self, key, record):
+        if not self.cache_size:
+            return
+        self.cache.pop(key, None)
+        self.cache[key] = record
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def ensure_dir(path):
+        if not path:
+            return
+        try:
+            os.makedirs(path)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+
+
+class Storage(BaseStorage):
+    '''
+    Stores the crypto keys and detector data of the images in a SQLite
+    database instead of one file each. It does not store images: it is meant
+    to be used as MIXED_STORAGE_CRYPTO_STORAGE and
+    MIXED_STORAGE_DETECTOR_STORAGE.
+    '''
+
+    @property
+    def store(self):
+        return SQLiteStore.for_context(self.context)
+
+    def put_crypto(self, path):
+        if not self.context.config.STORES_CRYPTO_KEY_FOR_EACH_IMAGE:
+            return
+
+        if not self.context.server.security_key:
+            raise RuntimeError("STORES_CRYPTO_KEY_FOR_EACH_IMAGE can't be True if no SECURITY_KEY specified")
+
+        self.store.put(path, CRYPTO, self.context.server.security_key)
+
+    def put_detector_data(self, path, data):
+        self.store.put(path, DETECTOR, dumps(data))
+
+    @return_future
+    def get_crypto(self, path, callback):
+        self.store.get(path, CRYPTO, lambda record: callback(None if record is None else record[0]))
+
+    @return_future
+    def get_detector_data(self, path, callback):
+        def done(record):
+            if record is None or self.is_expired(record[1]):
+                callback(None)
+            else:
+                callback(loads(record[0]))
+
+        self.store.get(path, DETECTOR, done)
+
+    def remove(self, path):
+        self.store.remove(path, CRYPTO)
+        self.store.remove(path, DETECTOR)
+
+    def is_expired(self, updated_at):
+        expiration = self.context.config.STORAGE_EXPIRATION_SECONDS
+        return bool(expiration) and time.time() - updated_at > expiration
@@ -134,7 +134,8 @@ class Transformer(object):
     @gen.coroutine
     def smart_detect(self):
         is_gifsicle = (self.context.request.engine.extension == '.gif' and self.context.config.USE_GIFSICLE_ENGINE)
-        if (not (self.context.modules.detectors and self.context.request.smart)) or is_gifsicle:
+        should_detect = self.context.modules.detectors and self.context.request.smart
+        if not should_detect or is_gifsicle or self.context.request.is_cancelled():
             self.do_image_operations()
             return
 
@@ -172,7 +173,11 @@ class Transformer(object):
 
     @gen.coroutine
     def do_smart_detection(self):
-        focal_points = yield gen.maybe_future(self.context.modules.storage.get_detector_data(self.smart_storage_key))
+        stored = self.context.request.stored.get(self.smart_storage_key)
+        if stored is not None:
+            focal_points = stored['detector']
+        else:
+            focal_points = yield gen.maybe_future(self.context.modules.storage.get_detector_data(self.smart_storage_key))
         if focal_points is not None:
             self.after_smart_detect(focal_points, points_from_storage=True)
         else:
@@ -215,20 +220,29 @@ class Transformer(object):
                 self.resize()
             self.flip()
 
+        self.engine.flush_operations()
+
     def do_image_operations(self):
         """
         If ENGINE_THREADPOOL_SIZE > 0, this will schedule the image operations
         into a threadpool.  If not, it just executes them synchronously, and
         calls self.done_callback when it's finished.
 
-        The actual work happens in self.img_operation_worker
+        The actual work happens in self.img_operation_worker. It is skipped if
+        the request was cancelled.
         """
+        if self.context.request.is_cancelled():
+            self.done_callback()
+            return
+
         def inner(future):
             self.done_callback()
 
         self.context.thread_pool.queue(
             operation=self.img_operation_worker,
-            callback=inner
+            callback=inner,
+            cost=self.context.request.cost,
+            is_cancelled=self.context.request.is_cancelled
         )
 
     def extract_cover(self):
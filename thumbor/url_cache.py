@@ -0,0 +1,48 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# thumbor imaging service
+# https://github.com/thumbor/thumbor/wiki
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2011 globo.com thumbor@googlegroups.com
+
+from thumbor.lru_cache import LRUCache
+
+
+class ParsedUrl(object):
+    """
+    An imaging url that was parsed and found valid: its request parameters,
+    as parsed, and the plan of its filters (see FiltersFactory.compile).
+    """
+
+    def __init__(self, security_key, request, filters_plan):
+        self.security_key = security_key
+        self.request = request
+        self.filters_plan = filters_plan
+
+
+class ParsedUrlCache(LRUCache):
+    """
+    In-process cache of the valid imaging urls keyed on the path of the
+    request (along with the image it was found to point to, see
+    MAX_ID_LENGTH), so that the urls requested again are not validated and
+    parsed again. When it holds max_entries urls, the least recently used
+    ones are evicted (see LRUCache). Urls cached with another security key
+    than the current one are not found, so that they are validated again
+    with the new key.
+    """
+
+    def get(self, key, security_key):
+        """
+        Returns the ParsedUrl of key, validated with security_key, or None.
+        """
+        entry = super(ParsedUrlCache, self).get(key)
+        if entry is not None and entry.security_key != security_key:
+            self.remove(key)
+            return None
+        return entry
+
+    def put(self, key, security_key, request, filters_plan):
+        super(ParsedUrlCache, self).put(key, ParsedUrl(security_key, request, filters_plan))